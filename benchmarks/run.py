@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Created on 2026-10-18
+@author: Łukasz Mierzwa
+@contact: <l.mierzwa@gmail.com>
+@license: GPLv3: http://www.gnu.org/licenses/gpl-3.0.txt
+
+Benchmark suite. By default benchmarks are run against in process
+MemoryDirectory loaded with test schema, use --server to run them against
+real LDAP server (for example slapd started by test/runtest.sh). All objects
+are created under ou=benchmark subtree that is removed after run.
+
+Results are written as JSON, so they can be compared between releases::
+
+    python benchmarks/run.py --output before.json
+    python benchmarks/run.py --server ldap://localhost:1389 --only search
+'''
+
+
+import os
+import sys
+import time
+import json
+import platform
+import datetime
+import optparse
+from timeit import default_timer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from pumpkin import fields
+from pumpkin.base import Model
+from pumpkin.models import PosixUser
+from pumpkin.objectlist import ObjectList
+from pumpkin.directory import Directory
+from pumpkin.memory import MemoryStore, MemoryDirectory
+from pumpkin.resource import LDAPResource
+from pumpkin.serialize import pickle_object
+from pumpkin import exceptions
+
+
+SCHEMAS = ['core', 'cosine', 'inetorgperson', 'nis', 'dhcp']
+
+
+class FieldsModel(Model):
+    """Model with one field of every type, extensibleObject allows any
+    attribute
+    """
+    _object_class_ = ['extensibleObject']
+    _rdn_ = 'string'
+    string_list = fields.StringListField('mail')
+    string = fields.StringField('cn')
+    integer_list = fields.IntegerListField('mobile')
+    integer = fields.IntegerField('uidNumber')
+    boolean = fields.BooleanField('initials')
+    binary = fields.BinaryField('userCertificate', binary=True)
+    datetime_list = fields.DatetimeListField('pager')
+    datetime = fields.DatetimeField('gidNumber')
+    dict = fields.DictField('carLicense')
+    generalized_time = fields.GeneralizedTimeField('description')
+
+
+# field name -> (field class, LDAP value, local value)
+FIELD_VALUES = {
+    'string_list': (fields.StringListField, ['a', 'b', 'c'],
+        [u'a', u'b', u'c']),
+    'string': (fields.StringField, ['value'], u'value'),
+    'integer_list': (fields.IntegerListField, ['1', '2', '3'], [1, 2, 3]),
+    'integer': (fields.IntegerField, ['1'], 1),
+    'boolean': (fields.BooleanField, ['True'], True),
+    'binary': (fields.BinaryField, ['\x00\x01' * 512], '\x00\x01' * 512),
+    'datetime_list': (fields.DatetimeListField, ['1262304000', '1293840000'],
+        [datetime.datetime(2010, 1, 1), datetime.datetime(2011, 1, 1)]),
+    'datetime': (fields.DatetimeField, ['1262304000'],
+        datetime.datetime(2010, 1, 1)),
+    'dict': (fields.DictField, ['a|1', 'b|2'], {u'a': u'1', u'b': u'2'}),
+    'generalized_time': (fields.GeneralizedTimeField,
+        ['20100101120000.5Z'], datetime.datetime(2010, 1, 1, 12)),
+}
+
+
+def user_attrs(num):
+    """Returns attributes of PosixUser object
+    """
+    return {
+        'objectClass': ['top', 'posixAccount', 'inetOrgPerson'],
+        'uid': ['user%d' % num],
+        'uidNumber': [str(10000 + num)],
+        'gidNumber': ['100'],
+        'cn': ['User %d' % num],
+        'sn': ['User'],
+        'homeDirectory': ['/home/user%d' % num],
+        'mail': ['user%d@example.com' % num],
+    }
+
+
+class Runner(object):
+    """Runs benchmarks and collects results
+    """
+
+    def __init__(self, directory, basedn, repeat=3, verbose=True):
+        self.directory = directory
+        self.basedn = basedn
+        self.repeat = repeat
+        self.verbose = verbose
+        self.results = []
+
+    def measure(self, name, size, ops, func, setup=None, unit='ops'):
+        """Run func repeat times and record best and mean time, setup is
+        called before every run and its time is not measured, func gets setup
+        return value as argument
+        """
+        timings = []
+        for cnt in range(self.repeat):
+            arg = None
+            if setup is not None:
+                arg = setup()
+            start = default_timer()
+            func(arg)
+            timings.append(default_timer() - start)
+        best = min(timings)
+        result = {
+            'name': name,
+            'size': size,
+            'ops': ops,
+            'unit': unit,
+            'best': best,
+            'mean': sum(timings) / len(timings),
+            'ops_per_sec': ops / max(best, 1e-9),
+            'latency_ms': best * 1000.0 / max(ops, 1),
+        }
+        self.results.append(result)
+        if self.verbose:
+            sys.stderr.write('%-40s %8s %12.1f %s/s %10.4f ms\n' % (
+                name, size, result['ops_per_sec'], unit,
+                result['latency_ms']))
+        return result
+
+    def container(self, name):
+        """Create empty organizationalUnit under benchmark subtree
+        """
+        dn = 'ou=%s,%s' % (name, self.basedn)
+        try:
+            self.directory.delete(dn, recursive=True)
+        except exceptions.ObjectNotFound:
+            pass
+        self.directory.add_object(dn, {'objectClass': ['organizationalUnit'],
+            'ou': [name]})
+        return dn
+
+    def populate(self, parent, count):
+        """Add count PosixUser objects under parent
+        """
+        batch = self.directory.batch()
+        for num in range(count):
+            batch.add('uid=user%d,%s' % (num, parent), user_attrs(num))
+        batch.check()
+
+
+def bench_search(runner, sizes):
+    """Directory.search() materializing PosixUser instances
+    """
+    for size in sizes:
+        parent = runner.container('search%d' % size)
+        runner.populate(parent, size)
+        runner.measure('search.PosixUser', size, size,
+            lambda arg: runner.directory.search(PosixUser, basedn=parent),
+            unit='entries')
+        runner.measure('search.PosixUser.paged', size, size,
+            lambda arg: runner.directory.search(PosixUser, basedn=parent,
+            page_size=500), unit='entries')
+        runner.directory.delete(parent, recursive=True)
+
+
+def bench_fields(runner, iterations):
+    """fget and fset cost for every field class
+    """
+    for (name, (cls, raw, value)) in sorted(FIELD_VALUES.items()):
+        obj = FieldsModel(runner.directory, attrs={
+            FieldsModel._get_fields()[name].attr: raw})
+
+        def fget(arg):
+            for cnt in xrange(iterations):
+                getattr(obj, name)
+
+        def fset(arg):
+            for cnt in xrange(iterations):
+                setattr(obj, name, value)
+
+        runner.measure('fields.%s.fget' % cls.__name__, 1, iterations, fget)
+        runner.measure('fields.%s.fset' % cls.__name__, 1, iterations, fset)
+
+
+def bench_save(runner, sizes):
+    """save() latency for new and existing objects
+    """
+    for size in sizes:
+        parent = runner.container('save%d' % size)
+        state = {'run': 0}
+
+        def setup_new():
+            state['run'] += 1
+            users = []
+            for num in range(size):
+                user = PosixUser(runner.directory)
+                user.set_parent(parent)
+                user.login = u'user%d_%d' % (state['run'], num)
+                user.uid = 10000 + num
+                user.gid = 100
+                user.fullname = u'User %d' % num
+                user.surname = u'User'
+                user.home = u'/home/user%d' % num
+                users.append(user)
+            return users
+
+        def save(users):
+            for user in users:
+                user.save()
+
+        runner.measure('save.new', size, size, save, setup=setup_new)
+
+        def setup_existing():
+            state['run'] += 1
+            users = runner.directory.search(PosixUser, basedn=parent,
+                recursive=False)[:size]
+            for user in users:
+                user.fullname = u'Modified %d' % state['run']
+                user.mail = [u'%s@example.com' % user.login]
+            return users
+
+        runner.measure('save.existing', size, size, save,
+            setup=setup_existing)
+        runner.directory.delete(parent, recursive=True)
+
+
+def bench_tree(runner, sizes):
+    """Recursive copy and delete of subtree
+    """
+    for size in sizes:
+        parent = runner.container('tree%d' % size)
+        source = 'ou=source,%s' % parent
+        runner.directory.add_object(source, {
+            'objectClass': ['organizationalUnit'], 'ou': ['source']})
+        runner.populate(source, size)
+        state = {'run': 0}
+
+        def setup_copy():
+            state['run'] += 1
+            return 'ou=copy%d,%s' % (state['run'], parent)
+
+        def copy(target):
+            runner.directory.copy(source, target, recursive=True)
+
+        runner.measure('copy.recursive', size, size + 1, copy,
+            setup=setup_copy, unit='entries')
+
+        def setup_delete():
+            state['run'] += 1
+            target = 'ou=copy%d,%s' % (state['run'], parent)
+            runner.directory.copy(source, target, recursive=True)
+            return target
+
+        def delete(target):
+            runner.directory.delete(target, recursive=True)
+
+        runner.measure('delete.recursive', size, size + 1, delete,
+            setup=setup_delete, unit='entries')
+        runner.directory.delete(parent, recursive=True)
+
+
+def bench_objectlist(runner, sizes):
+    """ObjectList operations, objects are created without LDAP lookups
+    """
+    for size in sizes:
+        def build(arg):
+            ret = ObjectList()
+            for num in xrange(size):
+                attrs = user_attrs(num)
+                if num % 2:
+                    del attrs['mail']
+                ret.append(PosixUser(runner.directory,
+                    dn='uid=user%d,%s' % (num, runner.basedn), attrs=attrs))
+            return ret
+
+        runner.measure('objectlist.build', size, size, build)
+        objects = build(None)
+        last = objects[-1].dn
+        runner.measure('objectlist.with_attr', size, size,
+            lambda arg: objects.with_attr('mail'))
+        runner.measure('objectlist.with_attrs', size, size,
+            lambda arg: objects.with_attrs(['mail', 'fullname']))
+        runner.measure('objectlist.by_dn', size, size,
+            lambda arg: objects.by_dn(last))
+        runner.measure('objectlist.pickle', size, size,
+            lambda arg: [pickle_object(obj) for obj in objects])
+
+
+BENCHMARKS = {
+    'search': lambda runner, opts: bench_search(runner, opts.entries),
+    'fields': lambda runner, opts: bench_fields(runner, opts.iterations),
+    'save': lambda runner, opts: bench_save(runner, opts.entries),
+    'tree': lambda runner, opts: bench_tree(runner, opts.entries),
+    'objectlist': lambda runner, opts: bench_objectlist(runner, opts.sizes),
+}
+
+
+def connect(opts):
+    """Returns connected directory
+    """
+    res = LDAPResource()
+    res.basedn = opts.basedn
+    if opts.server:
+        res.server = opts.server
+        res.login = opts.login
+        res.password = opts.password
+        directory = Directory()
+    else:
+        path = os.path.join(ROOT, 'test', 'openldap')
+        store = MemoryStore()
+        store.load_schema(*[os.path.join(path, 'schema', '%s.schema' % name)
+            for name in SCHEMAS])
+        store.add(opts.basedn, [('objectClass', ['top', 'dcObject',
+            'organization']), ('dc', [opts.basedn.split(',')[0][3:]]),
+            ('o', ['benchmark'])])
+        res.server = 'memory://'
+        directory = MemoryDirectory(store)
+    directory.connect(res)
+    return directory
+
+
+def sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--server', help='LDAP server uri, in process memory '
+        'backend is used if not set')
+    parser.add_option('--basedn', default='dc=company,dc=com')
+    parser.add_option('--login', default='cn=Manager,dc=company,dc=com')
+    parser.add_option('--password', default='dupadupa')
+    parser.add_option('--only', action='append', default=[],
+        help='run only given benchmark, can be used many times, available: '
+        '%s' % ', '.join(sorted(BENCHMARKS.keys())))
+    parser.add_option('--entries', default='100,1000',
+        help='comma separated number of LDAP entries for search, save and '
+        'tree benchmarks [%default]')
+    parser.add_option('--sizes', default='1000,10000,100000',
+        help='comma separated ObjectList sizes [%default]')
+    parser.add_option('--iterations', type='int', default=10000,
+        help='number of field reads and writes [%default]')
+    parser.add_option('--repeat', type='int', default=3,
+        help='number of runs, best time is reported [%default]')
+    parser.add_option('--output', help='write JSON results to file, '
+        'default is stdout')
+    parser.add_option('--quiet', action='store_true', default=False)
+    (opts, args) = parser.parse_args()
+    opts.entries = sizes(opts.entries)
+    opts.sizes = sizes(opts.sizes)
+    for name in opts.only:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: %s' % name)
+
+    directory = connect(opts)
+    runner = Runner(directory, directory.get_basedn(), repeat=opts.repeat,
+        verbose=not opts.quiet)
+    runner.basedn = runner.container('benchmark')
+    try:
+        for name in sorted(BENCHMARKS.keys()):
+            if not opts.only or name in opts.only:
+                BENCHMARKS[name](runner, opts)
+    finally:
+        directory.delete(runner.basedn, recursive=True)
+        directory.disconnect()
+
+    report = json.dumps({
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': opts.server or 'memory',
+        'repeat': opts.repeat,
+        'results': runner.results,
+    }, indent=2, sort_keys=True)
+    if opts.output:
+        out = open(opts.output, 'w')
+        try:
+            out.write(report + '\n')
+        finally:
+            out.close()
+    else:
+        sys.stdout.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,8 @@ Created on 2009-05-24
 
 __all__ = [
     'directory',
+    'pool',
+    'batch',
     'resource',
     'base',
     'models',
@@ -15,10 +17,20 @@ __all__ = [
     'filters',
     'exceptions',
     'serialize',
+    'schemacache',
+    'retry',
+    'balancer',
+    'cache',
+    'sync',
+    'memory',
+    'stats',
+    'tracking',
     'contrib',
 ]
 
 import pumpkin.directory
+import pumpkin.pool
+import pumpkin.batch
 import pumpkin.resource
 import pumpkin.base
 import pumpkin.models
@@ -26,4 +38,12 @@ import pumpkin.fields
 import pumpkin.filters
 import pumpkin.exceptions
 import pumpkin.serialize
+import pumpkin.schemacache
+import pumpkin.retry
+import pumpkin.balancer
+import pumpkin.cache
+import pumpkin.sync
+import pumpkin.memory
+import pumpkin.stats
+import pumpkin.tracking
 import pumpkin.contrib
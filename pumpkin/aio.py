@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 2026-10-18
+@author: Łukasz Mierzwa
+@contact: <l.mierzwa@gmail.com>
+@license: GPLv3: http://www.gnu.org/licenses/gpl-3.0.txt
+
+asyncio front end for Directory. Requests are sent using asynchronous
+python-ldap calls and results are read from the event loop when LDAP
+connection socket becomes readable, so many operations can be in flight
+without using threads. Every method returns asyncio Future, on python 2
+coroutines are written using trollius From()::
+
+    from trollius import From
+
+    @asyncio.coroutine
+    def rename(adir):
+        users = yield From(adir.search(PosixUser,
+            search_filter=eq('uid', 'foo')))
+        users[0].name = u'Foo'
+        yield From(adir.save(users[0]))
+
+    loop.run_until_complete(rename(AsyncDirectory(directory)))
+
+With python 3 asyncio use "yield from" (or await) instead of "yield From()".
+
+Model instances returned by AsyncDirectory are bound to wrapped Directory
+instance, so lazy fields, hooks and other model methods are still running
+synchronous LDAP calls.
+
+This module requires asyncio (or trollius on python 2) so it's not imported
+by pumpkin package.
+'''
+
+
+import logging
+
+try:
+    import asyncio
+except ImportError:
+    # asyncio backport for python 2
+    import trollius as asyncio
+
+import ldap
+from ldap.dn import str2dn, dn2str
+
+from pumpkin.debug import PUMPKIN_LOGLEVEL
+from pumpkin.directory import ldap_exception_handler
+from pumpkin.objectlist import ObjectList
+from pumpkin.base import Model
+from pumpkin import exceptions
+
+
+logging.basicConfig(level=PUMPKIN_LOGLEVEL)
+log = logging.getLogger(__name__)
+
+
+@ldap_exception_handler
+def _call(func, *args):
+    """Run python-ldap call mapping LDAP errors to pumpkin exceptions
+    """
+    return func(*args)
+
+
+def _run_hook(obj, name):
+    """Run model hook if present, see pumpkin.base.run_hooks()
+    """
+    if getattr(obj, name, None) is not None:
+        log.debug("Running hook '%s' on '%s'" % (name, obj))
+        getattr(obj, name)()
+
+
+class _Request(object):
+    """Request waiting for result
+    """
+
+    def __init__(self, future, handler, invalidate=None):
+        self.future = future
+        # dn dropped from directory entry cache once request is done
+        self.invalidate = invalidate
+        # called with list of received entries once request is done, return
+        # value is set as future result
+        self.handler = handler
+        self.entries = []
+
+
+class AsyncDirectory(object):
+    """asyncio front end for Directory instance. Connection used by wrapped
+    directory is watched by event loop, on PooledDirectory one connection is
+    taken out of pool and kept until close() is called.
+    """
+
+    def __init__(self, directory, loop=None, poll_interval=0.05):
+        """
+        @param directory: connected Directory instance
+        @param loop: event loop, default loop is used if None
+        @param poll_interval: how often pending requests are polled, this is
+        needed because synchronous calls made on the same connection (lazy
+        fields, hooks) can read our results from socket
+        """
+        self.directory = directory
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self._poll_interval = poll_interval
+        # msgid -> _Request
+        self._pending = {}
+        # watched connection and it's socket descriptor
+        self._conn = None
+        self._fd = None
+        self._timer = None
+        self._entered = False
+
+    def _future(self):
+        """Create new future bound to our loop
+        """
+        if hasattr(self._loop, 'create_future'):
+            return self._loop.create_future()
+        return asyncio.Future(loop=self._loop)
+
+    def _done(self, value):
+        """Returns future with result already set
+        """
+        future = self._future()
+        future.set_result(value)
+        return future
+
+    def _watch(self):
+        """Make sure that current directory connection is watched by event
+        loop, requests sent using previous connection are failed
+        """
+        if not self._entered:
+            self.directory._enter()
+            self._entered = True
+        if not self.directory.isconnected():
+            self.directory._connect()
+        conn = self.directory._ldapconn
+        if conn is self._conn:
+            return conn
+        self._unwatch(exceptions.ServerDown("LDAP connection was replaced"))
+        self._conn = conn
+        self._fd = conn.get_option(ldap.OPT_DESC)
+        self._loop.add_reader(self._fd, self._poll)
+        return conn
+
+    def _unwatch(self, error):
+        """Stop watching connection and fail all pending requests with error
+        """
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+        self._conn = None
+        self._fd = None
+        pending = self._pending
+        self._pending = {}
+        for req in pending.values():
+            if not req.future.done():
+                req.future.set_exception(error)
+
+    def _send(self, handler, method, *args, **kwargs):
+        """Send asynchronous request using LDAPObject method, returns future
+        that will get handler return value as result. For write requests dn
+        of modified object should be passed as invalidate keyword argument.
+        """
+        future = self._future()
+        try:
+            conn = self._watch()
+            msgid = _call(getattr(conn, method), *args)
+        except Exception, e:
+            future.set_exception(e)
+            return future
+
+        self._pending[msgid] = _Request(future, handler,
+            invalidate=kwargs.get('invalidate'))
+        future.add_done_callback(lambda f: self._cancelled(conn, msgid, f))
+        self._schedule()
+        return future
+
+    def _cancelled(self, conn, msgid, future):
+        """Abandon request if it's future was cancelled
+        """
+        if future.cancelled() and msgid in self._pending:
+            del self._pending[msgid]
+            if conn is self._conn:
+                log.debug("Abandoning cancelled request %d" % msgid)
+                try:
+                    conn.abandon(msgid)
+                except ldap.LDAPError:
+                    pass
+
+    def _schedule(self):
+        """Poll pending requests after poll_interval
+        """
+        if self._pending and self._timer is None:
+            self._timer = self._loop.call_later(
+                self._poll_interval, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._poll()
+
+    def _poll(self):
+        """Read all available results without blocking
+        """
+        if not self._pending and self._conn is not None:
+            # nothing is pending but socket is readable, read it so event
+            # loop won't keep calling us, this also detects closed connection
+            try:
+                _call(self._conn.result3, ldap.RES_ANY, 0, 0)
+            except (exceptions.ServerDown, exceptions.ConnectionError), e:
+                log.error("LDAP connection lost: %s" % e)
+                self.directory._connected = False
+                self._unwatch(e)
+            except Exception, e:
+                log.debug("Unexpected LDAP result: %s" % e)
+            return
+
+        for msgid in list(self._pending.keys()):
+            req = self._pending.get(msgid)
+            while req is not None:
+                try:
+                    (rtype, data, rmsgid, ctrls) = _call(
+                        self._conn.result3, msgid, 0, 0)
+                except (exceptions.ServerDown, exceptions.ConnectionError), e:
+                    log.error("LDAP connection lost: %s" % e)
+                    self.directory._connected = False
+                    self._unwatch(e)
+                    return
+                except Exception, e:
+                    del self._pending[msgid]
+                    self._invalidate(req)
+                    if not req.future.done():
+                        req.future.set_exception(e)
+                    break
+
+                if rtype is None:
+                    # no result yet
+                    break
+                elif rtype == ldap.RES_SEARCH_ENTRY:
+                    req.entries.extend(data)
+                elif rtype == ldap.RES_SEARCH_REFERENCE:
+                    # search references are skipped
+                    pass
+                else:
+                    del self._pending[msgid]
+                    self._invalidate(req)
+                    if not req.future.done():
+                        try:
+                            req.future.set_result(req.handler(req.entries))
+                        except Exception, e:
+                            req.future.set_exception(e)
+                    break
+        self._schedule()
+
+    def _invalidate(self, req):
+        """Drop object modified by finished request from entry cache
+        """
+        if req.invalidate is not None:
+            self.directory._invalidate(req.invalidate)
+
+    def close(self):
+        """Stop watching connection, all pending requests are failed
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._unwatch(exceptions.ConnectionError("AsyncDirectory was closed"))
+        if self._entered:
+            self._entered = False
+            self.directory._leave()
+
+    def search(self, model, basedn=None, recursive=True, search_filter=None,
+        skip_basedn=False, lazy=False):
+        """Same as Directory.search(), returns future with ObjectList result.
+        Paged results are not used, so server size limits apply.
+        """
+        if model is None:
+            model = Model
+
+        (basedn, scope, final_filter) = self.directory._search_params(
+            model, basedn, recursive, search_filter)
+        basedn = self.directory._encode(basedn)
+
+        def handler(entries):
+            ret = ObjectList()
+            for (dn, attrs) in entries:
+                if skip_basedn and dn2str(str2dn(dn)).lower() == \
+                    dn2str(str2dn(basedn)).lower():
+                    continue
+                ret.append(model(self.directory, dn=dn, attrs=attrs))
+            return ret
+
+        return self._send(handler, 'search_ext', basedn, scope, final_filter,
+            model.ldap_attributes(lazy=lazy))
+
+    def get(self, *args, **kwargs):
+        """Same as Directory.get(), returns future with model instance or None
+        as result
+        """
+        future = self._future()
+
+        def done(search):
+            if future.cancelled():
+                return
+            if search.cancelled():
+                future.cancel()
+            elif search.exception() is not None:
+                future.set_exception(search.exception())
+            elif len(search.result()) > 1:
+                future.set_exception(Exception('Multiple objects found'))
+            elif len(search.result()) == 1:
+                future.set_result(search.result()[0])
+            else:
+                future.set_result(None)
+
+        self.search(*args, **kwargs).add_done_callback(done)
+        return future
+
+    def add_object(self, ldap_dn, attrs):
+        """Add new object to LDAP
+        """
+        return self._send(lambda entries: None, 'add_ext',
+            self.directory._encode(ldap_dn), attrs.items(),
+            invalidate=ldap_dn)
+
+    def modify_attrs(self, ldap_dn, replace=None, add=None, delete=None):
+        """Modify object attributes, see Directory.modify_attrs()
+        """
+        modlist = self.directory._modlist(
+            replace=replace, add=add, delete=delete)
+        if not modlist:
+            return self._done(None)
+        return self._send(lambda entries: None, 'modify_ext',
+            self.directory._encode(ldap_dn), modlist, invalidate=ldap_dn)
+
+    def save(self, obj):
+        """Save model instance, returns future with saved instance as result.
+        Save hooks are run synchronously and objects with changed dn are
+        renamed using synchronous Directory.rename() call.
+        """
+        try:
+            # pre save hook might set required fields, same as in Model.save()
+            _run_hook(obj, '_hook_pre_save')
+            obj._check_missing_fields()
+            if obj.isnew():
+                def handler(entries):
+                    obj._empty = False
+                    obj._clear_dirty()
+                    _run_hook(obj, '_hook_post_save')
+                    return obj
+                return self._send(handler, 'add_ext',
+                    self.directory._encode(obj.dn), obj._new_record().items(),
+                    invalidate=obj.dn)
+
+            obj._save_rename()
+            modifications = obj._save_modifications()
+        except Exception, e:
+            future = self._future()
+            future.set_exception(e)
+            return future
+
+        def handler(entries):
+            obj._after_save()
+            _run_hook(obj, '_hook_post_save')
+            return obj
+
+        if modifications is None:
+            try:
+                return self._done(handler([]))
+            except Exception, e:
+                future = self._future()
+                future.set_exception(e)
+                return future
+
+        (replace, add, delete) = modifications
+        future = self._future()
+
+        def done(modify):
+            if future.done():
+                return
+            if modify.cancelled():
+                future.cancel()
+                return
+            error = modify.exception()
+            if isinstance(error, (exceptions.NoSuchValue,
+                exceptions.ValueExists)) and (add or delete):
+                # values were changed by other client, merge our changes
+                # with current values, see Model._save_incremental()
+                log.debug("Incremental save of '%s' failed: %s, merging with "
+                    "current values" % (obj.dn, error))
+                try:
+                    self.directory.modify_attrs(obj.dn,
+                        replace=obj._merge_modifications(replace, add, delete))
+                    error = None
+                except Exception, e:
+                    error = e
+            if error is None:
+                try:
+                    future.set_result(handler([]))
+                except Exception, e:
+                    future.set_exception(e)
+            else:
+                future.set_exception(error)
+
+        modify = self._send(lambda entries: None, 'modify_ext',
+            self.directory._encode(obj.dn), self.directory._modlist(
+                replace=replace, add=add, delete=delete), invalidate=obj.dn)
+        modify.add_done_callback(done)
+
+        def cancelled(f):
+            if f.cancelled():
+                modify.cancel()
+
+        future.add_done_callback(cancelled)
+        return future
+
+    def delete(self, obj):
+        """Delete model instance or object with given dn, children objects
+        are not deleted, use Directory.delete() for recursive delete
+        """
+        if not isinstance(obj, Model):
+            return self._send(lambda entries: None, 'delete_ext',
+                self.directory._encode(obj), invalidate=obj)
+
+        if obj.isnew():
+            future = self._future()
+            future.set_exception(
+                exceptions.DeleteOnNew("Can't delete empty object"))
+            return future
+
+        try:
+            _run_hook(obj, '_hook_pre_delete')
+        except Exception, e:
+            future = self._future()
+            future.set_exception(e)
+            return future
+
+        def handler(entries):
+            obj._empty = True
+            obj._dn = None
+            _run_hook(obj, '_hook_post_delete')
+            return None
+
+        return self._send(handler, 'delete_ext',
+            self.directory._encode(obj.dn), invalidate=obj.dn)
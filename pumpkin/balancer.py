@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 2026-10-18
+@author: Łukasz Mierzwa
+@contact: <l.mierzwa@gmail.com>
+@license: GPLv3: http://www.gnu.org/licenses/gpl-3.0.txt
+
+Read load balancing across LDAP replicas. Balancer keeps number of
+outstanding requests and average response time for every replica, health
+is tracked using circuit breakers from pumpkin.retry shared with reconnect
+handler.
+'''
+
+
+import logging
+import threading
+
+from pumpkin.debug import PUMPKIN_LOGLEVEL
+from pumpkin import resource
+from pumpkin import retry
+
+
+logging.basicConfig(level=PUMPKIN_LOGLEVEL)
+log = logging.getLogger(__name__)
+
+
+class Balancer(object):
+    """Chooses replica used for read operation
+    """
+
+    def __init__(self, servers, strategy=resource.ROUND_ROBIN,
+        breaker_threshold=5, breaker_timeout=30, alpha=0.3, slow_factor=2.0):
+        """
+        @param servers: list of replica uris
+        @param strategy: ROUND_ROBIN or LEAST_OUTSTANDING
+        @param alpha: weight of last response time in moving average
+        @param slow_factor: replicas with average response time this many
+        times higher than fastest replica are only used if all faster
+        replicas failed (ROUND_ROBIN only)
+        """
+        if strategy not in [resource.ROUND_ROBIN, resource.LEAST_OUTSTANDING]:
+            raise ValueError, "Unknown read strategy"
+        self.servers = list(servers)
+        self.strategy = strategy
+        self.alpha = alpha
+        self.slow_factor = slow_factor
+        self._breaker_threshold = breaker_threshold
+        self._breaker_timeout = breaker_timeout
+        self._lock = threading.Lock()
+        self._next = 0
+        # server -> number of requests waiting for result
+        self._outstanding = dict([(server, 0) for server in self.servers])
+        # server -> exponentially weighted moving average of response time
+        self._latency = {}
+
+    def _breaker(self, server):
+        return retry.get_breaker(server, threshold=self._breaker_threshold,
+            reset_timeout=self._breaker_timeout)
+
+    def order(self):
+        """Returns list of servers in order they should be tried
+        """
+        self._lock.acquire()
+        try:
+            servers = list(self.servers)
+            if not servers:
+                return servers
+            if self.strategy == resource.ROUND_ROBIN:
+                start = self._next % len(servers)
+                self._next += 1
+                servers = servers[start:] + servers[:start]
+                if self._latency:
+                    limit = min(self._latency.values()) * self.slow_factor
+                    # stable sort, so round robin order is kept
+                    servers.sort(key=lambda server:
+                        self._latency.get(server, 0) > limit)
+            else:
+                servers.sort(key=lambda server: (self._outstanding[server],
+                    self._latency.get(server, 0)))
+            return servers
+        finally:
+            self._lock.release()
+
+    def allow(self, server):
+        """Check if server is healthy, see CircuitBreaker.allow()
+        """
+        return self._breaker(server).allow()
+
+    def begin(self, server):
+        """Record start of request sent to server
+        """
+        self._lock.acquire()
+        try:
+            self._outstanding[server] += 1
+        finally:
+            self._lock.release()
+
+    def end(self, server, elapsed=None, failed=False):
+        """Record end of request sent to server, elapsed is request time in
+        seconds, None if request was not finished, failed should be True if
+        request failed because of connection error
+        """
+        self._lock.acquire()
+        try:
+            self._outstanding[server] -= 1
+            if elapsed is not None:
+                if server in self._latency:
+                    self._latency[server] = self.alpha * elapsed + \
+                        (1 - self.alpha) * self._latency[server]
+                else:
+                    self._latency[server] = elapsed
+        finally:
+            self._lock.release()
+        if failed:
+            self.failure(server)
+        else:
+            self._breaker(server).success()
+
+    def failure(self, server):
+        """Record connection failure, server is marked as down and skipped
+        until breaker reset timeout passes
+        """
+        log.warning("Replica '%s' failed" % server)
+        self._breaker(server).trip()
+
+    def stats(self):
+        """Returns dict with server state, keys are server uris, values are
+        dicts with 'outstanding', 'latency' and 'state' keys
+        """
+        self._lock.acquire()
+        try:
+            ret = {}
+            for server in self.servers:
+                ret[server] = {
+                    'outstanding': self._outstanding[server],
+                    'latency': self._latency.get(server),
+                    'state': self._breaker(server).state,
+                }
+            return ret
+        finally:
+            self._lock.release()
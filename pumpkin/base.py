@@ -8,6 +8,7 @@ Created on 2009-06-11
 
 
 import logging
+import weakref
 try:
     # this is python >=2.5 module
     from functools import wraps
@@ -70,9 +71,15 @@ class _model(type):
             return 'Custom value'
     """
 
+    # all defined models, used by Directory.validate_models(), classes are
+    # weakly referenced so models created at runtime can be freed
+    models = weakref.WeakKeyDictionary()
+
     def __init__(cls, name, bases, adict):
         """Parse Model namespace and create properties from fields
         """
+        # must be set first, it's used by __getattribute__
+        cls._field_attrs = {}
         cls._fields = {}
         for (key, value) in adict.items():
             # we look only for Field type objects
@@ -118,33 +125,33 @@ class _model(type):
                 # we store { field_name: field_instance }
                 cls._fields[key] = value
 
+        # merge fields inherited from base classes, fields defined in this
+        # class override inherited ones
+        for base in cls.__mro__[1:]:
+            for (key, value) in base.__dict__.get('_fields', {}).items():
+                if key not in cls._fields:
+                    cls._fields[key] = value
+
+        # precompute lookup tables so that class level field access and
+        # listing model attributes are simple dict and list reads
+        cls._field_attrs = dict(
+            [(key, value.attr) for (key, value) in cls._fields.items()])
+        cls._ldap_attrs = [value.attr for value in cls._fields.values()]
+        cls._ldap_attrs_nonlazy = [value.attr for value in
+            cls._fields.values() if not value.lazy]
+
+        # register every model, base _Model class has no object classes
+        if hasattr(cls, '_object_class_'):
+            _model.models[cls] = True
+
     def __getattribute__(cls, name):
         """Intercept getattr() calls and return Field attribute name instead
         of property
         """
-        # start with currents class _fields
-        fields = super(_model, cls).__getattribute__('_fields')
-
-        # if we are getattr'ing _fields then we return it right away
-        if name == '_fields':
-            return fields
-
-        # we get _fields from every class in __bases__ and append it to fields
-        for base in super(_model, cls).__getattribute__('__bases__'):
-            try:
-                base_fields = super(_model, base).__getattribute__('_fields')
-                for (field, instance) in base_fields.items():
-                    if field not in fields.keys():
-                        fields[field] = instance
-            except:
-                pass
-
-        if name in fields.keys():
-            for (field, instance) in fields.items():
-                if field == name:
-                    return instance.attr
-        else:
-            return super(_model, cls).__getattribute__(name)
+        try:
+            return type.__getattribute__(cls, '_field_attrs')[name]
+        except KeyError:
+            return type.__getattribute__(cls, name)
 
 
 class _Model(object):
@@ -155,14 +162,10 @@ class _Model(object):
 
     @classmethod
     def _get_fields(cls):
-        """Returns dict with fields name -> instance mappings
+        """Returns dict with fields name -> instance mappings, including
+        fields inherited from base classes
         """
-        ret = cls._fields
-        for base in cls.__bases__:
-            for (name, instance) in base._fields.items():
-                if name not in ret.keys():
-                    ret[name] = instance
-        return ret
+        return cls._fields
 
     @classmethod
     def private_classes(cls):
@@ -193,13 +196,9 @@ class _Model(object):
         """Get list of ldap attributes used by model
         """
         if lazy:
-            return [ref.attr for ref in cls._get_fields().values()]
+            return list(cls._ldap_attrs)
         else:
-            ret = []
-            for field in cls._get_fields().values():
-                if not field.lazy:
-                    ret.append(field.attr)
-            return ret
+            return list(cls._ldap_attrs_nonlazy)
 
     def _object_class_fget(self):
         """Custom fget for getting objectClass, for new object it will return
@@ -229,6 +228,10 @@ class _Model(object):
         # can't use attrs kwarg because all model instances will use same
         # reference
         self._storage = {}
+        # attributes modified since object was loaded or saved
+        self._dirty = set()
+        # values of modified attributes as they were loaded from LDAP
+        self._original = {}
         for (attr, value) in attrs.items():
             self._store_attr(attr, value)
         if attrs != {}:
@@ -250,8 +253,8 @@ class _Model(object):
 
         self.directory = directory
 
-        self._validate_rdn_fields()
-        self._validate_schema()
+        # model is validated only once for every schema
+        self.directory.validate_model(self.__class__)
 
         if dn == None:
             self._empty = True
@@ -263,20 +266,22 @@ class _Model(object):
             self.update(missing_only=True)
             self._validate_object_class()
 
-    def _validate_schema(self):
+    @classmethod
+    def _validate_schema(cls, directory):
         """Checks if all model fields are present in schema
         """
         # skip checks if we got catch all model type (like models.DN) or the model is using extensibleObject
-        if 'extensibleObject' not in self.private_classes() and self._object_class_ != [] and self._rdn_ != []:
-            (must, may) = self.directory.get_schema_attrs(self.__class__)
+        if 'extensibleObject' not in cls.private_classes() and cls._object_class_ != [] and cls._rdn_ != []:
+            (must, may) = directory.get_schema_attrs(cls)
 
-            for (field, instance) in self._get_fields().items():
+            for (field, instance) in cls._get_fields().items():
                 # check if all non read-only attributes can be stored
-                if not instance.readonly and instance.validate_schema and instance.attr not in must + may:
+                if not instance.readonly and instance.validate_schema and instance.attr not in must and instance.attr not in may:
                     raise exceptions.SchemaValidationError(
 """Can't store '%s' field with LDAP attribute '%s' using current schema and \
 object classes: %s, all available attrs: %s""" % (
-                        field, instance.attr, self.private_classes(), must + may
+                        field, instance.attr, cls.private_classes(),
+                        sorted(must | may)
                         )
                     )
 
@@ -296,11 +301,12 @@ object classes: %s, all available attrs: %s""" % (
                     )
                 )
 
-    def _validate_rdn_fields(self):
+    @classmethod
+    def _validate_rdn_fields(cls):
         """Checks if all rdn fields are defined
         """
-        for name in self.rdn_fields():
-            if name not in self._get_fields():
+        for name in cls.rdn_fields():
+            if name not in cls._get_fields():
                 raise exceptions.InvalidModel(
                     "RDN field '%s' is missing from model" % name)
 
@@ -372,14 +378,112 @@ object classes: %s, all available attrs: %s""" % (
             if self._olddn is None:
                 self._olddn = self.dn
                 self._parent = self.get_parent()
+        self._mark_dirty(attr)
         self._store_attr(attr, value)
 
     def _del_attr(self, attr):
         """Remove attribue from object, we set it's value to None and it will
         be removed from LDAP after calling save()
         """
+        self._mark_dirty(attr)
         self._store_attr(attr, None)
 
+    def _mark_dirty(self, attr):
+        """Mark attribute as modified, value loaded from LDAP is remembered
+        so that save() can send only added and removed values
+        """
+        if attr not in self._dirty:
+            if self._isstored(attr):
+                self._original[attr] = self._storage[attr]
+            self._dirty.add(attr)
+
+    def _clear_dirty(self, attr=None):
+        """Mark given attribute or all attributes if attr is None as not
+        modified
+        """
+        if attr is None:
+            self._dirty.clear()
+            self._original.clear()
+        else:
+            self._dirty.discard(attr)
+            self._original.pop(attr, None)
+
+    def _split_modifications(self, record):
+        """Split record with modified attributes into (replace, add, delete)
+        dicts. Multi valued attributes with known previous value are saved by
+        adding and removing only changed values, so we don't need to rewrite
+        big attributes (like group members list) and we don't overwrite values
+        modified concurrently by other clients.
+        """
+        fields = {}
+        for field in self._get_fields().values():
+            fields[self._get_field_attr(field)] = field
+
+        # rdn attributes might have been already changed by rename, so we
+        # always replace them
+        rdn_attrs = self.rdn_attrs()
+
+        replace = {}
+        add = {}
+        delete = {}
+        for (attr, values) in record.items():
+            field = fields.get(attr)
+            if field is None or not field.multivalued or not values or \
+                not self._original.get(field.attr) or field.attr in rdn_attrs:
+                replace[attr] = values
+                continue
+
+            old = set(self._original[field.attr])
+            new = set(values)
+            added = [value for value in values if value not in old]
+            removed = [value for value in self._original[field.attr]
+                if value not in new]
+            if added:
+                add[attr] = added
+            if removed:
+                delete[attr] = removed
+        return (replace, add, delete)
+
+    def _merge_modifications(self, replace, add, delete):
+        """Returns replace dict with added and removed values applied to
+        current attribute values read from LDAP, used to save object when
+        incremental modify failed because other client already added or
+        removed some of the values. Local storage is updated with merged
+        values.
+        """
+        attrs = list(set(add.keys() + delete.keys()))
+        current = {}
+        for (attr, values) in self.directory.get_attrs(
+            self.dn, attrs).items():
+            current[attr.lower()] = values or []
+        merged = dict(replace)
+        for attr in attrs:
+            removed = delete.get(attr, [])
+            values = [value for value in current.get(attr.lower(), [])
+                if value not in removed]
+            for value in add.get(attr, []):
+                if value not in values:
+                    values.append(value)
+            merged[attr] = values or None
+            self._store_attr(attr, values or None)
+        return merged
+
+    def _save_incremental(self, replace, add, delete):
+        """Save modifications, if some added value already exists or removed
+        value is already gone modifications are merged with current values
+        and saved again, see _merge_modifications()
+        """
+        try:
+            self.directory.modify_attrs(
+                self.dn, replace=replace, add=add, delete=delete)
+        except (exceptions.NoSuchValue, exceptions.ValueExists), e:
+            if not add and not delete:
+                raise
+            log.debug("Incremental save of '%s' failed: %s, merging with "
+                "current values" % (self.dn, e))
+            self.directory.modify_attrs(self.dn,
+                replace=self._merge_modifications(replace, add, delete))
+
     def _generate_rdn(self):
         """Generate new object RDN using _rdn_ fields
         """
@@ -416,7 +520,7 @@ object classes: %s, all available attrs: %s""" % (
         else:
             return field.attr
 
-    def get_attributes(self, all=True):
+    def get_attributes(self, all=True, dirty=False):
         """Returns dict with object attributes, values will be in
         LDAP format (list of str). All readonly fields will be skipped, lazy
         fields that are not stored in local storage (not set to new value or
@@ -424,16 +528,23 @@ object classes: %s, all available attrs: %s""" % (
 
         @ivar all: if True return all attributes, even not set, if False return
         only attributes with not None value.
+        @ivar dirty: if True return only attributes modified since object was
+        loaded from LDAP or saved.
         """
-        # we need to make sure that objectClass is set
-        record = {
-            'objectClass': self._get_fields()['object_class'].encode2str(
-                self.object_class),
-        }
+        if dirty:
+            record = {}
+        else:
+            # we need to make sure that objectClass is set
+            record = {
+                'objectClass': self._get_fields()['object_class'].encode2str(
+                    self.object_class),
+            }
         for field in self._get_fields().values():
             if field.readonly:
                 # we don't save readonly fields
                 continue
+            if dirty and field.attr not in self._dirty:
+                continue
             if field.lazy:
                 # if field is lazy and all=False check if field value is stored
                 # and if it is stored save it, otherwise skip it from save()
@@ -477,19 +588,22 @@ object classes: %s, all available attrs: %s""" % (
             for (attr, value) in self.directory.get_attrs(
                 self._ldap_dn(), ldap_attrs).items():
                 self._store_attr(attr, value)
+                # fetched value replaces any local modification
+                self._clear_dirty(attr.split(';')[0])
 
     def isnew(self):
         """Returns True if instance is new and not yet written to LDAP
         """
         return self._empty
 
-    def rdn_fields(self):
+    @classmethod
+    def rdn_fields(cls):
         """Model attributes used as rdn
         """
-        if not isinstance(self._rdn_, list):
-            return [self._rdn_]
+        if not isinstance(cls._rdn_, list):
+            return [cls._rdn_]
         else:
-            return self._rdn_
+            return cls._rdn_
 
     def rdn_attrs(self):
         """LDAP attributes used as rdn
@@ -502,10 +616,9 @@ object classes: %s, all available attrs: %s""" % (
         ret = []
         (must, may) = self.directory.get_schema_attrs(self.__class__)
         for (name, instance) in self._get_fields().items():
-            for attr in must:
-                if instance.attr == attr:
-                    if getattr(self, name) is None:
-                        ret.append(name)
+            if instance.attr in must:
+                if getattr(self, name) is None:
+                    ret.append(name)
         return ret
 
     def get_parent(self):
@@ -520,63 +633,88 @@ object classes: %s, all available attrs: %s""" % (
     def save(self):
         """Save object into LDAP, if instance in new it will add object
         to LDAP, update self._rdn and mark it non-empty, if instance is
-        non-empty it will write all attributes to LDAP
+        non-empty it will write all attributes modified since object was
+        loaded or saved, if nothing was modified LDAP won't be contacted
+        """
+        self._check_missing_fields()
+        if self.isnew():
+            self.directory.add_object(self.dn, self._new_record())
+            self._empty = False
+            self._clear_dirty()
+        else:
+            self._save_rename()
+            modifications = self._save_modifications()
+            if modifications is not None:
+                self._save_incremental(*modifications)
+            self._after_save()
+
+    def _check_missing_fields(self):
+        """Raise exception if any required field is missing
         """
         if self.missing_fields() != []:
             raise exceptions.FieldValueMissing(
                 "Can't save when required fields are missing: %s" %
                 self.missing_fields())
 
-        if self.isnew():
-            # when adding new object we need data dict without None values
-            record = self.get_attributes(all=False)
-            log.debug("Adding new object to LDAP: '%s'" % self.dn)
-            if self.directory._resource.server_type == resource.ACTIVE_DIRECTORY_LDAP:
-                if 'objectClass' in record and 'securityPrincipal' in record['objectClass']:
-                    record['objectClass'].remove('securityPrincipal')
-                    #In AD this is one of those implicit object classes
-            self.directory.add_object(self.dn, record)
-            self._empty = False
-        else:
-
-            if self._olddn and self._olddn != self.dn:
-                log.debug("Rename object from '%s' to '%s'" % (self._olddn, self.dn))
-                self.directory.rename(
-                    self._olddn,
-                    self._generate_rdn(),
-                    parent = self._parent
-                )
-                self._olddn = None
-                self._parent = ','.join(self.dn.split(',')[1:])
-                log.debug("Parent after save '%s'" % self._parent)
-
-            record = self.get_attributes(all=True)
-            log.debug("Save attributes for '%s': %s" % (self.dn, record))
-
-            if self.directory._resource.server_type == resource.ACTIVE_DIRECTORY_LDAP:
-                #AD doesn't let you set these, and it was renamed earlier
-                for i in self.rdn_attrs():
-                    if i in record:
-                        del record[i]
-
-                #AD also doesn't let you set these
-                for i in ['objectClass', 'objectGUID']:
-                    if i in record:
-                        del record[i]
-
-                #AD doesn't like empty modlists
-                if len(record) != 0:
-                    self.directory.set_attrs(self.dn, record)
-
-                #Update GUID from ldap next time its requested
-                if 'objectGUID' in self._storage:
-                    del self._storage['objectGUID']
-            else:
-                self.directory.set_attrs(self.dn, record)
-
-
+    def _new_record(self):
+        """Returns attributes dict used to add new object to LDAP
+        """
+        # when adding new object we need data dict without None values
+        record = self.get_attributes(all=False)
+        log.debug("Adding new object to LDAP: '%s'" % self.dn)
+        if self.directory._resource.server_type == resource.ACTIVE_DIRECTORY_LDAP:
+            if 'objectClass' in record and 'securityPrincipal' in record['objectClass']:
+                record['objectClass'].remove('securityPrincipal')
+                #In AD this is one of those implicit object classes
+        return record
 
+    def _save_rename(self):
+        """Rename object in LDAP if it's dn was changed
+        """
+        if self._olddn and self._olddn != self.dn:
+            log.debug("Rename object from '%s' to '%s'" % (self._olddn, self.dn))
+            self.directory.rename(
+                self._olddn,
+                self._generate_rdn(),
+                parent = self._parent
+            )
+            self._olddn = None
+            self._parent = ','.join(self.dn.split(',')[1:])
+            log.debug("Parent after save '%s'" % self._parent)
+
+    def _save_modifications(self):
+        """Returns (replace, add, delete) tuple with modifications needed to
+        save existing object, None if nothing was modified
+        """
+        # only attributes modified since object was loaded are saved
+        record = self.get_attributes(all=True, dirty=True)
+        log.debug("Save attributes for '%s': %s" % (self.dn, record))
+
+        if self.directory._resource.server_type == resource.ACTIVE_DIRECTORY_LDAP:
+            #AD doesn't let you set these, and it was renamed earlier
+            for i in self.rdn_attrs():
+                if i in record:
+                    del record[i]
+
+            #AD also doesn't let you set these
+            for i in ['objectClass', 'objectGUID']:
+                if i in record:
+                    del record[i]
+
+        #AD doesn't like empty modlists
+        if len(record) == 0:
+            log.debug("No attributes modified for '%s'" % self.dn)
+            return None
+        return self._split_modifications(record)
 
+    def _after_save(self):
+        """Update object state after existing object was saved
+        """
+        if self.directory._resource.server_type == resource.ACTIVE_DIRECTORY_LDAP:
+            #Update GUID from ldap next time its requested
+            if 'objectGUID' in self._storage:
+                del self._storage['objectGUID']
+        self._clear_dirty()
 
     @run_hooks
     def delete(self, recursive=False):
@@ -586,12 +724,8 @@ object classes: %s, all available attrs: %s""" % (
         if self.isnew():
             raise exceptions.DeleteOnNew("Can't delete empty object")
         else:
-            # we got recursive delete so we first delete all children objects
-            if recursive:
-                for instance in self.directory.search(
-                    Model, basedn=self.dn, skip_basedn=True, recursive=False):
-                    instance.delete(recursive=recursive)
-            self.directory.delete(self.dn)
+            # recursive delete of children objects is done by directory
+            self.directory.delete(self.dn, recursive=recursive)
             self._empty = True
             self._dn = None
 
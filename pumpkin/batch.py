@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 2026-10-18
+@author: Łukasz Mierzwa
+@contact: <l.mierzwa@gmail.com>
+@license: GPLv3: http://www.gnu.org/licenses/gpl-3.0.txt
+
+Pipelined write operations. Operations added to batch are sent to server
+right away using asynchronous calls, results are collected later, so many
+operations can be processed without waiting for network round trip after
+every one of them.
+
+Usage::
+
+    with directory.batch() as batch:
+        for user in users:
+            batch.add(user.dn, user.get_attributes())
+    for op in batch.errors:
+        print op.dn, op.error
+'''
+
+
+import time
+import logging
+
+from ldap.dn import str2dn, dn2str
+
+from pumpkin.debug import PUMPKIN_LOGLEVEL
+
+
+logging.basicConfig(level=PUMPKIN_LOGLEVEL)
+log = logging.getLogger(__name__)
+
+
+class BatchOperation(object):
+    """Single operation sent as part of batch
+    """
+
+    def __init__(self, name, dn):
+        #: operation name: add, modify, delete, rename or passwd
+        self.name = name
+        #: object dn
+        self.dn = dn
+        #: True if server response was received
+        self.done = False
+        #: exception raised by operation, None if operation succeeded
+        self.error = None
+        #: LDAP message id
+        self.msgid = None
+        # (dn, subtree) tuples dropped from directory entry cache once
+        # operation is done
+        self._invalidate = [(dn, False)]
+        # pumpkin.stats.Operation recorded once operation is done
+        self._op = None
+        self._start = None
+
+    def _get_ok(self):
+        return self.done and self.error is None
+    ok = property(_get_ok, doc="True if operation succeeded")
+
+    def __repr__(self):
+        if not self.done:
+            state = 'pending'
+        elif self.error is None:
+            state = 'ok'
+        else:
+            state = 'error: %s' % self.error
+        return "<BatchOperation %s '%s' %s>" % (self.name, self.dn, state)
+
+
+class Batch(object):
+    """Batch of pipelined write operations, at most window operations are
+    waiting for server response at any time. Errors are not raised, they are
+    stored in every BatchOperation instance, use check() to raise first error.
+    All operations in batch are sent using the same connection.
+    """
+
+    def __init__(self, directory, window=64):
+        self.directory = directory
+        self.window = window
+        #: list of all BatchOperation instances, in order they were added
+        self.operations = []
+        # operations waiting for result
+        self._pending = []
+        self._entered = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+        return False
+
+    def _wait(self, op):
+        """Wait for operation result
+        """
+        try:
+            self.directory._result3(op.msgid)
+        except Exception, e:
+            log.debug("Batch %s operation on '%s' failed: %s" % (
+                op.name, op.dn, e))
+            op.error = e
+        op.done = True
+        self.directory._record(op._op, op._start, error=op.error)
+        for (dn, subtree) in op._invalidate:
+            self.directory._invalidate(dn, subtree=subtree)
+
+    def _send(self, name, dn, method, *args):
+        """Send asynchronous request, waits for oldest pending operation if
+        window is full
+        """
+        if not self._entered:
+            self.directory._enter()
+            self._entered = True
+        if len(self._pending) >= self.window:
+            self._wait(self._pending.pop(0))
+
+        op = BatchOperation(name, dn)
+        self.operations.append(op)
+        op._op = self.directory._request_op(method, (dn,) + args)
+        op._start = time.time()
+        try:
+            op.msgid = self.directory._submit(method,
+                self.directory._encode(dn), *args)
+        except Exception, e:
+            op.error = e
+            op.done = True
+            self.directory._record(op._op, op._start, error=e)
+        else:
+            self._pending.append(op)
+        return op
+
+    def add(self, ldap_dn, attrs):
+        """Add new object, attrs is a dict with attribute values
+        """
+        return self._send('add', ldap_dn, 'add_ext', attrs.items())
+
+    def modify(self, ldap_dn, replace=None, add=None, delete=None):
+        """Modify object attributes, see Directory.modify_attrs()
+        """
+        return self._send('modify', ldap_dn, 'modify_ext',
+            self.directory._modlist(replace=replace, add=add, delete=delete))
+
+    def set_attrs(self, ldap_dn, attrs):
+        """Replace object attributes values
+        """
+        return self.modify(ldap_dn, replace=attrs)
+
+    def delete(self, ldap_dn):
+        """Delete object
+        """
+        return self._send('delete', ldap_dn, 'delete_ext')
+
+    def rename(self, ldap_dn, new_rdn, parent=None):
+        """Rename or move object without children, servers usually refuse to
+        rename objects with children
+        """
+        if parent is None:
+            newdn = dn2str(str2dn(self.directory._encode(new_rdn)) +
+                str2dn(self.directory._encode(ldap_dn))[1:])
+        else:
+            parent = self.directory._encode(parent)
+            newdn = dn2str(str2dn(self.directory._encode(new_rdn)) +
+                str2dn(parent))
+        op = self._send('rename', ldap_dn, 'rename',
+            self.directory._encode(new_rdn), parent)
+        op._invalidate = [(ldap_dn, True), (newdn, True)]
+        return op
+
+    def passwd(self, ldap_dn, oldpass, newpass):
+        """Change object password
+        """
+        return self._send('passwd', ldap_dn, 'passwd', oldpass, newpass)
+
+    def flush(self):
+        """Wait for results of all pending operations, connection is released
+        after that
+        """
+        try:
+            while self._pending:
+                self._wait(self._pending.pop(0))
+        finally:
+            if self._entered:
+                self._entered = False
+                self.directory._leave()
+
+    def _get_errors(self):
+        return [op for op in self.operations if op.error is not None]
+    errors = property(_get_errors, doc="List of failed operations")
+
+    def check(self):
+        """Wait for all pending operations and raise error of first failed
+        operation, if any
+        """
+        self.flush()
+        for op in self.operations:
+            if op.error is not None:
+                raise op.error
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 2026-10-18
+@author: Łukasz Mierzwa
+@contact: <l.mierzwa@gmail.com>
+@license: GPLv3: http://www.gnu.org/licenses/gpl-3.0.txt
+
+Entry cache used by Directory, see Directory.enable_cache(). Cache keeps
+entries by dn and search results by (basedn, scope, filter, attributes),
+least recently used items are dropped when cache is full and every item
+expires after ttl seconds. Objects not found in LDAP are also cached, but
+with shorter ttl.
+
+Writes made using the same Directory instance invalidate cached entries,
+changes made by other clients are visible after cached item expires.
+'''
+
+
+import time
+import heapq
+import logging
+import threading
+
+from pumpkin.debug import PUMPKIN_LOGLEVEL
+
+
+logging.basicConfig(level=PUMPKIN_LOGLEVEL)
+log = logging.getLogger(__name__)
+
+
+#: marker returned for dns cached as missing
+NEGATIVE = object()
+
+
+def _in_subtree(dn, basedn):
+    """Check if normalized dn is basedn or one of its children
+    """
+    return dn == basedn or dn.endswith(',' + basedn)
+
+
+def _copy_attrs(attrs):
+    """Returns copy of attributes dict, so cached values can't be modified
+    """
+    ret = {}
+    for (attr, values) in attrs.items():
+        if values is None:
+            ret[attr] = None
+        else:
+            ret[attr] = list(values)
+    return ret
+
+
+class EntryCache(object):
+    """LRU cache with ttl for LDAP entries and search results. All dns
+    passed to cache must be normalized.
+    """
+
+    def __init__(self, size=1000, ttl=60, negative_ttl=10):
+        """
+        @param size: maximum number of cached items (both entries and
+        search results)
+        @param ttl: number of seconds after which cached item expires
+        @param negative_ttl: number of seconds after which cached misses
+        (missing objects, empty search results) expire
+        """
+        self.size = size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        # key -> (expire timestamp, value, last use tick), keys are
+        # ('dn', dn) or ('search', basedn, scope, filter, attrs, skip_basedn)
+        self._items = {}
+        # heap of (last use tick, key), entries with tick different from
+        # item tick are outdated and skipped when evicting
+        self._lru = []
+        self._tick = 0
+        # incremented on every invalidation, results fetched from LDAP are
+        # not stored if generation changed in the meantime
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _get_generation(self):
+        return self._generation
+    generation = property(_get_generation,
+        doc="Invalidation counter, pass it to put methods")
+
+    def _touch(self, key, expires, value):
+        """Store item as most recently used, must be called with lock held
+        """
+        self._tick += 1
+        self._items[key] = (expires, value, self._tick)
+        heapq.heappush(self._lru, (self._tick, key))
+        if len(self._lru) > 2 * self.size + 100:
+            # drop outdated heap entries
+            self._lru = [(item[2], key) for (key, item) in self._items.items()]
+            heapq.heapify(self._lru)
+
+    def _evict(self):
+        """Drop least recently used items until cache fits in size, must be
+        called with lock held
+        """
+        while len(self._items) > self.size and self._lru:
+            (tick, key) = heapq.heappop(self._lru)
+            item = self._items.get(key)
+            if item is not None and item[2] == tick:
+                del self._items[key]
+
+    def _get(self, key):
+        self._lock.acquire()
+        try:
+            item = self._items.get(key)
+            if item is None or item[0] < time.time():
+                self._items.pop(key, None)
+                self.misses += 1
+                return None
+            # it's most recently used now
+            self._touch(key, item[0], item[1])
+            self.hits += 1
+            return item[1]
+        finally:
+            self._lock.release()
+
+    def _put(self, key, value, ttl, generation):
+        self._lock.acquire()
+        try:
+            if generation is not None and generation != self._generation:
+                log.debug("Not caching %s, cache was invalidated" % (key,))
+                return
+            self._touch(key, time.time() + ttl, value)
+            self._evict()
+        finally:
+            self._lock.release()
+
+    def get_entry(self, dn):
+        """Returns dict with cached attributes of object, NEGATIVE if object
+        is cached as missing or None if object is not in cache
+        """
+        entry = self._get(('dn', dn))
+        if entry is None or entry is NEGATIVE:
+            return entry
+        return _copy_attrs(entry)
+
+    def put_entry(self, dn, attrs, generation=None):
+        """Store object attributes, they are merged with already cached
+        attributes of this object
+        """
+        self._lock.acquire()
+        try:
+            item = self._items.get(('dn', dn))
+            if item is not None and item[1] is not NEGATIVE and \
+                item[0] >= time.time():
+                merged = dict(item[1])
+            else:
+                merged = {}
+        finally:
+            self._lock.release()
+        merged.update(_copy_attrs(attrs))
+        self._put(('dn', dn), merged, self.ttl, generation)
+
+    def put_missing(self, dn, generation=None):
+        """Store information that object does not exist
+        """
+        self._put(('dn', dn), NEGATIVE, self.negative_ttl, generation)
+
+    def get_search(self, key):
+        """Returns cached search results as list of (dn, attrs) tuples or None
+        if there are no cached results, key is (basedn, scope, filter, attrs,
+        skip_basedn) tuple
+        """
+        entries = self._get(('search',) + key)
+        if entries is None:
+            return None
+        return [(dn, _copy_attrs(attrs)) for (dn, attrs) in entries]
+
+    def put_search(self, key, entries, generation=None):
+        """Store search results
+        """
+        entries = [(dn, _copy_attrs(attrs)) for (dn, attrs) in entries]
+        if entries:
+            ttl = self.ttl
+        else:
+            ttl = self.negative_ttl
+        self._put(('search',) + key, entries, ttl, generation)
+
+    def invalidate(self, dn, subtree=False):
+        """Drop cached object and all search results that could include it,
+        if subtree is True all children objects are also dropped
+        """
+        self._lock.acquire()
+        try:
+            self._generation += 1
+            for key in self._items.keys():
+                if key[0] == 'dn':
+                    if key[1] == dn or (subtree and _in_subtree(key[1], dn)):
+                        del self._items[key]
+                elif _in_subtree(dn, key[1]) or \
+                    (subtree and _in_subtree(key[1], dn)):
+                    del self._items[key]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """Drop all cached items
+        """
+        self._lock.acquire()
+        try:
+            self._generation += 1
+            self._items.clear()
+            self._lru = []
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Returns dict with number of cached items, hits and misses
+        """
+        self._lock.acquire()
+        try:
+            return {'items': len(self._items), 'hits': self.hits,
+                'misses': self.misses}
+        finally:
+            self._lock.release()
@@ -9,6 +9,8 @@ Created on 2009-05-24
 
 import time
 import logging
+import weakref
+import threading
 try:
     # this is python >=2.5 module
     from functools import wraps
@@ -18,19 +20,35 @@ except ImportError:
 
 import ldap
 from ldap import sasl, schema
+from ldap.dn import str2dn, dn2str
+from ldap.filter import escape_filter_chars
+from ldap.controls import LDAPControl, SimplePagedResultsControl
 
 from pumpkin.debug import PUMPKIN_LOGLEVEL
 from pumpkin import resource
 from pumpkin import filters
 from pumpkin import exceptions
+from pumpkin import schemacache
+from pumpkin import retry
+from pumpkin.balancer import Balancer
+from pumpkin.cache import EntryCache, NEGATIVE
+from pumpkin.sync import SyncReplica
+from pumpkin.stats import Stats, Operation, SlowLog, REQUESTS, attrs_size, \
+    entries_size
+from pumpkin.tracking import QueryTracker
 from pumpkin.objectlist import ObjectList
-from pumpkin.base import Model
+from pumpkin.batch import Batch
+from pumpkin.base import Model, _model
 
 
 logging.basicConfig(level=PUMPKIN_LOGLEVEL)
 log = logging.getLogger(__name__)
 
 
+#: Tree Delete control, used to delete object with all children
+TREE_DELETE_CONTROL = '1.2.840.113556.1.4.805'
+
+
 def ldap_exception_handler(func):
     """LDAP operation wrapper, takes care of exception handling.
     """
@@ -56,6 +74,10 @@ def ldap_exception_handler(func):
             raise exceptions.ObjectNotFound(exceptions.desc(e))
         except ldap.CONSTRAINT_VIOLATION, e:
             raise exceptions.ConstraintViolation(exceptions.desc(e))
+        except ldap.TYPE_OR_VALUE_EXISTS, e:
+            raise exceptions.ValueExists(exceptions.desc(e))
+        except ldap.NO_SUCH_ATTRIBUTE, e:
+            raise exceptions.NoSuchValue(exceptions.desc(e))
     return handler
 
 
@@ -80,20 +102,46 @@ def ldap_reconnect_handler(func):
 
     def reconnect(*args, **kwargs):
         """This handler takes care of recconeting to LDAP server if connection
-        is lost.
+        is lost. Attempts are delayed using exponential backoff with jitter,
+        all connections to the same server share circuit breaker, so when
+        server is down we fail fast instead of retrying.
         """
-        if args[0].isconnected():
-            args[0]._connected = False
-        for cnt in range(10):
+        directory = args[0]
+        res = directory._resource
+        breaker = retry.get_breaker(res.server,
+            threshold=res.breaker_threshold, reset_timeout=res.breaker_timeout)
+        if directory.isconnected():
+            directory._connected = False
+        for cnt in range(res.reconnect_attempts):
+            if not breaker.allow():
+                raise exceptions.CircuitOpen(
+                    "Too many failed connections to '%s'" % res.server)
             log.warning("Reconnecting to LDAP server '%s' (%d)" % (
-                args[0]._resource.server, cnt))
+                res.server, cnt))
+            # breaker must always learn the outcome, otherwise half open
+            # breaker would never let another attempt through
+            connected = False
             try:
-                args[0]._connect()
+                try:
+                    directory._connect()
+                    connected = True
+                except (exceptions.ServerDown, exceptions.Timeout,
+                    exceptions.ConnectionError), e:
+                    log.warning("Reconnect to '%s' failed: %s" % (
+                        res.server, e))
+            finally:
+                if connected:
+                    breaker.success()
+                else:
+                    breaker.failure()
+            if connected:
                 return func(*args, **kwargs)
-            except:
-                time.sleep(1 * cnt)
-        else:
-            raise exceptions.ReConnectionError("Can't reconnect to LDAP")
+            if cnt + 1 < res.reconnect_attempts:
+                delay = retry.backoff(cnt, base=res.reconnect_backoff,
+                    cap=res.reconnect_backoff_max)
+                log.warning("Next attempt in %.2f seconds" % delay)
+                time.sleep(delay)
+        raise exceptions.ReConnectionError("Can't reconnect to LDAP")
 
     return handler
 
@@ -110,6 +158,30 @@ class Directory(object):
         self._connected = False
         self._ldapconn = None
         self._schema = None
+        # root DSE attributes, read when needed
+        self._root_dse = None
+        # replica uri -> connection, used for read operations
+        self._replicas = {}
+        self._replicas_lock = threading.Lock()
+        self._balancer = None
+        # reads are sent to server until this timestamp, see _pin_reads()
+        self._pinned_until = 0
+        # EntryCache instance, see enable_cache()
+        self._cache = None
+        # SyncReplica instance, see enable_sync()
+        self._sync = None
+        # operation counters and observers, see stats()
+        self._stats = Stats()
+        # SlowLog observer, see enable_slow_log()
+        self._slow_log = None
+        # lowercased object class name or oid -> ObjectClass instance
+        self._oc_index = {}
+        # lowercased object class name -> (must, may)
+        self._oc_attrs = {}
+        # model class -> (must, may)
+        self._schema_attrs = weakref.WeakKeyDictionary()
+        # model classes already validated against current schema
+        self._validated = weakref.WeakKeyDictionary()
 
     def _encode(self, dn):
         """Check if given dn is utf string and encode it if needed.
@@ -119,17 +191,17 @@ class Directory(object):
         else:
             return dn
 
-    def _start_tls(self):
+    def _start_tls(self, conn):
         """Starts tls session if tls is enabled
         """
         if self._resource.tls:
             if ldap.TLS_AVAIL:
-                self._ldapconn.start_tls_s()
+                conn.start_tls_s()
             else:
                 raise exceptions.ResourceError(
                     'python-ldap is built without tls support')
 
-    def _bind(self):
+    def _bind(self, conn, server):
         """Bind to server
         """
         if self._resource.login is None:
@@ -137,8 +209,9 @@ class Directory(object):
         elif self._resource.auth_method == resource.AUTH_SIMPLE:
             log.debug(
                 "Performing SIMPLE BIND operation to '%s' as '%s'" % (
-                    self._resource.server, self._resource.login))
-            self._ldapconn.simple_bind_s(
+                    server, self._resource.login))
+            self._timed(Operation('bind', self._resource.login),
+                conn.simple_bind_s,
                 self._resource.login,
                 self._resource.password
             )
@@ -155,22 +228,60 @@ class Directory(object):
                         self._resource.password
                     )
                 log.debug("Performing SIMPLE BIND operation to '%s'" %
-                    self._resource.server)
-                self._ldapconn.sasl_interactive_bind_s("", auth_tokens)
+                    server)
+                self._timed(Operation('bind', self._resource.login),
+                    conn.sasl_interactive_bind_s, "", auth_tokens)
             else:
                 raise exceptions.ResourceError(
                     'python-ldap is built without sasl support')
 
-        self._connected = True
 
+    def _schema_timestamp(self, schemadn):
+        """Returns modifyTimestamp of subschema subentry or None if server
+        doesn't provide it
+        """
+        entry = self._ldapconn.read_subschemasubentry_s(
+            schemadn, attrs=['modifyTimestamp'])
+        if entry:
+            for (attr, values) in entry.items():
+                if attr.lower() == 'modifytimestamp' and values:
+                    return values[0]
+        return None
 
+    @ldap_exception_handler
     def _read_schema(self):
-        """Read schema from server
+        """Read schema from server, parsed schema is shared between all
+        Directory instances connected to the same server and reused until
+        subschema subentry modifyTimestamp changes
         """
-        log.debug("Reding server schema on '%s'" % self._resource.server)
         schemadn = self._ldapconn.search_subschemasubentry_s()
-        schemadict = self._ldapconn.read_subschemasubentry_s(schemadn)
-        self._schema = schema.SubSchema(schemadict)
+        timestamp = self._schema_timestamp(schemadn)
+        subschema = schemacache.get(self._resource.server, schemadn, timestamp,
+            cache_dir=self._resource.schema_cache_dir)
+        if subschema is None:
+            log.debug("Reding server schema on '%s'" % self._resource.server)
+            schemadict = self._ldapconn.read_subschemasubentry_s(schemadn)
+            subschema = schema.SubSchema(schemadict)
+            schemacache.put(self._resource.server, schemadn, timestamp,
+                subschema, cache_dir=self._resource.schema_cache_dir)
+        self._set_schema(subschema)
+
+    def _set_schema(self, subschema):
+        """Set schema used by this directory and rebuild schema indexes
+        """
+        if subschema is self._schema:
+            return
+        oc_index = {}
+        for oid in subschema.listall(schema.ObjectClass):
+            obj = subschema.get_obj(schema.ObjectClass, oid)
+            oc_index[oid.lower()] = obj
+            for name in obj.names:
+                oc_index.setdefault(name.lower(), obj)
+        self._oc_index = oc_index
+        self._oc_attrs = {}
+        self._schema_attrs = weakref.WeakKeyDictionary()
+        self._validated = weakref.WeakKeyDictionary()
+        self._schema = subschema
 
     def get_basedn(self):
         """Returns basedn for connected resource
@@ -178,30 +289,62 @@ class Directory(object):
         return self._encode(self._resource.basedn)
 
     @ldap_exception_handler
-    def _connect(self):
-        """Connect to LDAP server, does the actual work
+    def _open(self, server, factory=ldap.initialize):
+        """Create new connection to server, factory is called with server uri
+        and must return LDAPObject instance
         """
-        log.debug("Connecting to server '%s'" % self._resource.server)
-        self._ldapconn = ldap.initialize(self._resource.server)
+        log.debug("Connecting to server '%s'" % server)
+        conn = factory(server)
 
-        self._ldapconn.protocol_version = ldap.VERSION3
-        self._ldapconn.set_option(ldap.OPT_TIMEOUT, self._resource.timeout)
-        self._ldapconn.set_option(
-            ldap.OPT_NETWORK_TIMEOUT, self._resource.timeout)
+        conn.protocol_version = ldap.VERSION3
+        conn.set_option(ldap.OPT_TIMEOUT, self._resource.timeout)
+        conn.set_option(ldap.OPT_NETWORK_TIMEOUT, self._resource.timeout)
 
-        self._start_tls()
-        self._bind()
-        self._read_schema()
+        self._start_tls(conn)
+        self._bind(conn, server)
+        return conn
+
+    @ldap_exception_handler
+    def _connect(self):
+        """Connect to LDAP server, does the actual work
+        """
+        self._ldapconn = self._open(self._resource.server)
+        self._connected = True
+        # schema is read only once, reconnects will reuse it
+        if self._schema is None:
+            self._read_schema()
 
     def isconnected(self):
         """Check if we are connected to ldap server
         """
         return self._connected
 
+    def _enter(self):
+        """Called before group of operations that must use the same
+        connection, see PooledDirectory
+        """
+        pass
+
+    def _leave(self):
+        """Called after group of operations that must use the same connection
+        """
+        pass
+
+    def batch(self, window=64):
+        """Returns Batch instance that can be used to send many write
+        operations without waiting for each result
+
+        :parameter window: maximum number of operations waiting for result
+        """
+        return Batch(self, window=window)
+
     def connect(self, res):
         """Connect to LDAP server
         """
         self._resource = res
+        self._root_dse = None
+        self._schema = None
+        self._setup_replicas()
         self._connect()
 
     def disconnect(self):
@@ -210,27 +353,161 @@ class Directory(object):
         log.debug("Disconnecting from server '%s'" % self._resource.server)
         self._ldapconn.unbind_s()
         self._connected = False
+        self._setup_replicas()
+
+    def _setup_replicas(self):
+        """Close replica connections and create balancer for replicas from
+        current LDAP resource
+        """
+        self._replicas_lock.acquire()
+        try:
+            for conn in self._replicas.values():
+                try:
+                    conn.unbind_s()
+                except ldap.LDAPError:
+                    pass
+            self._replicas = {}
+        finally:
+            self._replicas_lock.release()
+        if self._resource.replicas:
+            self._balancer = Balancer(self._resource.replicas,
+                strategy=self._resource.read_strategy,
+                breaker_threshold=self._resource.breaker_threshold,
+                breaker_timeout=self._resource.breaker_timeout)
+        else:
+            self._balancer = None
+
+    def replica_stats(self):
+        """Returns dict with state of every replica, see Balancer.stats()
+        """
+        if self._balancer is None:
+            return {}
+        return self._balancer.stats()
+
+    @ldap_exception_handler
+    def _replica_conn(self, server):
+        """Returns connection to replica, new connection is created if needed
+        """
+        self._replicas_lock.acquire()
+        try:
+            conn = self._replicas.get(server)
+            if conn is None:
+                conn = self._open(server)
+                self._replicas[server] = conn
+            return conn
+        finally:
+            self._replicas_lock.release()
+
+    def _replica_failed(self, server, conn=None):
+        """Drop broken replica connection
+        """
+        self._replicas_lock.acquire()
+        try:
+            if conn is None or self._replicas.get(server) is conn:
+                self._replicas.pop(server, None)
+        finally:
+            self._replicas_lock.release()
+
+    def _pin_reads(self):
+        """Called after every write, reads are sent to server for
+        replica_pin_time seconds so they won't return stale data from replica
+        """
+        if self._balancer is not None:
+            self._pinned_until = time.time() + self._resource.replica_pin_time
+
+    def _replica_search(self, basedn, scope, search_filter, attrlist,
+        serverctrls=None):
+        """Send search request to replica chosen by balancer, replicas that
+        are down are skipped and provider is used if no replica is available.
+        Returns (server, connection, msgid) tuple, server and connection are
+        None if search was sent to provider.
+        """
+        for server in self._balancer.order():
+            if not self._balancer.allow(server):
+                continue
+            try:
+                conn = self._replica_conn(server)
+                msgid = self._send_search(conn, basedn, scope, search_filter,
+                    attrlist, serverctrls=serverctrls)
+            except (exceptions.ServerDown, exceptions.Timeout,
+                exceptions.ConnectionError), e:
+                log.warning("Search on replica '%s' failed: %s" % (server, e))
+                self._balancer.failure(server)
+                self._replica_failed(server)
+                continue
+            self._balancer.begin(server)
+            return (server, conn, msgid)
+
+        log.warning("No replica available, using '%s'" % (
+            self._resource.server))
+        return (None, None, self._search_ext(basedn, scope, search_filter,
+            attrlist, serverctrls=serverctrls))
 
     @ldap_reconnect_handler
     @ldap_exception_handler
-    def search(self, model, basedn=None, recursive=True, search_filter=None,
-        skip_basedn=False, lazy=False):
-        """Search for all objects matching model and return list of model
-        instances
-        
-        :argument model: model class to search for
-        :parameter basedn: basedn for LDAP search operation, if None LDAP
-          resource basedn will be used
-        :parameter recursive: whenever to search with subtree scope, default
-          is True
-        :parameter search_filter: additional LDAP search filter to use
-        :parameter lazy: whenever to fetch lazy attributes when doing
-          LDAP search, default is False
+    def _search_ext(self, basedn, scope, search_filter, attrlist,
+        serverctrls=None):
+        """Send asynchronous search request, returns message id
         """
-        #HACK for base.get_children() - will be fixed in 0.2
-        if model is None:
-            model = Model
+        return self._send_search(self._ldapconn, basedn, scope, search_filter,
+            attrlist, serverctrls=serverctrls)
 
+    @ldap_exception_handler
+    def _send_search(self, conn, basedn, scope, search_filter, attrlist,
+        serverctrls=None):
+        """Send asynchronous search request using given connection, returns
+        message id
+        """
+        return conn.search_ext(
+            basedn,
+            scope,
+            search_filter,
+            attrlist=attrlist,
+            serverctrls=serverctrls,
+            timeout=self._resource.timeout,
+        )
+
+    @ldap_exception_handler
+    def _result3(self, msgid, all=1, conn=None):
+        """Wait for result of asynchronous request with given message id,
+        returns (rtype, data, msgid, serverctrls) tuple
+        """
+        if conn is None:
+            conn = self._ldapconn
+        return conn.result3(msgid, all=all, timeout=self._resource.timeout)
+
+    def _record(self, op, start, error=None):
+        """Record LDAP operation started at start timestamp, see stats()
+        """
+        op.elapsed = time.time() - start
+        op.error = error
+        self._stats.record(op)
+
+    def _timed(self, op, func, *args, **kwargs):
+        """Run synchronous LDAPObject method and record it as operation op
+        """
+        start = time.time()
+        try:
+            ret = func(*args, **kwargs)
+        except Exception, e:
+            self._record(op, start, error=e)
+            raise
+        self._record(op, start)
+        return ret
+
+    def _request_op(self, method, args):
+        """Returns Operation for asynchronous LDAPObject method call, see
+        _submit()
+        """
+        op = Operation(REQUESTS.get(method, method), args[0])
+        if method in ['add_ext', 'modify_ext']:
+            op.size = attrs_size(args[1])
+            op.attrs = [item[-2] for item in args[1]]
+        return op
+
+    def _search_params(self, model, basedn, recursive, search_filter):
+        """Returns (basedn, scope, filter) tuple used to search for model
+        """
         ocs = []
         for oc in model.private_classes():
             if self._resource.server_type == resource.ACTIVE_DIRECTORY_LDAP:
@@ -252,21 +529,213 @@ class Directory(object):
         else:
             final_filter = model_filter
 
-        data = self._ldapconn.search_ext_s(
-            self._encode(basedn),
-            scope,
-            final_filter,
-            attrlist=model.ldap_attributes(lazy=lazy),
-            timeout=self._resource.timeout,
-        )
+        return (basedn, scope, final_filter)
 
-        ret = ObjectList()
-        for (dn, attrs) in data:
+    def _iter_entries(self, basedn, scope, search_filter, attrlist,
+        page_size=0, replica=False, name='search'):
+        """Run asynchronous LDAP search and yield (dn, attrs) tuples as soon as
+        entries are received from server. If page_size is set simple paged
+        results control (RFC 2696) is used and next page is requested after
+        all entries from current one were consumed. If replica is True and
+        resource has replicas search is sent to one of them, unless there was
+        a write in last replica_pin_time seconds. If replica fails before
+        any entry was received search is repeated on server. Every page is
+        recorded as operation of given name, see stats().
+        """
+        if page_size:
+            control = SimplePagedResultsControl(True, size=page_size, cookie='')
+            serverctrls = [control]
+        else:
+            serverctrls = None
+
+        server = None
+        conn = None
+        # time spent by caller between yielded entries is not recorded
+        page_start = time.time()
+        paused = 0.0
+        op = Operation(name, basedn, scope=scope, filter=search_filter,
+            attrs=attrlist)
+        # set if any entry was yielded, search can't be repeated after that
+        yielded = False
+        # set if search on replica failed and must be repeated on server
+        failover = False
+        if replica and self._balancer is not None and \
+            time.time() >= self._pinned_until:
+            (server, conn, msgid) = self._replica_search(
+                basedn, scope, search_filter, attrlist, serverctrls=serverctrls)
+        else:
+            msgid = self._search_ext(
+                basedn, scope, search_filter, attrlist, serverctrls=serverctrls)
+        start = time.time()
+        try:
+            while msgid is not None:
+                (rtype, data, rmsgid, ctrls) = self._result3(
+                    msgid, all=0, conn=conn)
+                if rtype == ldap.RES_SEARCH_ENTRY:
+                    op.entries += len(data)
+                    op.size += entries_size(data)
+                    for (dn, attrs) in data:
+                        before = time.time()
+                        yielded = True
+                        yield (dn, attrs)
+                        paused += time.time() - before
+                elif rtype == ldap.RES_SEARCH_RESULT:
+                    msgid = None
+                    self._record(op, page_start + paused)
+                    if page_size:
+                        cookie = None
+                        for ctrl in ctrls:
+                            if ctrl.controlType == \
+                                SimplePagedResultsControl.controlType:
+                                cookie = ctrl.cookie
+                        if cookie:
+                            log.debug(
+                                "Fetching next page of %d entries for '%s'" % (
+                                page_size, search_filter))
+                            control.cookie = cookie
+                            page_start = time.time()
+                            paused = 0.0
+                            op = Operation(name, basedn, scope=scope,
+                                filter=search_filter, attrs=attrlist)
+                            if conn is None:
+                                msgid = self._search_ext(basedn, scope,
+                                    search_filter, attrlist,
+                                    serverctrls=serverctrls)
+                            else:
+                                # paged search must continue on the same
+                                # replica
+                                msgid = self._send_search(conn, basedn, scope,
+                                    search_filter, attrlist,
+                                    serverctrls=serverctrls)
+                # search references are skipped
+        except GeneratorExit:
+            if msgid is not None:
+                # iteration was stopped before all results were received
+                log.debug("Abandoning search for '%s'" % search_filter)
+                (conn or self._ldapconn).abandon(msgid)
+                self._record(op, page_start + paused)
+            if server is not None:
+                self._balancer.end(server)
+            raise
+        except (exceptions.ServerDown, exceptions.Timeout,
+            exceptions.ConnectionError), e:
+            self._record(op, page_start + paused, error=e)
+            if server is None:
+                raise
+            self._balancer.end(server, failed=True)
+            self._replica_failed(server, conn)
+            if yielded:
+                raise
+            log.warning("Search on replica '%s' failed: %s, using '%s'" % (
+                server, e, self._resource.server))
+            failover = True
+        except Exception, e:
+            self._record(op, page_start + paused, error=e)
+            if server is not None:
+                self._balancer.end(server)
+            raise
+        if failover:
+            for entry in self._iter_entries(basedn, scope, search_filter,
+                attrlist, page_size=page_size, name=name):
+                yield entry
+        elif server is not None:
+            self._balancer.end(server, elapsed=time.time() - start)
+
+    @ldap_reconnect_handler
+    @ldap_exception_handler
+    def search(self, model, basedn=None, recursive=True, search_filter=None,
+        skip_basedn=False, lazy=False, page_size=None):
+        """Search for all objects matching model and return list of model
+        instances
+        
+        :argument model: model class to search for
+        :parameter basedn: basedn for LDAP search operation, if None LDAP
+          resource basedn will be used
+        :parameter recursive: whenever to search with subtree scope, default
+          is True
+        :parameter search_filter: additional LDAP search filter to use
+        :parameter lazy: whenever to fetch lazy attributes when doing
+          LDAP search, default is False
+        :parameter page_size: fetch results in pages of given size using
+          simple paged results control, if None LDAP resource page_size will
+          be used, 0 disables paging
+        """
+        if self._cache is None and self._sync is None:
+            return ObjectList(self.iter_search(model, basedn=basedn,
+                recursive=recursive, search_filter=search_filter,
+                skip_basedn=skip_basedn, lazy=lazy, page_size=page_size))
+
+        #HACK for base.get_children() - will be fixed in 0.2
+        if model is None:
+            model = Model
+
+        (basedn, scope, final_filter) = self._search_params(
+            model, basedn, recursive, search_filter)
+        entries = None
+        if self._sync is not None:
+            entries = self._sync.search(model, basedn, scope, final_filter,
+                skip_basedn=skip_basedn)
+        if entries is None:
+            entries = self._cached_search(basedn, scope, final_filter,
+                model.ldap_attributes(lazy=lazy), skip_basedn, page_size)
+        return ObjectList(
+            [model(self, dn=dn, attrs=attrs) for (dn, attrs) in entries])
+
+    def _cached_search(self, basedn, scope, search_filter, attrlist,
+        skip_basedn, page_size):
+        """Returns list of (dn, attrs) tuples for search, using entry cache
+        if it's enabled
+        """
+        if self._cache is None:
+            return list(self._search_entries(basedn, scope, search_filter,
+                attrlist, skip_basedn, page_size))
+
+        key = (self._normalize_dn(basedn), scope, search_filter,
+            tuple(sorted(attrlist)), skip_basedn)
+        entries = self._cache.get_search(key)
+        if entries is None:
+            generation = self._cache.generation
+            entries = list(self._search_entries(basedn, scope, search_filter,
+                attrlist, skip_basedn, page_size))
+            self._cache.put_search(key, entries, generation=generation)
+            for (dn, attrs) in entries:
+                # requested attributes missing in entry are also cached
+                cached = dict([(attr, None) for attr in attrlist])
+                cached.update(attrs)
+                self._cache.put_entry(self._normalize_dn(dn), cached,
+                    generation=generation)
+        return entries
+
+    def iter_search(self, model, basedn=None, recursive=True,
+        search_filter=None, skip_basedn=False, lazy=False, page_size=None):
+        """Same as search method but returns generator that yields model
+        instances as soon as entries are received from LDAP server, so only
+        one entry is kept in memory at once. Breaking iteration will abandon
+        search operation.
+        """
+        #HACK for base.get_children() - will be fixed in 0.2
+        if model is None:
+            model = Model
+
+        (basedn, scope, final_filter) = self._search_params(
+            model, basedn, recursive, search_filter)
+
+        for (dn, attrs) in self._search_entries(basedn, scope, final_filter,
+            model.ldap_attributes(lazy=lazy), skip_basedn, page_size):
+            yield model(self, dn=dn, attrs=attrs)
+
+    def _search_entries(self, basedn, scope, search_filter, attrlist,
+        skip_basedn, page_size):
+        """Yields (dn, attrs) tuples for search and iter_search
+        """
+        if page_size is None:
+            page_size = self._resource.page_size
+
+        for (dn, attrs) in self._iter_entries(self._encode(basedn), scope,
+            search_filter, attrlist, page_size, replica=True):
             if skip_basedn and self._encode(dn) == self._encode(basedn):
                 continue
-            ret.append(model(self, dn=dn, attrs=attrs))
-
-        return ret
+            yield (dn, attrs)
 
     def get(self, *args, **kwargs):
         """Same as search method but used to search for unique object, returns
@@ -281,6 +750,120 @@ class Directory(object):
         else:
             raise Exception('Multiple objects found')
 
+    def _normalize_dn(self, ldap_dn):
+        """Returns normalized dn that can be used to compare dns
+        """
+        return dn2str(str2dn(self._encode(ldap_dn))).lower()
+
+    def _iter_dn_batches(self, ldap_dns, attrlist, search_filter=None,
+        batch_size=100):
+        """Fetch entries for list of dns using as few LDAP searches as
+        possible. Dns are grouped by parent entry and every group is fetched
+        using one level search with filter matching entries rdns, all searches
+        are sent at once before waiting for results. Yields
+        (requested dn, attrs) tuples, dns not found in LDAP are skipped.
+        """
+        # parent dn -> list of rdn filters
+        groups = {}
+        # normalized dn -> requested dn
+        requested = {}
+        # list of (msgid, Operation, start timestamp) tuples
+        msgids = []
+        for ldap_dn in ldap_dns:
+            rdns = str2dn(self._encode(ldap_dn))
+            requested[dn2str(rdns).lower()] = ldap_dn
+            if len(rdns) < 2:
+                # entry without parent, we can only fetch it with base search
+                op = Operation('search', ldap_dn, scope=ldap.SCOPE_BASE,
+                    filter=search_filter or '(objectClass=*)', attrs=attrlist)
+                start = time.time()
+                msgids.append((self._search_ext(self._encode(ldap_dn),
+                    ldap.SCOPE_BASE, op.filter, attrlist), op, start))
+                continue
+            rdn_filter = filters.opand(*[filters.eq(attr,
+                escape_filter_chars(value)) for (attr, value, flags) in rdns[0]])
+            groups.setdefault(dn2str(rdns[1:]), []).append(rdn_filter)
+
+        for (parent, rdn_filters) in groups.items():
+            for i in range(0, len(rdn_filters), batch_size):
+                batch_filter = filters.opor(*rdn_filters[i:i + batch_size])
+                if search_filter:
+                    batch_filter = filters.opand(search_filter, batch_filter)
+                log.debug("Fetching %d entries from '%s'" % (
+                    len(rdn_filters[i:i + batch_size]), parent))
+                op = Operation('search', parent, scope=ldap.SCOPE_ONELEVEL,
+                    filter=batch_filter, attrs=attrlist)
+                start = time.time()
+                msgids.append((self._search_ext(
+                    parent, ldap.SCOPE_ONELEVEL, batch_filter, attrlist), op,
+                    start))
+
+        for (msgid, op, start) in msgids:
+            try:
+                (rtype, data, rmsgid, ctrls) = self._result3(msgid)
+            except exceptions.ObjectNotFound, e:
+                # parent object does not exist
+                self._record(op, start, error=e)
+                continue
+            except Exception, e:
+                self._record(op, start, error=e)
+                raise
+            op.entries = len(data)
+            op.size = entries_size(data)
+            self._record(op, start)
+            for (dn, attrs) in data:
+                if dn is None:
+                    # search reference
+                    continue
+                ldap_dn = requested.get(self._normalize_dn(dn))
+                if ldap_dn is not None:
+                    yield (ldap_dn, attrs)
+
+    @ldap_reconnect_handler
+    @ldap_exception_handler
+    def get_many(self, model, ldap_dns, lazy=False, batch_size=100):
+        """Create model instances for list of dns using as few LDAP searches
+        as possible, returns list of model instances in the same order as
+        passed dns, dns that were not found or don't match model are skipped.
+
+        :argument model: model class used to create instances
+        :argument ldap_dns: list of objects dns
+        :parameter lazy: whenever to fetch lazy attributes, default is False
+        :parameter batch_size: maximum number of entries fetched with single
+          LDAP search
+        """
+        (basedn, scope, model_filter) = self._search_params(
+            model, None, False, None)
+        found = {}
+        for (ldap_dn, attrs) in self._iter_dn_batches(ldap_dns,
+            model.ldap_attributes(lazy=lazy), search_filter=model_filter,
+            batch_size=batch_size):
+            found[ldap_dn] = model(self, dn=ldap_dn, attrs=attrs)
+
+        ret = ObjectList()
+        for ldap_dn in ldap_dns:
+            if ldap_dn in found:
+                ret.append(found[ldap_dn])
+        return ret
+
+    @ldap_reconnect_handler
+    @ldap_exception_handler
+    def get_attrs_many(self, ldap_dns, ldap_attrs, batch_size=100):
+        """Get multiple attributes for list of dns using as few LDAP searches
+        as possible, returns dict with dn -> attributes mapping, missing
+        attributes are set to None, dns that were not found are skipped.
+        """
+        ret = {}
+        for (ldap_dn, attrs) in self._iter_dn_batches(ldap_dns, ldap_attrs,
+            batch_size=batch_size):
+            # we set missing attributes to None so our model won't keep
+            # fetching them from directory on every fget
+            for attr in ldap_attrs:
+                if attr not in attrs.keys():
+                    attrs[attr] = None
+            ret[ldap_dn] = attrs
+        return ret
+
     def get_attr(self, ldap_dn, ldap_attr):
         """Get attribute value for object ldap_dn from LDAP
         """
@@ -291,12 +874,12 @@ class Directory(object):
     def get_attrs(self, ldap_dn, ldap_attrs):
         """Get multiple attributes for object ldap_dn from LDAP
         """
-        ldap_entry = self._ldapconn.search_ext_s(
-            self._encode(ldap_dn),
-            ldap.SCOPE_BASE,
-            attrlist=ldap_attrs,
-            timeout=self._resource.timeout,
-        )
+        if self._cache is not None and '*' not in ldap_attrs and \
+            '+' not in ldap_attrs:
+            return self._cached_attrs(ldap_dn, ldap_attrs)
+        ldap_entry = list(self._iter_entries(self._encode(ldap_dn),
+            ldap.SCOPE_BASE, '(objectClass=*)', ldap_attrs, replica=True,
+            name='get_attrs'))
         if ldap_entry != []:
             if len(ldap_entry) > 1:
                 raise Exception('Got multiple objects for dn: %s' % ldap_dn)
@@ -311,64 +894,367 @@ class Directory(object):
         else:
             return {}
 
+    def _cached_attrs(self, ldap_dn, ldap_attrs):
+        """Get attributes using entry cache, only attributes missing in cache
+        are fetched from LDAP
+        """
+        ndn = self._normalize_dn(ldap_dn)
+        cached = self._cache.get_entry(ndn)
+        if cached is NEGATIVE:
+            raise exceptions.ObjectNotFound(
+                "Object '%s' not found (cached)" % ldap_dn)
+        if cached is None:
+            cached = {}
+        missing = [attr for attr in ldap_attrs if attr not in cached]
+        if missing:
+            generation = self._cache.generation
+            try:
+                ldap_entry = list(self._iter_entries(self._encode(ldap_dn),
+                    ldap.SCOPE_BASE, '(objectClass=*)', missing,
+                    replica=True, name='get_attrs'))
+            except exceptions.ObjectNotFound:
+                self._cache.put_missing(ndn, generation=generation)
+                raise
+            fetched = dict([(attr, None) for attr in missing])
+            if ldap_entry:
+                fetched.update(ldap_entry[0][1])
+            self._cache.put_entry(ndn, fetched, generation=generation)
+            cached.update(fetched)
+        return dict([(attr, cached[attr]) for attr in ldap_attrs])
+
+    def enable_cache(self, size=1000, ttl=60, negative_ttl=10):
+        """Enable entry cache, see pumpkin.cache.EntryCache. Objects and
+        search results are cached for ttl seconds, missing objects and
+        empty search results for negative_ttl seconds. Writes made with this
+        directory invalidate cached items, changes made by other clients are
+        visible after cached items expire.
+        """
+        self._cache = EntryCache(size=size, ttl=ttl,
+            negative_ttl=negative_ttl)
+
+    def disable_cache(self):
+        """Disable entry cache and drop all cached items
+        """
+        self._cache = None
+
+    def cache_stats(self):
+        """Returns entry cache stats, see EntryCache.stats()
+        """
+        if self._cache is None:
+            return {}
+        return self._cache.stats()
+
+    def stats(self):
+        """Returns dict with counters for every LDAP operation type sent to
+        server: count, errors, latency (total, mean, min, max and histogram),
+        number of returned entries and approximate payload size, see
+        pumpkin.stats.Stats.snapshot()
+        """
+        return self._stats.snapshot()
+
+    def reset_stats(self):
+        """Reset all operation counters
+        """
+        self._stats.reset()
+
+    def add_observer(self, callback):
+        """Register callable that will be called with pumpkin.stats.Operation
+        instance after every LDAP operation
+        """
+        self._stats.add_observer(callback)
+
+    def remove_observer(self, callback):
+        """Unregister operation observer
+        """
+        self._stats.remove_observer(callback)
+
+    def enable_slow_log(self, threshold=1.0, operations=None, logger=None):
+        """Log operations that took more than threshold seconds, by default
+        search and get_attrs operations are logged with search base, scope,
+        final filter (including model object classes), requested attributes
+        and number of returned entries. Every page of paged search is
+        checked separately. See pumpkin.stats.SlowLog.
+        """
+        self.disable_slow_log()
+        self._slow_log = SlowLog(threshold=threshold, operations=operations,
+            logger=logger)
+        self.add_observer(self._slow_log)
+
+    def disable_slow_log(self):
+        """Stop logging slow operations
+        """
+        if self._slow_log is not None:
+            self.remove_observer(self._slow_log)
+            self._slow_log = None
+
+    def track_queries(self, strict=False, budget=0, all_threads=False):
+        """Returns QueryTracker context manager recording every LDAP
+        operation with dn, attributes and call site, see pumpkin.tracking
+
+        :parameter strict: raise QueryBudgetExceeded at the end of block if
+          there were more than budget implicit lazy loads
+        :parameter budget: number of allowed implicit lazy loads
+        :parameter all_threads: record operations made by all threads, not
+          only current one
+        """
+        return QueryTracker(self, strict=strict, budget=budget,
+            all_threads=all_threads)
+
+    def enable_sync(self, models, basedn=None, timeout=None):
+        """Keep local replica of all objects matching given models using
+        syncrepl, searches for those models are answered from replica. Waits
+        up to timeout seconds for initial content, returns SyncReplica
+        instance. Searches are sent to server while replica is not ready.
+        Replica is updated asynchronously, so changes made with this
+        directory are visible after server notifies replica about them.
+        """
+        self.disable_sync()
+        replica = SyncReplica(self, models, basedn=basedn)
+        replica.start()
+        replica.wait(timeout)
+        self._sync = replica
+        return replica
+
+    def disable_sync(self):
+        """Stop syncrepl replica
+        """
+        if self._sync is not None:
+            self._sync.stop()
+            self._sync = None
+
+    def _invalidate(self, ldap_dn, subtree=False):
+        """Drop cached object ldap_dn and search results that could include
+        it, called after every write
+        """
+        self._pin_reads()
+        if self._cache is not None:
+            self._cache.invalidate(self._normalize_dn(ldap_dn),
+                subtree=subtree)
+
     def set_attr(self, ldap_dn, ldap_attr, value):
         """Store attribute for object ldap_dn in LDAP
         """
         self.set_attrs(ldap_dn, {ldap_attr:value})
 
-    @ldap_reconnect_handler
-    @ldap_exception_handler
     def set_attrs(self, ldap_dn, ldap_attrs):
         """Set multiple attributes for object ldap_dn in LDAP
         """
+        self.modify_attrs(ldap_dn, replace=ldap_attrs)
+
+    @ldap_reconnect_handler
+    @ldap_exception_handler
+    def modify_attrs(self, ldap_dn, replace=None, add=None, delete=None):
+        """Modify attributes for object ldap_dn in LDAP using single modify
+        operation
+
+        :argument ldap_dn: object dn
+        :parameter replace: dict with attributes which values will be
+          replaced, None value removes attribute
+        :parameter add: dict with values to add to attributes
+        :parameter delete: dict with values to remove from attributes, None
+          value removes attribute
+        """
+        modlist = self._modlist(replace=replace, add=add, delete=delete)
+        if modlist:
+            try:
+                self._timed(Operation('modify', ldap_dn,
+                    size=attrs_size(modlist),
+                    attrs=[attr for (op, attr, values) in modlist]),
+                    self._ldapconn.modify_s, self._encode(ldap_dn), modlist)
+            finally:
+                self._invalidate(ldap_dn)
+
+    def _modlist(self, replace=None, add=None, delete=None):
+        """Returns modlist for modify operation, see modify_attrs()
+        """
         modlist = []
-        for (attr, values) in ldap_attrs.items():
-            if self._resource.server_type == resource.ACTIVE_DIRECTORY_LDAP:
-                if attr == 'objectClass':
-                    continue #Active Directory doesn't allow dynamic changing of object classes
-            modlist.append((ldap.MOD_REPLACE, attr, values))
-        self._ldapconn.modify_s(self._encode(ldap_dn), modlist)
+        for (op, attrs) in [(ldap.MOD_DELETE, delete), (ldap.MOD_ADD, add),
+            (ldap.MOD_REPLACE, replace)]:
+            if not attrs:
+                continue
+            for (attr, values) in attrs.items():
+                if self._resource.server_type == resource.ACTIVE_DIRECTORY_LDAP:
+                    if attr == 'objectClass':
+                        continue #Active Directory doesn't allow dynamic changing of object classes
+                modlist.append((op, attr, values))
+        return modlist
+
+    def add_values(self, ldap_dn, ldap_attr, values):
+        """Add values to attribute for object ldap_dn without reading current
+        attribute value
+        """
+        self.modify_attrs(ldap_dn, add={ldap_attr: values})
+
+    def remove_values(self, ldap_dn, ldap_attr, values):
+        """Remove values from attribute for object ldap_dn without reading
+        current attribute value
+        """
+        self.modify_attrs(ldap_dn, delete={ldap_attr: values})
 
     @ldap_reconnect_handler
     @ldap_exception_handler
     def passwd(self, ldap_dn, oldpass, newpass):
         """Change password for object ldap_dn in LDAP
         """
-        self._ldapconn.passwd_s(self._encode(ldap_dn), oldpass, newpass)
+        try:
+            self._timed(Operation('passwd', ldap_dn), self._ldapconn.passwd_s,
+                self._encode(ldap_dn), oldpass, newpass)
+        finally:
+            self._invalidate(ldap_dn)
+
+    @ldap_reconnect_handler
+    @ldap_exception_handler
+    def _has_children(self, ldap_dn):
+        """Check if object ldap_dn has any children objects
+        """
+        for (dn, attrs) in self._iter_entries(self._encode(ldap_dn),
+            ldap.SCOPE_ONELEVEL, '(objectClass=*)', ['1.1']):
+            # stopping iteration will abandon search
+            return True
+        return False
 
     @ldap_reconnect_handler
     @ldap_exception_handler
     def rename(self, old_dn, new_rdn, parent=None):
         """Rename or move object.
         """ 
-        obj = Model(self, old_dn)
         if parent:
             newdn = u'%s,%s' % (new_rdn, parent)
         else:
-            newdn = u'%s,%s' % (new_rdn, u','.join(obj.dn.split(',')[1:]))
-        if obj.get_children(model=Model) == []:
-            # object has no children, run normal rename
-            log.debug("Performing rename_s on %s" % old_dn)
-            try:
-                self._ldapconn.rename_s(self._encode(old_dn),
-                    self._encode(new_rdn), newsuperior=parent)
-            except ldap.UNWILLING_TO_PERFORM:
-                log.debug("rename_s failed, re-running complex rename")
-                self.copy(obj.dn, newdn, recursive=True)
-                obj.delete(recursive=True)
+            newdn = u'%s,%s' % (new_rdn,
+                dn2str(str2dn(self._encode(old_dn))[1:]).decode('utf-8'))
+        try:
+            if not self._has_children(old_dn):
+                # object has no children, run normal rename
+                log.debug("Performing rename_s on %s" % old_dn)
+                try:
+                    self._timed(Operation('rename', old_dn),
+                        self._ldapconn.rename_s, self._encode(old_dn),
+                        self._encode(new_rdn), newsuperior=parent)
+                except ldap.UNWILLING_TO_PERFORM:
+                    log.debug("rename_s failed, re-running complex rename")
+                    self.copy(old_dn, newdn, recursive=True)
+                    self.delete(old_dn, recursive=True)
+            else:
+                # we got children objects, make complex rename
+                log.debug("Performing complex rename on %s" % old_dn)
+                self.copy(old_dn, newdn, recursive=True)
+                self.delete(old_dn, recursive=True)
+        finally:
+            self._invalidate(old_dn, subtree=True)
+            self._invalidate(newdn, subtree=True)
+
+    @ldap_reconnect_handler
+    @ldap_exception_handler
+    def get_root_dse(self):
+        """Returns dict with root DSE attributes, it's read only once
+        """
+        if self._root_dse is None:
+            op = Operation('search', '', scope=ldap.SCOPE_BASE,
+                filter='(objectClass=*)', attrs=['*', '+'])
+            data = self._timed(op, self._ldapconn.search_ext_s, '',
+                ldap.SCOPE_BASE, '(objectClass=*)', attrlist=['*', '+'],
+                timeout=self._resource.timeout)
+            op.entries = len(data)
+            if data:
+                self._root_dse = data[0][1]
+            else:
+                self._root_dse = {}
+        return self._root_dse
+
+    def supports_control(self, oid):
+        """Check if server advertises support for control with given oid
+        """
+        for (attr, values) in self.get_root_dse().items():
+            if attr.lower() == 'supportedcontrol':
+                return oid in values
+        return False
+
+    def _pipeline(self, requests, window=64):
+        """Send asynchronous requests keeping at most window requests waiting
+        for results. Requests is a list of (method name, args) tuples, where
+        method is asynchronous LDAPObject method returning message id (like
+        'delete_ext' or 'add_ext'). All results are collected before first
+        error (if any) is raised.
+        """
+        error = None
+        # list of (msgid, Operation, start timestamp) tuples
+        pending = []
+        for (name, args) in requests:
+            if len(pending) >= window:
+                error = self._pipeline_wait(pending.pop(0), error)
+            start = time.time()
+            pending.append((self._submit(name, *args),
+                self._request_op(name, args), start))
+        for request in pending:
+            error = self._pipeline_wait(request, error)
+        if error is not None:
+            raise error
+
+    @ldap_exception_handler
+    def _submit(self, name, *args):
+        """Send asynchronous request using LDAPObject method name, returns
+        message id
+        """
+        self._pin_reads()
+        return getattr(self._ldapconn, name)(*args)
+
+    def _pipeline_wait(self, request, error):
+        """Wait for pipelined request result, returns first error
+        """
+        (msgid, op, start) = request
+        try:
+            self._result3(msgid)
+        except Exception, e:
+            self._record(op, start, error=e)
+            if error is None:
+                return e
         else:
-            # we got children objects, make complex rename
-            # first create temporary OU for children
-            log.debug("Performing complex rename on %s" % old_dn)
-            self.copy(obj.dn, newdn, recursive=True)
-            obj.delete(recursive=True)
+            self._record(op, start)
+        return error
 
     @ldap_reconnect_handler
     @ldap_exception_handler
-    def delete(self, ldap_dn):
-        """Delete object ldap_dn from LDAP
+    def delete(self, ldap_dn, recursive=False):
+        """Delete object ldap_dn from LDAP, if recursive is True object is
+        deleted with all children. Recursive delete will use Tree Delete
+        control if server supports it, otherwise all dns from subtree are
+        fetched with single search and deleted starting from leaves, all
+        entries on the same level are deleted using pipelined requests.
+        """
+        try:
+            self._delete(ldap_dn, recursive)
+        finally:
+            self._invalidate(ldap_dn, subtree=recursive)
+
+    def _delete(self, ldap_dn, recursive):
+        """Delete object, see delete()
         """
-        self._ldapconn.delete_s(self._encode(ldap_dn))
+        if not recursive:
+            self._timed(Operation('delete', ldap_dn), self._ldapconn.delete_s,
+                self._encode(ldap_dn))
+        elif self.supports_control(TREE_DELETE_CONTROL):
+            log.debug("Deleting '%s' using tree delete control" % ldap_dn)
+            self._timed(Operation('delete', ldap_dn),
+                self._ldapconn.delete_ext_s, self._encode(ldap_dn),
+                serverctrls=[LDAPControl(TREE_DELETE_CONTROL, True, None)])
+        else:
+            # depth -> list of dns
+            levels = {}
+            for (dn, attrs) in self._iter_entries(self._encode(ldap_dn),
+                ldap.SCOPE_SUBTREE, '(objectClass=*)', ['1.1'],
+                page_size=self._resource.page_size):
+                if dn is None:
+                    continue
+                levels.setdefault(len(str2dn(dn)), []).append(dn)
+
+            depths = levels.keys()
+            depths.sort(reverse=True)
+            for depth in depths:
+                log.debug("Deleting %d entries from subtree '%s'" % (
+                    len(levels[depth]), ldap_dn))
+                self._pipeline(
+                    [('delete_ext', (dn,)) for dn in levels[depth]])
 
     @ldap_reconnect_handler
     @ldap_exception_handler
@@ -379,95 +1265,146 @@ class Directory(object):
         modlist = []
         for (attr, values) in attrs.items():
             modlist.append((attr, values))
-        self._ldapconn.add_s(self._encode(ldap_dn), modlist)
+        try:
+            self._timed(Operation('add', ldap_dn, size=attrs_size(modlist),
+                attrs=attrs.keys()), self._ldapconn.add_s,
+                self._encode(ldap_dn), modlist)
+        finally:
+            self._invalidate(ldap_dn)
 
-    def copy(self, olddn, newdn, recursive=False):
-        """Copy LDAP object.
+    def _rename_rdn_attrs(self, attrs, old_rdn, new_rdn):
+        """Replace values of old rdn attributes with new rdn values in
+        attrs dict
         """
-        ldap_entry = self._ldapconn.search_ext_s(self._encode(olddn),
-            ldap.SCOPE_BASE, timeout=self._resource.timeout)
-        modlist = {}
-        if ldap_entry:
-            if len(ldap_entry) > 1:
-                raise Exception('Got multiple objects for dn: %s' % olddn)
-            else:
-                ret = ldap_entry[0][1]
-                # We fetch all the keys and set the modlist
-                for key in ret.keys():
-                    modlist[key] = self.get_attr(olddn, key)
-        log.debug("Copy '%s' to '%s' with attrs: %s" % (olddn, newdn, modlist))
-        self.add_object(newdn, modlist)
+        names = dict([(attr.lower(), attr) for attr in attrs.keys()])
+        for (attr, value, flags) in old_rdn:
+            name = names.get(attr.lower())
+            if name is not None and value in attrs[name]:
+                attrs[name] = [val for val in attrs[name] if val != value]
+                if attrs[name] == []:
+                    del attrs[name]
+                    del names[attr.lower()]
+        for (attr, value, flags) in new_rdn:
+            name = names.get(attr.lower())
+            if name is None:
+                attrs[attr] = [value]
+                names[attr.lower()] = attr
+            elif value not in attrs[name]:
+                attrs[name] = attrs[name] + [value]
 
+    @ldap_reconnect_handler
+    @ldap_exception_handler
+    def copy(self, olddn, newdn, recursive=False):
+        """Copy LDAP object, if recursive is True all children objects are
+        also copied. All entries are fetched with single search and created
+        starting from top, entries on the same level are added using
+        pipelined requests.
+        """
+        old_rdns = str2dn(self._encode(olddn))
+        new_rdns = str2dn(self._encode(newdn))
         if recursive:
-            for sub in self.search(Model, olddn, recursive=False,
-                skip_basedn=True):
-                newsubdn = u'%s,%s' % (sub.dn.split(',')[0], newdn)
-                log.debug("Copy child '%s'" % sub.dn)
-                self.copy(sub.dn, newsubdn, recursive=True)
+            scope = ldap.SCOPE_SUBTREE
+        else:
+            scope = ldap.SCOPE_BASE
+
+        # depth -> list of (new dn, attrs)
+        levels = {}
+        for (dn, attrs) in self._iter_entries(dn2str(old_rdns), scope,
+            '(objectClass=*)', None, page_size=self._resource.page_size):
+            rdns = str2dn(dn)
+            relative = rdns[:len(rdns) - len(old_rdns)]
+            if relative == []:
+                # copied object may get new rdn value
+                self._rename_rdn_attrs(attrs, old_rdns[0], new_rdns[0])
+            levels.setdefault(len(relative), []).append(
+                (dn2str(relative + new_rdns), attrs))
+
+        depths = levels.keys()
+        depths.sort()
+        try:
+            for depth in depths:
+                log.debug("Copy %d entries from '%s' to '%s'" % (
+                    len(levels[depth]), olddn, newdn))
+                self._pipeline([('add_ext', (dn, attrs.items()))
+                    for (dn, attrs) in levels[depth]])
+        finally:
+            self._invalidate(newdn, subtree=True)
 
     def _get_oc_inst(self, oc):
         """Get object class instance
         """
         if self._schema is None:
             self._read_schema()
-        for oids in self._schema.listall(schema.ObjectClass):
-            obj = self._schema.get_obj(schema.ObjectClass, oids)
-            for name in obj.names:
-                if oc.lower() == name.lower():
-                    return obj
-        else:
-             raise exceptions.SchemaValidationError(
+        try:
+            return self._oc_index[oc.lower()]
+        except KeyError:
+            raise exceptions.SchemaValidationError(
                 "Object class '%s' not found in schema" % oc)
 
     def _get_objectclass_attrs(self, oc):
-        """Returns all object class attributes ([required], [additional])
+        """Returns all object class attributes as tuple of frozensets
+        (required, additional), results are cached until schema is reloaded
         """
-        oc_inst = self._get_oc_inst(oc)
-
-        must = [attr for attr in oc_inst.must]
-
-        may = []
-        for attr in oc_inst.may:
-            if attr not in must:
-                may.append(attr)
+        key = oc.lower()
+        try:
+            return self._oc_attrs[key]
+        except KeyError:
+            pass
 
+        oc_inst = self._get_oc_inst(oc)
+        must = set(oc_inst.must)
+        may = set(oc_inst.may)
         for sup_oc in oc_inst.sup:
             (sup_must, sup_may) = self._get_objectclass_attrs(sup_oc)
-            for attr in sup_must:
-                if attr not in must:
-                    must.append(attr)
-            for attr in sup_may:
-                if attr not in may:
-                    may.append(attr)
+            must.update(sup_must)
+            may.update(sup_may)
 
         # remove attrs from may that are also in must
-        for attr in may:
-            if attr in must:
-                may.remove(attr)
-
-        return (must, may)
+        ret = (frozenset(must), frozenset(may - must))
+        self._oc_attrs[key] = ret
+        return ret
 
     def get_schema_attrs(self, model):
-        """Return tuple with schema attributes (must, may) for given model
+        """Return tuple with schema attributes (must, may) for given model,
+        both are frozensets, results are cached for every model class until
+        schema is reloaded
         """
-        may_attrs = []
-        must_attrs = []
+        try:
+            return self._schema_attrs[model]
+        except KeyError:
+            pass
 
+        must_attrs = set()
+        may_attrs = set()
         for oc in model.private_classes():
-
             (must, may) = self._get_objectclass_attrs(oc)
-
-            for attr in must:
-                if attr not in must_attrs:
-                    must_attrs.append(attr)
-
-            for attr in may:
-                if attr not in may_attrs:
-                    may_attrs.append(attr)
+            must_attrs.update(must)
+            may_attrs.update(may)
 
         # remove attrs from may that are also in must
-        for attr in may_attrs:
-            if attr in must_attrs:
-                may_attrs.remove(attr)
+        ret = (frozenset(must_attrs), frozenset(may_attrs - must_attrs))
+        self._schema_attrs[model] = ret
+        return ret
+
+    def validate_model(self, model):
+        """Check if model matches server schema, every model class is only
+        validated once until schema is reloaded
+        """
+        if model in self._validated:
+            return
+        model._validate_rdn_fields()
+        model._validate_schema(self)
+        self._validated[model] = True
 
-        return (must_attrs, may_attrs)
+    def validate_models(self, *models):
+        """Check if all given models match server schema, if no model is
+        passed all models defined outside of pumpkin package will be checked
+        (bundled models depend on schemas that might not be loaded on the
+        server). Can be used at startup to detect broken models before any
+        object is created.
+        """
+        if not models:
+            models = [model for model in _model.models.keys()
+                if not model.__module__.startswith('pumpkin.')]
+        for model in models:
+            self.validate_model(model)
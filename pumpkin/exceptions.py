@@ -41,6 +41,21 @@ class ReConnectionError(Exception):
     """
     pass
 
+class CircuitOpen(ReConnectionError):
+    """Too many failed reconnects to LDAP server, not trying for now
+    """
+    pass
+
+class PoolTimeout(Exception):
+    """No free connection in pool
+    """
+    pass
+
+class NotCheckedOut(Exception):
+    """Current thread has no pooled connection checked out
+    """
+    pass
+
 class InvalidAuth(Exception):
     """Invalid username and/or password
     """
@@ -73,6 +88,14 @@ class ConstraintViolation(Exception):
     """Constraint violation (low password quality etc)
     """
 
+class ValueExists(Exception):
+    """Value being added to attribute is already present
+    """
+
+class NoSuchValue(Exception):
+    """Value or attribute being removed is not present
+    """
+
 class DeleteOnNew(Exception):
     """Can't remove new object that was not saved to LDAP
     """
@@ -81,6 +104,10 @@ class FieldValueMissing(Exception):
     """save() called when required fields are missing
     """
 
+class QueryBudgetExceeded(Exception):
+    """Too many implicit lazy loads made while tracking queries
+    """
+
 def desc(err):
     """Return ldap exception description if present
     """
@@ -57,6 +57,9 @@ class Field(object):
     # default value to return if attribute is not set in LDAP, passing
     # 'default' kwarg passed to __init__() will override this
     default = None
+    # if True field stores multiple values and save() will only send added
+    # and removed values instead of replacing whole attribute
+    multivalued = False
 
     def __init__(self, name, **kwargs):
         """Constructor
@@ -150,6 +153,7 @@ class StringListField(Field):
     """List of unicode values
     """
     default = []
+    multivalued = True
 
     def validate(self, values):
         """Check if new value is a list of unicode values
@@ -178,6 +182,7 @@ class StringField(StringListField):
     """Unicode string
     """
     default = None
+    multivalued = False
 
     def validate(self, values):
         """Check if new value is unicode
@@ -203,6 +208,7 @@ class IntegerListField(Field):
     """List of integer values
     """
     default = []
+    multivalued = True
 
     def validate(self, values):
         """Check if new value is a list of int values
@@ -231,6 +237,7 @@ class IntegerField(IntegerListField):
     """Int value
     """
     default = None
+    multivalued = False
 
     def validate(self, values):
         """Check if new value is int
@@ -308,6 +315,7 @@ class BinaryField(Field):
 class DatetimeListField(Field):
     """List of datetime values
     """
+    multivalued = True
     def validate(self, values):
         """Check if value is valid datetime instance
         """
@@ -358,6 +366,7 @@ class DictField(Field):
     """Dictionary field with only unicode values.
     """
     default = {}
+    multivalued = True
 
     def __init__(self, name, **kwargs):
         """Adds 'separator' kwarg
@@ -96,3 +96,180 @@ def opnot(*args):
     """Not operator, none of given matches can be succesfull, they all must fail
     """
     return _make_op('!', args)
+
+
+def _unescape(value):
+    """Decode \\XX escape sequences in filter value
+    """
+    ret = ''
+    pos = 0
+    while pos < len(value):
+        if value[pos] == '\\':
+            try:
+                ret += chr(int(value[pos + 1:pos + 3], 16))
+            except ValueError:
+                raise ValueError, "Invalid escape sequence in '%s'" % value
+            pos += 3
+        else:
+            ret += value[pos]
+            pos += 1
+    return ret
+
+
+def _parse(filterstr, pos):
+    """Parse filter starting at pos, returns (node, position after filter)
+    """
+    if filterstr[pos:pos + 1] != '(':
+        raise ValueError, "Invalid filter '%s'" % filterstr
+    pos += 1
+    op = filterstr[pos:pos + 1]
+    if op in ['&', '|']:
+        pos += 1
+        parts = []
+        while filterstr[pos:pos + 1] == '(':
+            (part, pos) = _parse(filterstr, pos)
+            parts.append(part)
+        node = (op, parts)
+    elif op == '!':
+        (part, pos) = _parse(filterstr, pos + 1)
+        node = (op, part)
+    else:
+        end = filterstr.find(')', pos)
+        if end == -1:
+            raise ValueError, "Invalid filter '%s'" % filterstr
+        item = filterstr[pos:end]
+        pos = end
+        # attribute description can't contain '=', so first '=' belongs to
+        # operator, assertion value may contain any operator characters
+        eqpos = item.find('=')
+        if eqpos < 1:
+            raise ValueError, "Invalid filter '%s'" % filterstr
+        itemop = item[eqpos - 1]
+        value = item[eqpos + 1:]
+        if itemop == ':':
+            raise ValueError, "Extensible match is not supported"
+        elif itemop in ['>', '<', '~']:
+            attr = item[:eqpos - 1]
+            if itemop == '~':
+                # approximate match is treated as equality
+                node = ('=', attr.lower(), _unescape(value))
+            else:
+                node = (itemop + '=', attr.lower(), _unescape(value))
+        else:
+            attr = item[:eqpos]
+            if value == '*':
+                node = ('*', attr.lower())
+            elif '*' in value:
+                node = ('substr', attr.lower(),
+                    [_unescape(part) for part in value.split('*')])
+            else:
+                node = ('=', attr.lower(), _unescape(value))
+    if filterstr[pos:pos + 1] != ')':
+        raise ValueError, "Invalid filter '%s'" % filterstr
+    return (node, pos + 1)
+
+
+def parse(filterstr):
+    """Parse LDAP filter string, returns filter tree that can be passed to
+    match(), raises ValueError for invalid or unsupported filters
+    """
+    if isinstance(filterstr, unicode):
+        filterstr = filterstr.encode('utf-8')
+    (node, pos) = _parse(filterstr, 0)
+    if pos != len(filterstr):
+        raise ValueError, "Invalid filter '%s'" % filterstr
+    return node
+
+
+def attributes(tree):
+    """Returns set of lowercased attribute names used in filter tree returned
+    by parse()
+    """
+    op = tree[0]
+    if op in ['&', '|']:
+        ret = set()
+        for part in tree[1]:
+            ret.update(attributes(part))
+        return ret
+    elif op == '!':
+        return attributes(tree[1])
+    return set([tree[1]])
+
+
+def _compare(op, value, expected):
+    """Compare attribute value with filter value, numbers are compared as
+    integers, strings are compared ignoring case
+    """
+    try:
+        (value, expected) = (int(value), int(expected))
+    except ValueError:
+        (value, expected) = (value.lower(), expected.lower())
+    if op == '=':
+        return value == expected
+    elif op == '>=':
+        return value >= expected
+    else:
+        return value <= expected
+
+
+def _substr_match(value, parts):
+    """Check if value matches substring filter parts
+    """
+    value = value.lower()
+    parts = [part.lower() for part in parts]
+    if not value.startswith(parts[0]) or not value.endswith(parts[-1]):
+        return False
+    pos = len(parts[0])
+    end = len(value) - len(parts[-1])
+    if pos > end:
+        return False
+    for part in parts[1:-1]:
+        pos = value.find(part, pos, end)
+        if pos == -1:
+            return False
+        pos += len(part)
+    return True
+
+
+def _match(node, attrs):
+    op = node[0]
+    if op == '&':
+        for part in node[1]:
+            if not _match(part, attrs):
+                return False
+        return True
+    elif op == '|':
+        for part in node[1]:
+            if _match(part, attrs):
+                return True
+        return False
+    elif op == '!':
+        return not _match(node[1], attrs)
+
+    values = attrs.get(node[1])
+    if not values:
+        return False
+    if op == '*':
+        return True
+    for value in values:
+        if op == 'substr':
+            if _substr_match(value, node[2]):
+                return True
+        elif _compare(op, value, node[2]):
+            return True
+    return False
+
+
+def match(search_filter, attrs):
+    """Check if entry with given attributes matches filter, search_filter can
+    be filter string or tree returned by parse(). Attribute values are
+    compared ignoring case, so results may differ from LDAP server for
+    attributes with case sensitive matching rules.
+    """
+    if not isinstance(search_filter, tuple):
+        search_filter = parse(search_filter)
+    lowered = {}
+    for (attr, values) in attrs.items():
+        # skip attribute options like ;binary
+        lowered.setdefault(attr.split(';')[0].lower(), []).extend(values or [])
+    return _match(search_filter, lowered)
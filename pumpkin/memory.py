@@ -0,0 +1,649 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 2026-10-18
+@author: Łukasz Mierzwa
+@contact: <l.mierzwa@gmail.com>
+@license: GPLv3: http://www.gnu.org/licenses/gpl-3.0.txt
+
+In process LDAP backend, used for testing and benchmarking without LDAP
+server. MemoryDirectory is a Directory that talks to MemoryConnection
+instead of python-ldap connection, MemoryConnection implements subset of
+LDAPObject methods used by pumpkin on top of MemoryStore. Schema is loaded
+from OpenLDAP .schema files and data from LDIF files::
+
+    store = MemoryStore()
+    store.load_schema('core.schema', 'cosine.schema', 'nis.schema')
+    store.load_ldif('base.ldif')
+    directory = MemoryDirectory(store)
+    res = LDAPResource()
+    res.server = 'memory://'
+    res.basedn = 'dc=company,dc=com'
+    directory.connect(res)
+
+Filters are evaluated using pumpkin.filters.match(), so all values are
+compared ignoring case.
+'''
+
+
+import re
+import logging
+import threading
+
+import ldap
+import ldif
+from ldap import schema
+from ldap.dn import str2dn, dn2str
+from ldap.controls import SimplePagedResultsControl
+
+from pumpkin.debug import PUMPKIN_LOGLEVEL
+from pumpkin.directory import Directory, TREE_DELETE_CONTROL
+from pumpkin import filters
+
+
+logging.basicConfig(level=PUMPKIN_LOGLEVEL)
+log = logging.getLogger(__name__)
+
+
+#: subschema subentry dn
+SCHEMA_DN = 'cn=Subschema'
+
+# object class built into slapd that is not defined in any .schema file
+_EXTENSIBLE_OBJECT = "( 1.3.6.1.4.1.1466.101.120.111 NAME 'extensibleObject' " \
+    "SUP top AUXILIARY )"
+
+_SCHEMA_KEYWORDS = {
+    'attributetype': 'attributeTypes',
+    'objectclass': 'objectClasses',
+}
+
+# commented out schema definition
+_COMMENTED = re.compile(r'^(#+)(attributetype|objectclass)\b', re.I)
+
+
+def _normalize(dn):
+    """Returns normalized dn
+    """
+    return dn2str(str2dn(dn)).lower()
+
+
+def _parent(ndn):
+    """Returns normalized parent dn
+    """
+    return dn2str(str2dn(ndn)[1:])
+
+
+def _in_subtree(ndn, nbase):
+    return ndn == nbase or nbase == '' or ndn.endswith(',' + nbase)
+
+
+def _values(values):
+    """python-ldap accepts single string as attribute value
+    """
+    if isinstance(values, str):
+        return [values]
+    return list(values)
+
+
+def _find_attr(attrs, name):
+    """Returns attribute name used in attrs dict, names are case insensitive
+    """
+    name = name.lower()
+    for attr in attrs.keys():
+        if attr.lower() == name:
+            return attr
+    return None
+
+
+def _oid(definition):
+    return definition.strip('( ').split(None, 1)[0]
+
+
+def parse_schema(path):
+    """Parse OpenLDAP .schema file, returns dict with 'attributeTypes' and
+    'objectClasses' lists that can be passed to ldap.schema.SubSchema.
+    OpenLDAP schema files contain commented out definitions of schema
+    elements built into slapd, they are also loaded unless element with the
+    same oid is defined in file.
+    """
+    # list of (builtin, lines) tuples
+    definitions = []
+    prefix = None
+    for line in open(path).read().splitlines():
+        if prefix is not None and line.startswith(prefix) and \
+            line[len(prefix):][:1] in [' ', '\t']:
+            # continuation of commented out definition
+            definitions[-1][1].append(line[len(prefix):].strip())
+            continue
+        prefix = None
+        found = _COMMENTED.match(line)
+        if found:
+            prefix = found.group(1)
+            definitions.append((True, [line[len(prefix):].strip()]))
+        elif line.startswith('#') or not line.strip():
+            continue
+        elif line[:1] in [' ', '\t'] and definitions:
+            definitions[-1][1].append(line.strip())
+        else:
+            definitions.append((False, [line.strip()]))
+
+    ret = {'attributeTypes': [], 'objectClasses': []}
+    builtins = []
+    for (builtin, lines) in definitions:
+        (keyword, value) = (' '.join(lines) + ' ').split(None, 1)
+        if keyword.lower() not in _SCHEMA_KEYWORDS:
+            continue
+        item = (_SCHEMA_KEYWORDS[keyword.lower()], value.strip())
+        if builtin:
+            builtins.append(item)
+        else:
+            ret[item[0]].append(item[1])
+    defined = set([_oid(value) for values in ret.values() for value in values])
+    for (key, value) in builtins:
+        if _oid(value) not in defined:
+            ret[key].append(value)
+    return ret
+
+
+class MemoryStore(object):
+    """In memory LDAP database, can be shared by many connections
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # normalized dn -> (dn, attrs)
+        self._entries = {}
+        self._schema = {'attributeTypes': [],
+            'objectClasses': [_EXTENSIBLE_OBJECT]}
+        self._subschema = None
+
+    def load_schema(self, *paths):
+        """Load schema from OpenLDAP .schema files, elements with already
+        loaded oid are skipped
+        """
+        self._lock.acquire()
+        try:
+            for path in paths:
+                parsed = parse_schema(path)
+                for (key, values) in parsed.items():
+                    loaded = set([_oid(value) for value in self._schema[key]])
+                    for value in values:
+                        if _oid(value) not in loaded:
+                            self._schema[key].append(value)
+                            loaded.add(_oid(value))
+            self._subschema = schema.SubSchema(self._schema)
+        finally:
+            self._lock.release()
+
+    def load_ldif(self, *paths):
+        """Load entries from LDIF files
+        """
+        for path in paths:
+            parser = ldif.LDIFRecordList(open(path, 'rb'))
+            parser.parse()
+            for (dn, attrs) in parser.all_records:
+                self.add(dn, attrs.items())
+
+    def get_subschema(self):
+        """Returns parsed schema as ldap.schema.SubSchema instance
+        """
+        self._lock.acquire()
+        try:
+            if self._subschema is None:
+                return schema.SubSchema(self._schema)
+            return self._subschema
+        finally:
+            self._lock.release()
+
+    def get_schema(self, attrs=None):
+        """Returns subschema subentry attributes
+        """
+        self._lock.acquire()
+        try:
+            ret = {'objectClass': ['top', 'subentry', 'subschema'],
+                'cn': ['Subschema']}
+            for (key, values) in self._schema.items():
+                ret[key] = list(values)
+        finally:
+            self._lock.release()
+        return self._select(ret, attrs)
+
+    def _check_schema(self, dn, attrs):
+        """Check that entry matches object classes, raises
+        OBJECT_CLASS_VIOLATION
+        """
+        if self._subschema is None:
+            return
+        ocs = attrs.get(_find_attr(attrs, 'objectClass'), [])
+        if not ocs:
+            raise ldap.OBJECT_CLASS_VIOLATION({'desc':
+                'Object class violation', 'info': 'no objectClass attribute'})
+        for oc in ocs:
+            if self._subschema.get_obj(schema.ObjectClass, oc) is None:
+                raise ldap.OBJECT_CLASS_VIOLATION({'desc':
+                    'Object class violation',
+                    'info': "unknown objectClass '%s'" % oc})
+        (must, may) = self._subschema.attribute_types(ocs, raise_keyerror=0)
+        allowed = set()
+        for (oid, attr) in must.items() + may.items():
+            for name in tuple(attr.names) + (oid,):
+                allowed.add(name.lower())
+        present = set([attr.split(';')[0].lower() for attr in attrs.keys()])
+
+        for (oid, attr) in must.items():
+            names = [name.lower() for name in tuple(attr.names) + (oid,)]
+            if not present.intersection(names):
+                raise ldap.OBJECT_CLASS_VIOLATION({'desc':
+                    'Object class violation', 'info':
+                    "object class '%s' requires attribute '%s'" % (
+                    ','.join(ocs), names[0])})
+        if 'extensibleobject' in [oc.lower() for oc in ocs]:
+            return
+        for attr in present - allowed:
+            raise ldap.OBJECT_CLASS_VIOLATION({'desc':
+                'Object class violation',
+                'info': "attribute '%s' not allowed" % attr})
+
+    def _select(self, attrs, attrlist):
+        """Returns copy of attrs with only attributes from attrlist
+        """
+        if not attrlist or '*' in attrlist:
+            ret = {}
+            for (attr, values) in attrs.items():
+                ret[attr] = list(values)
+            return ret
+        ret = {}
+        wanted = set([attr.lower() for attr in attrlist])
+        for (attr, values) in attrs.items():
+            if attr.lower() in wanted:
+                ret[attr] = list(values)
+        return ret
+
+    def get(self, dn):
+        """Returns (dn, attrs) tuple for entry, raises NO_SUCH_OBJECT
+        """
+        try:
+            return self._entries[_normalize(dn)]
+        except KeyError:
+            raise ldap.NO_SUCH_OBJECT({'desc': 'No such object',
+                'matched': '', 'info': dn})
+
+    def _children(self, ndn):
+        """Returns list of normalized dns of all children of entry
+        """
+        return [key for key in self._entries.keys()
+            if key != ndn and _in_subtree(key, ndn)]
+
+    def search(self, base, scope, filterstr='(objectClass=*)', attrlist=None):
+        """Returns list of (dn, attrs) tuples
+        """
+        if filterstr is None:
+            filterstr = '(objectClass=*)'
+        try:
+            tree = filters.parse(filterstr)
+        except ValueError, e:
+            raise ldap.FILTER_ERROR({'desc': 'Bad search filter',
+                'info': str(e)})
+        nbase = _normalize(base)
+        self._lock.acquire()
+        try:
+            if nbase != '' and nbase not in self._entries:
+                raise ldap.NO_SUCH_OBJECT({'desc': 'No such object',
+                    'matched': '', 'info': base})
+            if scope == ldap.SCOPE_BASE:
+                if nbase == '':
+                    # root DSE
+                    return [('', {'supportedControl': [
+                        SimplePagedResultsControl.controlType,
+                        TREE_DELETE_CONTROL],
+                        'subschemaSubentry': [SCHEMA_DN]})]
+                candidates = [nbase]
+            elif scope == ldap.SCOPE_ONELEVEL:
+                candidates = [key for key in self._entries.keys()
+                    if key != nbase and _parent(key) == nbase]
+            else:
+                candidates = [key for key in self._entries.keys()
+                    if _in_subtree(key, nbase)]
+            candidates.sort(key=lambda key: (len(str2dn(key)), key))
+            ret = []
+            for key in candidates:
+                (dn, attrs) = self._entries[key]
+                if filters.match(tree, attrs):
+                    ret.append((dn, self._select(attrs, attrlist)))
+            return ret
+        finally:
+            self._lock.release()
+
+    def add(self, dn, modlist):
+        """Add new entry, modlist is a list of (attr, values) tuples
+        """
+        ndn = _normalize(dn)
+        attrs = {}
+        for (attr, values) in modlist:
+            attrs[attr] = _values(values)
+        self._lock.acquire()
+        try:
+            if ndn in self._entries:
+                raise ldap.ALREADY_EXISTS({'desc': 'Already exists',
+                    'info': dn})
+            parent = _parent(ndn)
+            if parent not in self._entries:
+                # entry without parent can only be added as new suffix
+                for key in self._entries.keys():
+                    if _in_subtree(ndn, key):
+                        raise ldap.NO_SUCH_OBJECT({'desc': 'No such object',
+                            'matched': key, 'info': dn})
+            self._check_schema(dn, attrs)
+            self._entries[ndn] = (dn, attrs)
+        finally:
+            self._lock.release()
+
+    def modify(self, dn, modlist):
+        """Modify entry, modlist is a list of (op, attr, values) tuples
+        """
+        self._lock.acquire()
+        try:
+            (dn, attrs) = self.get(dn)
+            attrs = self._select(attrs, None)
+            for (op, attr, values) in modlist:
+                name = _find_attr(attrs, attr)
+                if values is not None:
+                    values = _values(values)
+                if op == ldap.MOD_ADD:
+                    if name is None:
+                        attrs[attr] = []
+                        name = attr
+                    for value in values:
+                        if value in attrs[name]:
+                            raise ldap.TYPE_OR_VALUE_EXISTS({'desc':
+                                'Type or value exists', 'info': attr})
+                        attrs[name].append(value)
+                elif op == ldap.MOD_DELETE:
+                    if name is None:
+                        raise ldap.NO_SUCH_ATTRIBUTE({'desc':
+                            'No such attribute', 'info': attr})
+                    if not values:
+                        del attrs[name]
+                        continue
+                    for value in values:
+                        if value not in attrs[name]:
+                            raise ldap.NO_SUCH_ATTRIBUTE({'desc':
+                                'No such attribute', 'info': attr})
+                        attrs[name].remove(value)
+                    if not attrs[name]:
+                        del attrs[name]
+                else:
+                    if name is not None:
+                        del attrs[name]
+                    if values:
+                        attrs[attr] = values
+            self._check_schema(dn, attrs)
+            self._entries[_normalize(dn)] = (dn, attrs)
+        finally:
+            self._lock.release()
+
+    def delete(self, dn, subtree=False):
+        """Delete entry, if subtree is True all children are also deleted
+        """
+        ndn = _normalize(dn)
+        self._lock.acquire()
+        try:
+            self.get(dn)
+            children = self._children(ndn)
+            if children and not subtree:
+                raise ldap.NOT_ALLOWED_ON_NONLEAF({'desc':
+                    'Operation not allowed on non-leaf', 'info': dn})
+            for key in children + [ndn]:
+                del self._entries[key]
+        finally:
+            self._lock.release()
+
+    def rename(self, dn, newrdn, newsuperior=None, delold=1):
+        """Rename or move entry with all children
+        """
+        ndn = _normalize(dn)
+        self._lock.acquire()
+        try:
+            (dn, attrs) = self.get(dn)
+            old_rdn = str2dn(dn)[0]
+            new_rdn = str2dn(newrdn)[0]
+            if newsuperior is None:
+                parent = str2dn(dn)[1:]
+            else:
+                self.get(newsuperior)
+                if _in_subtree(_normalize(newsuperior), ndn):
+                    raise ldap.UNWILLING_TO_PERFORM({'desc':
+                        'Server is unwilling to perform',
+                        'info': "can't move entry below itself"})
+                parent = str2dn(newsuperior)
+            newdn = dn2str([new_rdn] + parent)
+            nnewdn = _normalize(newdn)
+            if nnewdn != ndn and nnewdn in self._entries:
+                raise ldap.ALREADY_EXISTS({'desc': 'Already exists',
+                    'info': newdn})
+
+            attrs = self._select(attrs, None)
+            if delold:
+                for (attr, value, flags) in old_rdn:
+                    name = _find_attr(attrs, attr)
+                    if name is not None and value in attrs[name]:
+                        attrs[name].remove(value)
+                        if not attrs[name]:
+                            del attrs[name]
+            for (attr, value, flags) in new_rdn:
+                name = _find_attr(attrs, attr)
+                if name is None:
+                    attrs[attr] = [value]
+                elif value not in attrs[name]:
+                    attrs[name].append(value)
+            self._check_schema(newdn, attrs)
+
+            depth = len(str2dn(ndn))
+            for key in self._children(ndn):
+                (child_dn, child_attrs) = self._entries.pop(key)
+                child_dn = dn2str(str2dn(child_dn)[:-depth] + str2dn(newdn))
+                self._entries[_normalize(child_dn)] = (child_dn, child_attrs)
+            del self._entries[ndn]
+            self._entries[nnewdn] = (newdn, attrs)
+        finally:
+            self._lock.release()
+
+    def passwd(self, dn, oldpw, newpw):
+        """Change userPassword attribute
+        """
+        self._lock.acquire()
+        try:
+            (dn, attrs) = self.get(dn)
+            if oldpw is not None and oldpw not in attrs.get(
+                _find_attr(attrs, 'userPassword'), []):
+                raise ldap.UNWILLING_TO_PERFORM({'desc':
+                    'Server is unwilling to perform', 'info': 'wrong password'})
+            self.modify(dn, [(ldap.MOD_REPLACE, 'userPassword', [newpw])])
+        finally:
+            self._lock.release()
+
+
+class MemoryConnection(object):
+    """Implements subset of python-ldap LDAPObject methods used by pumpkin
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.protocol_version = ldap.VERSION3
+        self._lock = threading.Lock()
+        self._options = {}
+        self._msgid = 0
+        # msgid -> list of (rtype, data, ctrls) tuples or exception
+        self._results = {}
+
+    def set_option(self, option, value):
+        self._options[option] = value
+
+    def get_option(self, option):
+        return self._options.get(option)
+
+    def simple_bind_s(self, who='', cred=''):
+        pass
+
+    def sasl_interactive_bind_s(self, who, auth):
+        pass
+
+    def start_tls_s(self):
+        pass
+
+    def unbind_s(self):
+        pass
+
+    def _queue(self, func, *args):
+        """Run operation and store its result, returns message id
+        """
+        self._lock.acquire()
+        try:
+            self._msgid += 1
+            msgid = self._msgid
+        finally:
+            self._lock.release()
+        try:
+            self._results[msgid] = func(*args)
+        except ldap.LDAPError, e:
+            self._results[msgid] = e
+        return msgid
+
+    def _search(self, base, scope, filterstr, attrlist, serverctrls):
+        entries = self.store.search(base, scope, filterstr, attrlist)
+        ctrls = []
+        for ctrl in serverctrls or []:
+            if ctrl.controlType == SimplePagedResultsControl.controlType:
+                offset = int(ctrl.cookie or 0)
+                end = offset + ctrl.size
+                if end < len(entries):
+                    cookie = str(end)
+                else:
+                    cookie = ''
+                entries = entries[offset:end]
+                ctrls.append(SimplePagedResultsControl(True, size=ctrl.size,
+                    cookie=cookie))
+        ret = [(ldap.RES_SEARCH_ENTRY, [entry], []) for entry in entries]
+        ret.append((ldap.RES_SEARCH_RESULT, [], ctrls))
+        return ret
+
+    def search_ext(self, base, scope, filterstr='(objectClass=*)',
+        attrlist=None, attrsonly=0, serverctrls=None, clientctrls=None,
+        timeout=-1, sizelimit=0):
+        return self._queue(self._search, base, scope, filterstr, attrlist,
+            serverctrls)
+
+    def search_ext_s(self, base, scope, filterstr='(objectClass=*)',
+        attrlist=None, attrsonly=0, serverctrls=None, clientctrls=None,
+        timeout=-1, sizelimit=0):
+        return self.result3(self.search_ext(base, scope, filterstr, attrlist,
+            serverctrls=serverctrls))[1]
+
+    def search_s(self, base, scope, filterstr='(objectClass=*)',
+        attrlist=None, attrsonly=0):
+        return self.search_ext_s(base, scope, filterstr, attrlist)
+
+    def search_subschemasubentry_s(self, dn=''):
+        return SCHEMA_DN
+
+    def read_subschemasubentry_s(self, subschemasubentry_dn, attrs=None):
+        return self.store.get_schema(attrs)
+
+    def _done(self, rtype, func, *args):
+        func(*args)
+        return [(rtype, [], [])]
+
+    def add_ext(self, dn, modlist, serverctrls=None, clientctrls=None):
+        return self._queue(self._done, ldap.RES_ADD, self.store.add, dn,
+            modlist)
+
+    def add_s(self, dn, modlist):
+        return self.result3(self.add_ext(dn, modlist))
+
+    def modify_ext(self, dn, modlist, serverctrls=None, clientctrls=None):
+        return self._queue(self._done, ldap.RES_MODIFY, self.store.modify, dn,
+            modlist)
+
+    def modify_s(self, dn, modlist):
+        return self.result3(self.modify_ext(dn, modlist))
+
+    def delete_ext(self, dn, serverctrls=None, clientctrls=None):
+        subtree = False
+        for ctrl in serverctrls or []:
+            if ctrl.controlType == TREE_DELETE_CONTROL:
+                subtree = True
+        return self._queue(self._done, ldap.RES_DELETE, self.store.delete, dn,
+            subtree)
+
+    def delete_ext_s(self, dn, serverctrls=None, clientctrls=None):
+        return self.result3(self.delete_ext(dn, serverctrls=serverctrls))
+
+    def delete_s(self, dn):
+        return self.delete_ext_s(dn)
+
+    def rename(self, dn, newrdn, newsuperior=None, delold=1,
+        serverctrls=None, clientctrls=None):
+        return self._queue(self._done, ldap.RES_MODRDN, self.store.rename,
+            dn, newrdn, newsuperior, delold)
+
+    def rename_s(self, dn, newrdn, newsuperior=None, delold=1,
+        serverctrls=None, clientctrls=None):
+        return self.result3(self.rename(dn, newrdn, newsuperior, delold))
+
+    def passwd(self, user, oldpw, newpw, serverctrls=None, clientctrls=None):
+        return self._queue(self._done, ldap.RES_EXTENDED, self.store.passwd,
+            user, oldpw, newpw)
+
+    def passwd_s(self, user, oldpw, newpw, serverctrls=None,
+        clientctrls=None):
+        return self.result3(self.passwd(user, oldpw, newpw))
+
+    def abandon(self, msgid, serverctrls=None, clientctrls=None):
+        self._results.pop(msgid, None)
+
+    def result3(self, msgid=ldap.RES_ANY, all=1, timeout=None):
+        """Returns (rtype, data, msgid, serverctrls) tuple
+        """
+        if msgid == ldap.RES_ANY:
+            if not self._results:
+                return (None, None, None, None)
+            msgid = min(self._results.keys())
+        results = self._results.get(msgid)
+        if results is None:
+            if timeout == 0:
+                return (None, None, None, None)
+            raise ldap.NO_SUCH_OPERATION({'desc': 'No such operation'})
+        if isinstance(results, ldap.LDAPError):
+            del self._results[msgid]
+            raise results
+        if all:
+            del self._results[msgid]
+            data = []
+            for (rtype, rdata, ctrls) in results:
+                data.extend(rdata)
+            return (rtype, data, msgid, ctrls)
+        (rtype, data, ctrls) = results.pop(0)
+        if not results:
+            del self._results[msgid]
+        return (rtype, data, msgid, ctrls)
+
+
+class MemoryDirectory(Directory):
+    """Directory using MemoryStore instead of LDAP server, LDAP resource
+    server uri is ignored
+    """
+
+    def __init__(self, store=None):
+        Directory.__init__(self)
+        if store is None:
+            store = MemoryStore()
+        self.store = store
+
+    def _open(self, server, factory=None):
+        log.debug("Connecting to memory store")
+        return MemoryConnection(self.store)
+
+    def _read_schema(self):
+        """Schema is taken directly from store, shared schema cache is keyed by
+        server uri so it can't be used here
+        """
+        self._set_schema(self.store.get_subschema())
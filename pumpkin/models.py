@@ -16,7 +16,7 @@ from pumpkin.fields import IntegerField
 from pumpkin.fields import IntegerListField
 from pumpkin.fields import StringField
 from pumpkin.fields import StringListField
-from pumpkin.filters import eq
+from pumpkin.filters import eq, opor
 
 
 logging.basicConfig(level=PUMPKIN_LOGLEVEL)
@@ -59,16 +59,19 @@ class PosixGroup(Model):
         removed users
         """
         log.debug("Running post save hook for gid '%s'" % self.gid)
-        for uid in self.members:
-            log.debug("Post save hook call for uid '%s'" % uid)
-            member = self.directory.get(
+        members = self.members
+        # fetch members in batches instead of running search for every uid
+        for i in range(0, len(members), 100):
+            for member in self.directory.search(
                 PosixUser,
-                search_filter=eq(PosixUser.uid, uid)
-            )
-            if not member is None:
-                log.debug("Update gid to '%s' for uid '%s'" % (self.gid, uid))
-                member.gid = self.gid
-                member.save()
+                search_filter=opor(
+                    *[eq(PosixUser.uid, uid) for uid in members[i:i + 100]])
+            ):
+                if member.gid != self.gid:
+                    log.debug("Update gid to '%s' for uid '%s'" % (
+                        self.gid, member.uid))
+                    member.gid = self.gid
+                    member.save()
 
     def add_member(self, uid):
         """Add given user uid to member list
@@ -50,6 +50,50 @@ class ObjectList(list):
         else:
             return None
 
+    def prefetch(self, *names, **kwargs):
+        """Fetch values of given fields (usually lazy ones) for all objects
+        using batched LDAP searches and store them in objects local storage,
+        so accessing those fields won't require separate LDAP search for
+        every object. Objects that don't have some of the fields are skipped.
+        Returns self.
+
+        :parameter batch_size: maximum number of entries fetched with single
+          LDAP search, default is 100
+        """
+        batch_size = kwargs.get('batch_size', 100)
+
+        # (directory, ldap attributes) -> list of objects
+        groups = {}
+        for obj in self:
+            if obj.isnew():
+                continue
+            fields = obj._get_fields()
+            attrs = []
+            for name in names:
+                field = fields.get(name)
+                if field is not None and not obj._isstored(field.attr):
+                    attrs.append(obj._get_field_attr(field))
+            if attrs:
+                attrs.sort()
+                groups.setdefault(
+                    (obj.directory, tuple(attrs)), []).append(obj)
+
+        for ((directory, attrs), objs) in groups.items():
+            log.debug("Prefetching attrs %s for %d objects" % (
+                attrs, len(objs)))
+            found = directory.get_attrs_many(
+                [obj._ldap_dn() for obj in objs], list(attrs),
+                batch_size=batch_size)
+            for obj in objs:
+                values = found.get(obj._ldap_dn())
+                if values is None:
+                    continue
+                for field in obj._get_fields().values():
+                    ldap_attr = obj._get_field_attr(field)
+                    if ldap_attr in attrs and not obj._isstored(field.attr):
+                        obj._store_attr(field.attr, values.get(ldap_attr))
+        return self
+
     def pickle(self):
         """Returns list of pickled objects
         """
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 2026-10-18
+@author: Łukasz Mierzwa
+@contact: <l.mierzwa@gmail.com>
+@license: GPLv3: http://www.gnu.org/licenses/gpl-3.0.txt
+'''
+
+
+import time
+import logging
+import threading
+try:
+    # this is python >=2.5 module
+    from functools import wraps
+except ImportError:
+    # so in case of <2.5 fallback to this backported code (taken from django)
+    from pumpkin.contrib.backports import wraps
+
+import ldap
+
+from pumpkin.debug import PUMPKIN_LOGLEVEL
+from pumpkin.directory import Directory
+from pumpkin import exceptions
+
+
+logging.basicConfig(level=PUMPKIN_LOGLEVEL)
+log = logging.getLogger(__name__)
+
+
+def pooled(func):
+    """Pool wrapper, checks out connection for current thread before running
+    operation and returns it to the pool once outermost operation is done.
+    """
+    @wraps(func)
+    def handler(*args, **kwargs):
+        args[0]._enter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            args[0]._leave()
+    return handler
+
+
+class PooledDirectory(Directory):
+    """Directory keeping pool of bound connections to the same LDAP resource.
+    Each thread gets its own connection from the pool for the duration of
+    every operation, so concurrent operations are not serialized on a single
+    connection.
+    """
+
+    def __init__(self, size=4, check_interval=30, timeout=None):
+        """Create connection pool
+
+        @param size: maximum number of connections kept in pool
+        @param check_interval: idle connections not used for this many
+        seconds are checked before being handed out, broken ones are rebuilt
+        @param timeout: how many seconds to wait for free connection if all
+        are in use, None means wait forever
+        """
+        # must be set before Directory.__init__() sets _ldapconn
+        self._local = threading.local()
+        self._lock = threading.Condition()
+        self._size = size
+        self._check_interval = check_interval
+        self._timeout = timeout
+        # list of (connection, last used timestamp) tuples
+        self._idle = []
+        # number of connections created, both idle and checked out
+        self._count = 0
+        # incremented by connect(), connections created before that are
+        # closed instead of being returned to the pool
+        self._generation = 0
+        Directory.__init__(self)
+
+    def _get_ldapconn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # connection taken here would never be returned to the pool
+            raise exceptions.NotCheckedOut(
+                "No pooled connection checked out by current thread")
+        return conn
+
+    def _set_ldapconn(self, conn):
+        self._local.conn = conn
+
+    _ldapconn = property(_get_ldapconn, _set_ldapconn,
+        doc="Connection checked out by current thread")
+
+    def _isalive(self, conn):
+        """Check if idle connection still works by reading root DSE
+        """
+        try:
+            conn.search_ext_s('', ldap.SCOPE_BASE, '(objectClass=*)',
+                attrlist=['1.1'], timeout=self._resource.timeout)
+            return True
+        except ldap.LDAPError, e:
+            log.warning("Dropping broken pooled connection to '%s': %s" % (
+                self._resource.server, exceptions.desc(e)))
+            return False
+
+    def _checkout(self):
+        """Take connection from the pool and bind it to current thread, new
+        connection is created if there is no idle one and pool is not full
+        """
+        deadline = None
+        if self._timeout is not None:
+            deadline = time.time() + self._timeout
+
+        self._lock.acquire()
+        try:
+            while True:
+                if self._idle:
+                    (conn, used) = self._idle.pop()
+                    break
+                elif self._count < self._size:
+                    conn = None
+                    self._count += 1
+                    break
+                elif deadline is None:
+                    self._lock.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise exceptions.PoolTimeout(
+                            "No free connection to '%s' in pool" % (
+                                self._resource.server))
+                    self._lock.wait(remaining)
+            self._local.generation = self._generation
+        finally:
+            self._lock.release()
+
+        if conn is not None and time.time() - used > self._check_interval:
+            if not self._isalive(conn):
+                conn = None
+
+        if conn is None:
+            log.debug("Creating new pooled connection to '%s'" % (
+                self._resource.server))
+            try:
+                # _connect() will store new connection as self._ldapconn
+                self._connect()
+            except:
+                self._local.conn = None
+                self._lock.acquire()
+                try:
+                    self._count -= 1
+                    self._lock.notify()
+                finally:
+                    self._lock.release()
+                raise
+            conn = self._local.conn
+        else:
+            self._local.conn = conn
+        return conn
+
+    def _checkin(self):
+        """Return connection used by current thread to the pool
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        self._lock.acquire()
+        try:
+            if self._local.generation == self._generation:
+                self._idle.append((conn, time.time()))
+                conn = None
+            else:
+                # connection to previous LDAP resource
+                self._count -= 1
+            self._lock.notify()
+        finally:
+            self._lock.release()
+        if conn is not None:
+            self._unbind(conn)
+
+    def _unbind(self, conn):
+        """Close pooled connection ignoring errors
+        """
+        try:
+            conn.unbind_s()
+        except ldap.LDAPError:
+            pass
+
+    def _close_idle(self):
+        """Close all idle connections
+        """
+        self._lock.acquire()
+        try:
+            idle = self._idle
+            self._idle = []
+            self._count -= len(idle)
+            self._lock.notifyAll()
+        finally:
+            self._lock.release()
+        for (conn, used) in idle:
+            self._unbind(conn)
+
+    def _enter(self):
+        """Mark start of operation in current thread
+        """
+        depth = getattr(self._local, 'depth', 0)
+        # depth is set first, so operations run while connection is created
+        # (reading schema) won't return it to the pool
+        self._local.depth = depth + 1
+        if depth == 0 and getattr(self._local, 'conn', None) is None:
+            try:
+                self._checkout()
+            except:
+                self._local.depth = depth
+                raise
+
+    def _leave(self):
+        """Mark end of operation in current thread, connection is returned to
+        the pool after outermost operation
+        """
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            self._checkin()
+
+    def connect(self, res):
+        """Connect to LDAP server, first connection is created right away so
+        we can validate LDAP resource settings. Idle connections are closed,
+        connections currently used by other threads are closed once returned.
+        """
+        self._lock.acquire()
+        try:
+            self._generation += 1
+        finally:
+            self._lock.release()
+        self._close_idle()
+        self._resource = res
+        self._root_dse = None
+        self._schema = None
+        self._setup_replicas()
+        self._enter()
+        self._leave()
+
+    def disconnect(self):
+        """Disconnect all idle connections, connections currently used by
+        other threads are not touched
+        """
+        log.debug("Disconnecting pooled connections from server '%s'" % (
+            self._resource.server))
+        self._close_idle()
+        self._connected = False
+        self._setup_replicas()
+
+    def iter_search(self, *args, **kwargs):
+        """Same as Directory.iter_search, pooled connection is kept until
+        iteration is finished
+        """
+        self._enter()
+        results = Directory.iter_search(self, *args, **kwargs)
+        try:
+            for obj in results:
+                yield obj
+        finally:
+            # unfinished search must be abandoned before connection is
+            # returned to the pool
+            results.close()
+            self._leave()
+
+    search = pooled(Directory.search)
+    get = pooled(Directory.get)
+    get_attr = pooled(Directory.get_attr)
+    get_attrs = pooled(Directory.get_attrs)
+    get_many = pooled(Directory.get_many)
+    get_attrs_many = pooled(Directory.get_attrs_many)
+    set_attr = pooled(Directory.set_attr)
+    set_attrs = pooled(Directory.set_attrs)
+    modify_attrs = pooled(Directory.modify_attrs)
+    add_values = pooled(Directory.add_values)
+    remove_values = pooled(Directory.remove_values)
+    passwd = pooled(Directory.passwd)
+    rename = pooled(Directory.rename)
+    delete = pooled(Directory.delete)
+    get_root_dse = pooled(Directory.get_root_dse)
+    _read_schema = pooled(Directory._read_schema)
+    add_object = pooled(Directory.add_object)
+    copy = pooled(Directory.copy)
@@ -23,6 +23,9 @@ DIGEST_MD5 = 1
 STANDARD_LDAP = 0
 ACTIVE_DIRECTORY_LDAP = 1
 
+ROUND_ROBIN = 0
+LEAST_OUTSTANDING = 1
+
 class LDAPResource(object):
     """This class represents LDAP resource (server)
     """
@@ -40,6 +43,29 @@ class LDAPResource(object):
         self.tls = False
         self.timeout = ldap.OPT_TIMEOUT
         self.server_type = STANDARD_LDAP
+        # number of entries fetched per page in searches, 0 disables paging
+        self.page_size = 0
+        # directory used to store parsed server schema between processes,
+        # None disables on disk schema cache
+        self.schema_cache_dir = None
+        # maximum number of reconnect attempts after connection is lost
+        self.reconnect_attempts = 10
+        # delay before first reconnect attempt, it's doubled with every
+        # failed attempt and randomized, up to reconnect_backoff_max seconds
+        self.reconnect_backoff = 0.5
+        self.reconnect_backoff_max = 30.0
+        # number of failed reconnects after which all reconnects to this
+        # server fail right away for breaker_timeout seconds
+        self.breaker_threshold = 5
+        self.breaker_timeout = 30
+        # list of read only replica uris, searches are sent to replicas and
+        # all writes to server, server is used for reads if all replicas fail
+        self.replicas = []
+        # how replica is chosen, ROUND_ROBIN or LEAST_OUTSTANDING
+        self.read_strategy = ROUND_ROBIN
+        # after every write reads are sent to server for this many seconds,
+        # so changes are visible before they reach replicas
+        self.replica_pin_time = 5
 
     def auth_method():
         doc = "Auth method, can be AUTH_SIMPLE or AUTH_SASL"
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 2026-10-18
+@author: Łukasz Mierzwa
+@contact: <l.mierzwa@gmail.com>
+@license: GPLv3: http://www.gnu.org/licenses/gpl-3.0.txt
+
+Reconnect helpers: exponential backoff with jitter and circuit breaker shared
+by all connections to the same server. When reconnecting to server fails
+too many times breaker is opened and all reconnect attempts fail right away
+until reset timeout passes, after that single connection is allowed to probe
+server, if it succeeds breaker is closed again.
+'''
+
+
+import time
+import random
+import logging
+import threading
+
+from pumpkin.debug import PUMPKIN_LOGLEVEL
+
+
+logging.basicConfig(level=PUMPKIN_LOGLEVEL)
+log = logging.getLogger(__name__)
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+def backoff(attempt, base=0.5, cap=30.0):
+    """Returns number of seconds to wait before next attempt, delay grows
+    exponentially with every attempt up to cap and random jitter is used so
+    clients won't retry at the same moment ("full jitter")
+
+    @param attempt: number of failed attempts so far, starting from 0
+    @param base: delay for first attempt
+    @param cap: maximum delay
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker(object):
+    """Circuit breaker for single server
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        """
+        @param threshold: number of consecutive failures after which breaker
+        is opened
+        @param reset_timeout: number of seconds after which open breaker lets
+        single probe attempt through
+        """
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened = None
+
+    def _get_state(self):
+        return self._state
+    state = property(_get_state, doc="Breaker state: closed, open or half-open")
+
+    def allow(self):
+        """Check if connection attempt is allowed
+        """
+        self._lock.acquire()
+        try:
+            if self._state == CLOSED:
+                return True
+            elif self._state == OPEN and \
+                time.time() - self._opened >= self.reset_timeout:
+                # let one attempt probe server
+                log.debug("Circuit breaker is half open")
+                self._state = HALF_OPEN
+                return True
+            return False
+        finally:
+            self._lock.release()
+
+    def success(self):
+        """Record successful connection
+        """
+        self._lock.acquire()
+        try:
+            if self._state != CLOSED:
+                log.info("Circuit breaker closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._opened = None
+        finally:
+            self._lock.release()
+
+    def failure(self):
+        """Record failed connection
+        """
+        self._lock.acquire()
+        try:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and
+                self._failures >= self.threshold):
+                log.warning("Circuit breaker opened after %d failures" % (
+                    self._failures))
+                self._state = OPEN
+                self._opened = time.time()
+        finally:
+            self._lock.release()
+
+    def trip(self):
+        """Open breaker right away, server is considered down until reset
+        timeout passes
+        """
+        self._lock.acquire()
+        try:
+            self._failures += 1
+            if self._state != OPEN:
+                log.warning("Circuit breaker opened")
+            self._state = OPEN
+            self._opened = time.time()
+        finally:
+            self._lock.release()
+
+
+# server uri -> CircuitBreaker
+_BREAKERS = {}
+_LOCK = threading.Lock()
+
+
+def get_breaker(server, threshold=5, reset_timeout=30):
+    """Returns circuit breaker for server, breaker is created with given
+    settings if needed
+    """
+    _LOCK.acquire()
+    try:
+        if server not in _BREAKERS:
+            _BREAKERS[server] = CircuitBreaker(threshold=threshold,
+                reset_timeout=reset_timeout)
+        return _BREAKERS[server]
+    finally:
+        _LOCK.release()
+
+
+def clear():
+    """Drop all circuit breakers
+    """
+    _LOCK.acquire()
+    try:
+        _BREAKERS.clear()
+    finally:
+        _LOCK.release()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 2026-10-18
+@author: Łukasz Mierzwa
+@contact: <l.mierzwa@gmail.com>
+@license: GPLv3: http://www.gnu.org/licenses/gpl-3.0.txt
+
+Cache for parsed server schema. Parsed schema is shared by all Directory
+instances connected to the same server and can also be stored on disk, so
+new processes don't need to download subschema subentry. On disk cache
+stores subschema subentry as LDIF, so reading it can't run any code. Cached
+schema is only used if subschema subentry modifyTimestamp did not change.
+'''
+
+
+import os
+import logging
+import tempfile
+import threading
+try:
+    # this is python >=2.5 module
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+import ldif
+from ldap import schema
+
+from pumpkin.debug import PUMPKIN_LOGLEVEL
+
+
+logging.basicConfig(level=PUMPKIN_LOGLEVEL)
+log = logging.getLogger(__name__)
+
+
+# (server, schema dn) -> (modifyTimestamp, SubSchema instance)
+_SCHEMAS = {}
+_LOCK = threading.Lock()
+
+
+def _cache_file(cache_dir, server, schemadn):
+    """Returns path to on disk cache file for given server schema
+    """
+    key = sha1('%s|%s' % (server, schemadn)).hexdigest()
+    return os.path.join(cache_dir, 'pumpkin-schema-%s.ldif' % key)
+
+
+def _load(cache_dir, server, schemadn, timestamp):
+    """Load schema from on disk cache, returns None if there is no cached
+    schema or it's outdated
+    """
+    path = _cache_file(cache_dir, server, schemadn)
+    if not os.path.exists(path):
+        return None
+    try:
+        cache = open(path, 'rb')
+        try:
+            parser = ldif.LDIFRecordList(cache, max_entries=1)
+            parser.parse()
+        finally:
+            cache.close()
+        (dn, entry) = parser.all_records[0]
+        cached_timestamp = None
+        for attr in entry.keys():
+            if attr.lower() == 'modifytimestamp':
+                cached_timestamp = entry.pop(attr)[0]
+        if cached_timestamp != timestamp:
+            log.debug("Schema cache file '%s' is outdated" % path)
+            return None
+        return schema.SubSchema(entry)
+    except Exception, e:
+        log.warning("Can't read schema cache file '%s': %s" % (path, e))
+        return None
+
+
+def _store(cache_dir, server, schemadn, timestamp, subschema):
+    """Write schema to on disk cache as LDIF, file is replaced atomically so
+    other processes will never read partially written file
+    """
+    path = _cache_file(cache_dir, server, schemadn)
+    entry = subschema.ldap_entry()
+    entry['modifyTimestamp'] = [timestamp]
+    tmppath = None
+    try:
+        try:
+            (fd, tmppath) = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            cache = os.fdopen(fd, 'wb')
+            try:
+                ldif.LDIFWriter(cache).unparse(schemadn, entry)
+            finally:
+                cache.close()
+            os.rename(tmppath, path)
+            tmppath = None
+        except Exception, e:
+            log.warning("Can't write schema cache file '%s': %s" % (path, e))
+    finally:
+        if tmppath is not None:
+            try:
+                os.remove(tmppath)
+            except OSError:
+                pass
+
+
+def get(server, schemadn, timestamp, cache_dir=None):
+    """Returns cached schema for server or None if schema needs to be read
+    from server.
+
+    @param server: LDAP server uri
+    @param schemadn: subschema subentry dn
+    @param timestamp: subschema subentry modifyTimestamp, on disk cache is
+    not used if it's None
+    @param cache_dir: directory with on disk schema cache
+    """
+    _LOCK.acquire()
+    try:
+        cached = _SCHEMAS.get((server, schemadn))
+    finally:
+        _LOCK.release()
+
+    if cached is not None and cached[0] == timestamp:
+        log.debug("Using shared schema for '%s'" % server)
+        return cached[1]
+
+    if cache_dir is not None and timestamp is not None:
+        subschema = _load(cache_dir, server, schemadn, timestamp)
+        if subschema is not None:
+            log.debug("Using schema for '%s' from on disk cache" % server)
+            _LOCK.acquire()
+            try:
+                _SCHEMAS[(server, schemadn)] = (timestamp, subschema)
+            finally:
+                _LOCK.release()
+            return subschema
+
+    return None
+
+
+def put(server, schemadn, timestamp, subschema, cache_dir=None):
+    """Store parsed schema in cache
+    """
+    _LOCK.acquire()
+    try:
+        _SCHEMAS[(server, schemadn)] = (timestamp, subschema)
+    finally:
+        _LOCK.release()
+
+    if cache_dir is not None and timestamp is not None:
+        _store(cache_dir, server, schemadn, timestamp, subschema)
+
+
+def clear():
+    """Drop all schemas from in process cache
+    """
+    _LOCK.acquire()
+    try:
+        _SCHEMAS.clear()
+    finally:
+        _LOCK.release()
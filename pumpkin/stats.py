@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 2026-10-18
+@author: Łukasz Mierzwa
+@contact: <l.mierzwa@gmail.com>
+@license: GPLv3: http://www.gnu.org/licenses/gpl-3.0.txt
+
+Per operation instrumentation used by Directory. Every LDAP request sent to
+server is recorded with its latency, number of returned entries and
+approximate payload size. Counters are available as snapshot dict, observers
+can be registered to export every operation to external metrics system::
+
+    def observer(op):
+        statsd.timing('ldap.%s' % op.name, op.elapsed * 1000)
+
+    directory.add_observer(observer)
+    print directory.stats()['search']['count']
+
+Entries served from entry cache or sync replica are not LDAP operations, so
+they are not recorded.
+
+Slow searches can be logged using SlowLog observer, see
+Directory.enable_slow_log().
+'''
+
+
+import logging
+import threading
+
+import ldap
+
+from pumpkin.debug import PUMPKIN_LOGLEVEL
+
+
+logging.basicConfig(level=PUMPKIN_LOGLEVEL)
+log = logging.getLogger(__name__)
+
+
+#: operation types recorded by Directory
+OPERATIONS = ['search', 'get_attrs', 'modify', 'add', 'delete', 'rename',
+    'passwd', 'bind']
+
+#: asynchronous LDAPObject method -> operation type
+REQUESTS = {
+    'search_ext': 'search',
+    'add_ext': 'add',
+    'modify_ext': 'modify',
+    'delete_ext': 'delete',
+    'rename': 'rename',
+    'passwd': 'passwd',
+}
+
+#: search scope names used in slow log
+SCOPES = {
+    ldap.SCOPE_BASE: 'base',
+    ldap.SCOPE_ONELEVEL: 'one',
+    ldap.SCOPE_SUBTREE: 'sub',
+}
+
+#: upper bounds (in seconds) of latency histogram buckets, operations slower
+#: than last bound are counted in additional bucket
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0]
+
+
+def entries_size(entries):
+    """Returns approximate payload size of (dn, attrs) tuples, sum of dn,
+    attribute names and values lengths
+    """
+    size = 0
+    for (dn, attrs) in entries:
+        size += len(dn or '')
+        size += attrs_size(attrs)
+    return size
+
+
+def attrs_size(attrs):
+    """Returns approximate payload size of attributes dict or list of
+    (attr, values) or (op, attr, values) tuples
+    """
+    if isinstance(attrs, dict):
+        attrs = attrs.items()
+    size = 0
+    for item in attrs or []:
+        (attr, values) = item[-2:]
+        size += len(attr)
+        if isinstance(values, basestring):
+            size += len(values)
+        elif values is not None:
+            for value in values:
+                size += len(value)
+    return size
+
+
+class Operation(object):
+    """Single LDAP operation, passed to observers
+    """
+
+    def __init__(self, name, dn, elapsed=0.0, entries=0, size=0, error=None,
+        scope=None, filter=None, attrs=None):
+        #: operation type, one of OPERATIONS
+        self.name = name
+        #: dn of object or search base
+        self.dn = dn
+        #: number of seconds from sending request to receiving last result
+        self.elapsed = elapsed
+        #: number of entries returned by search
+        self.entries = entries
+        #: approximate number of bytes sent or received
+        self.size = size
+        #: exception raised by operation, None if operation succeeded
+        self.error = error
+        #: search scope
+        self.scope = scope
+        #: final search filter
+        self.filter = filter
+        #: list of requested or modified attributes
+        self.attrs = attrs
+
+    def __repr__(self):
+        return "<Operation %s '%s' %.4fs>" % (self.name, self.dn,
+            self.elapsed)
+
+
+class OperationStats(object):
+    """Counters for single operation type
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.entries = 0
+        self.size = 0
+        self.histogram = [0] * (len(buckets) + 1)
+
+    def add(self, op):
+        """Update counters with operation
+        """
+        self.count += 1
+        if op.error is not None:
+            self.errors += 1
+        self.total += op.elapsed
+        if self.min is None or op.elapsed < self.min:
+            self.min = op.elapsed
+        if self.max is None or op.elapsed > self.max:
+            self.max = op.elapsed
+        self.entries += op.entries
+        self.size += op.size
+        for (pos, bound) in enumerate(self.buckets):
+            if op.elapsed <= bound:
+                self.histogram[pos] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def snapshot(self):
+        """Returns counters as dict, histogram is a list of (upper bound,
+        count) tuples, upper bound of last bucket is None
+        """
+        mean = None
+        if self.count:
+            mean = self.total / self.count
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total': self.total,
+            'mean': mean,
+            'min': self.min,
+            'max': self.max,
+            'entries': self.entries,
+            'size': self.size,
+            'histogram': zip(list(self.buckets) + [None], self.histogram),
+        }
+
+
+class Stats(object):
+    """Operation counters and observers of single Directory instance
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # operation name -> OperationStats
+        self._ops = {}
+        self._observers = []
+
+    def add_observer(self, callback):
+        """Register callable that will be called with Operation instance
+        after every LDAP operation
+        """
+        self._lock.acquire()
+        try:
+            self._observers = self._observers + [callback]
+        finally:
+            self._lock.release()
+
+    def remove_observer(self, callback):
+        """Unregister observer
+        """
+        self._lock.acquire()
+        try:
+            self._observers = [obs for obs in self._observers
+                if obs != callback]
+        finally:
+            self._lock.release()
+
+    def record(self, op):
+        """Record operation and pass it to all observers, exceptions raised
+        by observers are logged and ignored
+        """
+        self._lock.acquire()
+        try:
+            stats = self._ops.get(op.name)
+            if stats is None:
+                stats = OperationStats(buckets=self.buckets)
+                self._ops[op.name] = stats
+            stats.add(op)
+            observers = self._observers
+        finally:
+            self._lock.release()
+        for callback in observers:
+            try:
+                callback(op)
+            except Exception, e:
+                log.error("Operation observer %s failed: %s" % (callback, e))
+
+    def snapshot(self):
+        """Returns dict with operation name -> counters dict, see
+        OperationStats.snapshot(), all types from OPERATIONS are included
+        """
+        self._lock.acquire()
+        try:
+            ret = {}
+            for name in OPERATIONS + self._ops.keys():
+                stats = self._ops.get(name)
+                if stats is None:
+                    stats = OperationStats(buckets=self.buckets)
+                ret[name] = stats.snapshot()
+            return ret
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        """Reset all counters, observers are kept
+        """
+        self._lock.acquire()
+        try:
+            self._ops = {}
+        finally:
+            self._lock.release()
+
+
+class SlowLog(object):
+    """Observer logging operations slower than threshold with search base,
+    scope, final filter, requested attributes and number of returned
+    entries, useful for finding filters that are not indexed on server
+    """
+
+    def __init__(self, threshold=1.0, operations=None, logger=None):
+        """
+        @param threshold: number of seconds, slower operations are logged
+        @param operations: list of logged operation types, default is search
+        and get_attrs
+        @param logger: logger used, default is 'pumpkin.slowlog'
+        """
+        self.threshold = threshold
+        if operations is None:
+            operations = ['search', 'get_attrs']
+        self.operations = operations
+        if logger is None:
+            logger = logging.getLogger('pumpkin.slowlog')
+        self.logger = logger
+
+    def __call__(self, op):
+        if op.name not in self.operations or op.elapsed < self.threshold:
+            return
+        msg = "Slow %s took %.3f seconds: base='%s' scope=%s filter='%s' " \
+            "attrs=%s entries=%d" % (op.name, op.elapsed, op.dn,
+            SCOPES.get(op.scope, op.scope), op.filter, op.attrs, op.entries)
+        if op.error is not None:
+            msg += ' error=%s' % op.error
+        self.logger.warning(msg)
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 2026-10-18
+@author: Łukasz Mierzwa
+@contact: <l.mierzwa@gmail.com>
+@license: GPLv3: http://www.gnu.org/licenses/gpl-3.0.txt
+
+Local replica of selected models kept up to date using LDAP Content
+Synchronization operation (syncrepl, RFC 4533). Background thread runs
+refreshAndPersist search, so changes are received as soon as they are made
+on server. Searches for replicated models are answered from memory, see
+Directory.enable_sync().
+
+Server must support syncrepl (OpenLDAP syncprov overlay) and python-ldap
+must provide ldap.syncrepl module (python-ldap >= 2.4.11).
+'''
+
+
+import logging
+import threading
+
+import ldap
+from ldap.ldapobject import LDAPObject
+from ldap.dn import str2dn, dn2str
+try:
+    from ldap.syncrepl import SyncreplConsumer
+except ImportError:
+    SyncreplConsumer = None
+
+from pumpkin.debug import PUMPKIN_LOGLEVEL
+from pumpkin import filters
+from pumpkin import retry
+from pumpkin import exceptions
+
+
+logging.basicConfig(level=PUMPKIN_LOGLEVEL)
+log = logging.getLogger(__name__)
+
+
+def _normalize(dn):
+    """Returns normalized dn
+    """
+    if isinstance(dn, unicode):
+        dn = dn.encode('utf-8')
+    return dn2str(str2dn(dn)).lower()
+
+
+if SyncreplConsumer is not None:
+    class _Consumer(LDAPObject, SyncreplConsumer):
+        """Syncrepl connection, passes all changes to replica
+        """
+
+        def __init__(self, uri, replica):
+            LDAPObject.__init__(self, uri)
+            self._replica = replica
+
+        def syncrepl_get_cookie(self):
+            return self._replica._cookie
+
+        def syncrepl_set_cookie(self, cookie):
+            self._replica._cookie = cookie
+
+        def syncrepl_entry(self, dn, attrs, uuid):
+            self._replica._entry(dn, attrs, uuid)
+
+        def syncrepl_delete(self, uuids):
+            self._replica._delete(uuids)
+
+        def syncrepl_present(self, uuids, refreshDeletes=False):
+            self._replica._present(uuids, refreshDeletes)
+
+        def syncrepl_refreshdone(self):
+            self._replica._refresh_done()
+
+
+class SyncReplica(object):
+    """In memory replica of all objects matching given models
+    """
+
+    def __init__(self, directory, models, basedn=None, poll_timeout=1):
+        """
+        @param directory: connected Directory instance, its LDAP resource is
+        used to connect
+        @param models: list of model classes to replicate
+        @param basedn: base of replicated subtree, LDAP resource basedn is
+        used if None
+        @param poll_timeout: how often background thread checks if it should
+        stop, in seconds
+        """
+        if SyncreplConsumer is None:
+            raise exceptions.ResourceError(
+                'python-ldap is built without syncrepl support')
+        self.directory = directory
+        self.models = list(models)
+        if basedn is None:
+            basedn = directory.get_basedn()
+        self.basedn = basedn
+        self.poll_timeout = poll_timeout
+
+        parts = []
+        attrs = set(['objectClass'])
+        for model in self.models:
+            parts.append(directory._search_params(model, basedn, True, None)[2])
+            attrs.update(model.ldap_attributes(lazy=True))
+        self._filter = filters.opor(*parts)
+        self._attrlist = list(attrs)
+        # lowercased attribute names that can be used in searched filters
+        self._filter_attrs = set([attr.lower() for attr in attrs])
+
+        self._lock = threading.Lock()
+        # uuid -> (dn, normalized dn, attrs)
+        self._entries = {}
+        # uuids received during refresh phase
+        self._present_uuids = set()
+        self._cookie = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _entry(self, dn, attrs, uuid):
+        """Entry was added or modified
+        """
+        self._lock.acquire()
+        try:
+            self._entries[uuid] = (dn, _normalize(dn), attrs)
+            self._present_uuids.add(uuid)
+        finally:
+            self._lock.release()
+
+    def _delete(self, uuids):
+        """Entries were deleted
+        """
+        self._lock.acquire()
+        try:
+            for uuid in uuids:
+                self._entries.pop(uuid, None)
+        finally:
+            self._lock.release()
+
+    def _present(self, uuids, refresh_deletes):
+        """Present phase message, if uuids is None and refresh_deletes is
+        False all entries that were not sent by server were deleted
+        """
+        self._lock.acquire()
+        try:
+            if uuids is None:
+                if not refresh_deletes:
+                    for uuid in set(self._entries.keys()) - \
+                        self._present_uuids:
+                        del self._entries[uuid]
+                self._present_uuids = set()
+            elif refresh_deletes:
+                for uuid in uuids:
+                    self._entries.pop(uuid, None)
+            else:
+                self._present_uuids.update(uuids)
+        finally:
+            self._lock.release()
+
+    def _refresh_done(self):
+        log.debug("Sync replica of '%s' is ready, %d entries" % (
+            self.basedn, len(self._entries)))
+        self._ready.set()
+
+    def _run(self):
+        """Background thread, keeps syncrepl search running and reconnects
+        after connection errors
+        """
+        attempt = 0
+        while not self._stop.isSet():
+            conn = None
+            try:
+                conn = self.directory._open(self.directory._resource.server,
+                    factory=lambda uri: _Consumer(uri, self))
+                msgid = conn.syncrepl_search(self.directory._encode(
+                    self.basedn), ldap.SCOPE_SUBTREE, mode='refreshAndPersist',
+                    filterstr=self._filter, attrlist=self._attrlist)
+                attempt = 0
+                while not self._stop.isSet():
+                    try:
+                        if not conn.syncrepl_poll(msgid=msgid, all=1,
+                            timeout=self.poll_timeout):
+                            break
+                    except ldap.TIMEOUT:
+                        pass
+            except ldap.LDAPError, e:
+                # replica might be outdated until we reconnect
+                self._ready.clear()
+                delay = retry.backoff(attempt)
+                attempt += 1
+                log.warning("Sync replica of '%s' failed: %s, reconnecting "
+                    "in %.2f seconds" % (self.basedn, exceptions.desc(e),
+                    delay))
+                self._stop.wait(delay)
+            if conn is not None:
+                try:
+                    conn.unbind_s()
+                except ldap.LDAPError:
+                    pass
+
+    def start(self):
+        """Start background thread
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+            name='pumpkin-sync %s' % self.basedn)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop background thread
+        """
+        self._stop.set()
+        self._ready.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wait(self, timeout=None):
+        """Wait until initial content is received, returns True if replica
+        is ready
+        """
+        self._ready.wait(timeout)
+        return self._ready.isSet()
+
+    def _get_ready(self):
+        return self._ready.isSet()
+    ready = property(_get_ready, doc="True if replica is up to date")
+
+    def search(self, model, basedn, scope, search_filter, skip_basedn=False):
+        """Search replica, returns list of (dn, attrs) tuples or None if
+        search can't be answered from replica (replica is not ready, model is
+        not replicated, basedn is outside replica, filter is not supported or
+        uses attributes that are not replicated)
+        """
+        if not self._ready.isSet() or model not in self.models:
+            return None
+        nbase = _normalize(basedn)
+        root = _normalize(self.basedn)
+        if nbase != root and not nbase.endswith(',' + root):
+            return None
+        try:
+            tree = filters.parse(search_filter)
+        except ValueError, e:
+            log.debug("Can't search sync replica: %s" % e)
+            return None
+        missing = filters.attributes(tree) - self._filter_attrs
+        if missing:
+            log.debug("Can't search sync replica, attributes not replicated: "
+                "%s" % ', '.join(sorted(missing)))
+            return None
+
+        depth = len(str2dn(nbase))
+        self._lock.acquire()
+        try:
+            entries = self._entries.values()
+        finally:
+            self._lock.release()
+
+        ret = []
+        for (dn, ndn, attrs) in entries:
+            if ndn == nbase:
+                if skip_basedn or scope == ldap.SCOPE_ONELEVEL:
+                    continue
+            elif scope == ldap.SCOPE_BASE or not ndn.endswith(',' + nbase):
+                continue
+            elif scope == ldap.SCOPE_ONELEVEL and \
+                len(str2dn(ndn)) != depth + 1:
+                continue
+            if filters.match(tree, attrs):
+                entry = dict([(attr, None) for attr in
+                    model.ldap_attributes(lazy=True)])
+                for (attr, values) in attrs.items():
+                    entry[attr] = list(values)
+                ret.append((dn, entry))
+        return ret
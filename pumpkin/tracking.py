@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 2026-10-18
+@author: Łukasz Mierzwa
+@contact: <l.mierzwa@gmail.com>
+@license: GPLv3: http://www.gnu.org/licenses/gpl-3.0.txt
+
+Query tracking used to find code that makes too many LDAP round trips.
+Reading field that was not fetched with the object (lazy fields, objects
+created with only some attributes) makes base search for every object, so
+loops over search results can silently make one LDAP operation per object::
+
+    with directory.track_queries(strict=True, budget=5) as tracker:
+        for user in directory.search(PosixUser):
+            user.photo
+    print tracker.report()
+
+Every operation is recorded with the place in code outside pumpkin package
+that triggered it. In strict mode QueryBudgetExceeded is raised when block
+ends if number of implicit lazy loads is greater than budget.
+'''
+
+
+import os
+import sys
+import logging
+import threading
+import traceback
+
+from pumpkin.debug import PUMPKIN_LOGLEVEL
+from pumpkin.base import Model
+from pumpkin import exceptions
+
+
+logging.basicConfig(level=PUMPKIN_LOGLEVEL)
+log = logging.getLogger(__name__)
+
+
+# frames from files in this directory are skipped when looking for call site
+_PUMPKIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# lazy loads are made from Model._get_attr()
+_GET_ATTR_CODE = Model._get_attr.im_func.func_code
+
+
+def _internal(frame):
+    return os.path.abspath(frame.f_code.co_filename).startswith(
+        _PUMPKIN_DIR + os.sep)
+
+
+class TrackedQuery(object):
+    """LDAP operation recorded by QueryTracker
+    """
+
+    def __init__(self, op, call_site, stack, lazy_load=None):
+        #: pumpkin.stats.Operation instance
+        self.op = op
+        #: (filename, line number, function name) of code outside pumpkin
+        #: that triggered operation
+        self.call_site = call_site
+        #: stack trace ending at call site, as returned by
+        #: traceback.extract_stack()
+        self.stack = stack
+        #: (model class name, LDAP attribute) tuple if operation is implicit
+        #: lazy load, None otherwise
+        self.lazy_load = lazy_load
+
+    def _get_implicit(self):
+        return self.lazy_load is not None
+    implicit = property(_get_implicit,
+        doc="True if operation was made by reading not fetched field")
+
+    def __repr__(self):
+        return "<TrackedQuery %s '%s' at %s:%d>" % (self.op.name, self.op.dn,
+            self.call_site[0], self.call_site[1])
+
+
+class QueryTracker(object):
+    """Records all LDAP operations made by directory while active, use as
+    context manager or call start() and stop()
+    """
+
+    def __init__(self, directory, strict=False, budget=0, all_threads=False,
+        stack_limit=10):
+        """
+        @param directory: Directory instance
+        @param strict: raise QueryBudgetExceeded when tracking stops if there
+        were more than budget implicit lazy loads
+        @param budget: number of allowed implicit lazy loads
+        @param all_threads: record operations made by all threads, by default
+        only operations made by thread that started tracking are recorded
+        @param stack_limit: number of stack frames stored for every operation
+        """
+        self.directory = directory
+        self.strict = strict
+        self.budget = budget
+        self.all_threads = all_threads
+        self.stack_limit = stack_limit
+        #: list of TrackedQuery instances
+        self.queries = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+        if exc_type is None:
+            self.check()
+        return False
+
+    def start(self):
+        """Start recording operations
+        """
+        self._thread = threading.currentThread()
+        self.directory.add_observer(self._observe)
+
+    def stop(self):
+        """Stop recording operations
+        """
+        self.directory.remove_observer(self._observe)
+
+    def _observe(self, op):
+        """Observer registered in directory
+        """
+        if not self.all_threads and \
+            threading.currentThread() is not self._thread:
+            return
+        lazy_load = None
+        frame = sys._getframe(1)
+        while frame is not None and _internal(frame):
+            if frame.f_code is _GET_ATTR_CODE and lazy_load is None:
+                lazy_load = (frame.f_locals['self'].__class__.__name__,
+                    frame.f_locals.get('attr'))
+            frame = frame.f_back
+        if frame is None:
+            call_site = ('<unknown>', 0, '<unknown>')
+            stack = []
+        else:
+            call_site = (frame.f_code.co_filename, frame.f_lineno,
+                frame.f_code.co_name)
+            stack = traceback.extract_stack(frame, limit=self.stack_limit)
+        query = TrackedQuery(op, call_site, stack, lazy_load=lazy_load)
+        self._lock.acquire()
+        try:
+            self.queries.append(query)
+        finally:
+            self._lock.release()
+        if lazy_load is not None:
+            log.debug("Implicit lazy load of '%s' for '%s' at %s:%d" % (
+                lazy_load[1], op.dn, call_site[0], call_site[1]))
+
+    def _get_count(self):
+        return len(self.queries)
+    count = property(_get_count, doc="Number of recorded operations")
+
+    def _get_implicit(self):
+        return [query for query in self.queries if query.implicit]
+    implicit = property(_get_implicit,
+        doc="List of operations made by implicit lazy loads")
+
+    def by_call_site(self):
+        """Returns dict with (call site, operation name) -> list of
+        TrackedQuery instances
+        """
+        ret = {}
+        for query in self.queries:
+            ret.setdefault((query.call_site, query.op.name), []).append(query)
+        return ret
+
+    def report(self):
+        """Returns human readable summary of recorded operations grouped by
+        call site, most frequent first
+        """
+        lines = ['%d LDAP operations, %d implicit lazy loads' % (
+            self.count, len(self.implicit))]
+        groups = self.by_call_site().items()
+        groups.sort(key=lambda item: -len(item[1]))
+        for (((filename, lineno, func), name), queries) in groups:
+            line = '%5dx %s at %s:%d in %s' % (len(queries), name, filename,
+                lineno, func)
+            loads = sorted(set(['%s.%s' % query.lazy_load
+                for query in queries if query.implicit]))
+            if loads:
+                line += ' (implicit: %s)' % ', '.join(loads)
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def check(self):
+        """Raise QueryBudgetExceeded if strict mode is on and there were more
+        implicit lazy loads than budget
+        """
+        if self.strict and len(self.implicit) > self.budget:
+            raise exceptions.QueryBudgetExceeded(
+                'Implicit lazy loads budget (%d) exceeded\n%s' % (
+                self.budget, self.report()))
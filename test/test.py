@@ -6,20 +6,31 @@
 from pumpkin import resource
 from pumpkin.filters import *
 from pumpkin.fields import *
-from pumpkin.base import Model
+from pumpkin.base import Model, _model
 from pumpkin.models import PosixGroup, PosixUser, Unit
 from pumpkin import exceptions
 from pumpkin.serialize import pickle_object, unpickle_object
 from pumpkin import resource
 from pumpkin.directory import Directory
+from pumpkin.pool import PooledDirectory
+from pumpkin.memory import MemoryStore, MemoryDirectory
+from pumpkin import schemacache
+from pumpkin import retry
 
+import ldap
 import nose
 import unittest
+import logging
+import gc
 import time
+import threading
 import datetime
+import os
+import shutil
+import tempfile
 from dateutil import tz
 
-from conn import LDAP_CONN, ANON_CONN, SERVER, BASEDN
+from conn import LDAP_CONN, LDAP_RES, ANON_CONN, SERVER, BASEDN
 
 
 class QA(Model):
@@ -268,6 +279,40 @@ class Test(unittest.TestCase):
                 'cn=Max Blank,ou=users,dc=company,dc=com'
         )
 
+    def test_paged_search(self):
+        """Test searching for objects using paged results control
+        """
+        expected = [obj.dn for obj in LDAP_CONN.search(PosixUser)]
+        self.assertTrue(len(expected) > 1)
+
+        # every page is recorded as separate search operation
+        ops = []
+        LDAP_CONN.add_observer(ops.append)
+        try:
+            self.assertEqual(
+                [obj.dn for obj in LDAP_CONN.search(PosixUser, page_size=1)],
+                expected
+            )
+        finally:
+            LDAP_CONN.remove_observer(ops.append)
+        pages = [op for op in ops if op.name == 'search']
+        self.assertTrue(len(pages) >= len(expected))
+        self.assertEqual(sum([op.entries for op in pages]), len(expected))
+
+    def test_iter_search(self):
+        """Test iterating over search results
+        """
+        users = LDAP_CONN.iter_search(PosixUser)
+        self.assertEqual(
+            [obj.dn for obj in users],
+            [obj.dn for obj in LDAP_CONN.search(PosixUser)]
+        )
+
+        # break iteration after first object, search should be abandoned
+        for obj in LDAP_CONN.iter_search(PosixUser, page_size=1):
+            self.assertTrue(isinstance(obj, PosixUser))
+            break
+
     def test_move(self):
         """Test moving object
         """
@@ -606,6 +651,8 @@ class Test(unittest.TestCase):
 
         ou = Unit(LDAP_CONN,  "ou=unit1,%s" % LDAP_CONN.get_basedn())
         ou.delete(recursive=True)
+        self.assertRaises(exceptions.ObjectNotFound, Unit, LDAP_CONN,
+            "ou=unit1,%s" % LDAP_CONN.get_basedn())
 
 
     @nose.tools.raises(exceptions.DeleteOnNew)
@@ -955,3 +1002,772 @@ class Test(unittest.TestCase):
             u'ou=l1_1,ou=l1,ou=renamed_łóźććżą,dc=company,dc=com')
         self.assertEqual(l1_1.name, u'l1_1')
         self.assertEqual(l1_1.description, u'l1_1 unit')
+
+    def test_pooled_directory(self):
+        """Test running searches from multiple threads using connection pool
+        """
+        pool = PooledDirectory(size=2)
+        pool.connect(LDAP_RES)
+        expected = [obj.dn for obj in LDAP_CONN.search(PosixUser)]
+
+        results = []
+        def worker():
+            for i in range(5):
+                results.append([obj.dn for obj in pool.search(PosixUser)])
+
+        threads = [threading.Thread(target=worker) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 20)
+        for dns in results:
+            self.assertEqual(dns, expected)
+        self.assertTrue(pool._count <= 2)
+
+        # connection is only available during operation
+        self.assertRaises(exceptions.NotCheckedOut, getattr, pool,
+            '_ldapconn')
+        # abandoned iteration returns connection to the pool
+        for obj in pool.iter_search(PosixUser):
+            break
+        self.assertEqual(len(pool._idle), pool._count)
+        # idle connections are replaced on connect
+        idle = [conn for (conn, used) in pool._idle]
+        pool.connect(LDAP_RES)
+        self.assertEqual(pool._count, 1)
+        self.assertFalse(pool._idle[0][0] in idle)
+        pool.disconnect()
+
+    def test_schema_cache(self):
+        """Test sharing parsed schema between Directory instances and caching
+        it on disk
+        """
+        conn = Directory()
+        conn.connect(LDAP_RES)
+        self.assertTrue(conn._schema is LDAP_CONN._schema)
+        conn.disconnect()
+
+        cache_dir = tempfile.mkdtemp()
+        res = resource.LDAPResource()
+        res.server = SERVER
+        res.basedn = BASEDN
+        res.schema_cache_dir = cache_dir
+        try:
+            schemacache.clear()
+            conn = Directory()
+            conn.connect(res)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            self.assertTrue(os.listdir(cache_dir)[0].endswith('.ldif'))
+            conn.disconnect()
+
+            schemacache.clear()
+            conn = Directory()
+            conn.connect(res)
+            self.assertEqual(
+                conn.get_schema_attrs(PosixGroup),
+                LDAP_CONN.get_schema_attrs(PosixGroup)
+            )
+            conn.disconnect()
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_object_class_lookup(self):
+        """Test case insensitive object class lookup
+        """
+        self.assertTrue(
+            'posixAccount' in LDAP_CONN._get_oc_inst('POSIXACCOUNT').names)
+        self.assertRaises(exceptions.SchemaValidationError,
+            LDAP_CONN._get_oc_inst, 'invalidClass')
+
+    def test_schema_attrs(self):
+        """Test reading must and may attributes for model
+        """
+        (must, may) = LDAP_CONN.get_schema_attrs(PosixGroup)
+        self.assertTrue('cn' in must)
+        self.assertTrue('gidNumber' in must)
+        self.assertTrue('memberUid' in may)
+        self.assertFalse(must & may)
+        # second call should return cached result
+        self.assertTrue(LDAP_CONN.get_schema_attrs(PosixGroup) is
+            LDAP_CONN.get_schema_attrs(PosixGroup))
+
+    def test_validate_models(self):
+        """Test validating models against schema
+        """
+        LDAP_CONN.validate_models(PosixUser, PosixGroup, Unit)
+        self.assertTrue(PosixUser in LDAP_CONN._validated)
+        self.assertRaises(exceptions.SchemaValidationError,
+            LDAP_CONN.validate_models, BrokenModel)
+        self.assertFalse(BrokenModel in LDAP_CONN._validated)
+
+        # models created at runtime are not kept alive by registry
+        class RuntimeModel(Unit):
+            pass
+        self.assertTrue(RuntimeModel in _model.models)
+        count = len(_model.models)
+        del RuntimeModel
+        gc.collect()
+        self.assertEqual(len(_model.models), count - 1)
+
+    def test_get_many(self):
+        """Test fetching multiple objects by dn
+        """
+        dns = [
+            u'cn=test_dict,ou=users,dc=company,dc=com',
+            u'cn=Max Blank,ou=users,dc=company,dc=com',
+            u'cn=InvalidDN,ou=users,dc=company,dc=com',
+            u'cn=hook_user,ou=users,dc=company,dc=com',
+            u'cn=InvalidParent,ou=invalid,dc=company,dc=com',
+        ]
+        users = LDAP_CONN.get_many(PosixUser, dns)
+        self.assertEqual([user.dn for user in users],
+            [dns[0], dns[1], dns[3]])
+        self.assertEqual(users[1].login, u'max.blank')
+
+        # objects not matching model are skipped
+        self.assertEqual(LDAP_CONN.get_many(PosixGroup, dns), [])
+
+        attrs = LDAP_CONN.get_attrs_many(dns, ['uidNumber', 'roomNumber'])
+        self.assertEqual(attrs[dns[1]]['uidNumber'], ['1000'])
+        self.assertEqual(attrs[dns[1]]['roomNumber'], None)
+        self.assertFalse(dns[2] in attrs)
+
+    def test_objectlist_prefetch(self):
+        """Test prefetching lazy fields for all objects in list
+        """
+        users = LDAP_CONN.search(QA)
+        self.assertFalse(users[0]._isstored('cn'))
+        users.prefetch('string', 'lazy_binary')
+        for user in users:
+            self.assertTrue(user._isstored('cn'))
+            self.assertTrue(user._isstored('userCertificate'))
+        self.assertEqual(
+            users.by_dn('cn=Max Blank,ou=users,dc=company,dc=com').string,
+            u'Max Blank')
+
+    def test_inherited_fields(self):
+        """Test class level access to inherited fields
+        """
+        self.assertEqual(DateTimeListTest.dtlist, 'mobile')
+        self.assertEqual(DateTimeListTest.uid, 'uid')
+        self.assertEqual(DateTimeListTest.object_class, 'objectClass')
+        self.assertTrue('dtlist' in DateTimeListTest._get_fields())
+        self.assertFalse('dtlist' in QA._get_fields())
+        self.assertEqual(
+            sorted(DateTimeListTest.ldap_attributes()),
+            sorted(QA.ldap_attributes() + ['mobile'])
+        )
+
+    def test_save_dirty(self):
+        """Test saving only modified attributes
+        """
+        pg = PosixGroup(LDAP_CONN, 'cn=nazwa2,ou=groups,dc=company,dc=com')
+        self.assertEqual(pg.get_attributes(dirty=True), {})
+        pg.members = [1, 2]
+        self.assertEqual(pg.get_attributes(dirty=True), {
+            'memberUid': ['1', '2']})
+        pg.save()
+        self.assertEqual(pg.get_attributes(dirty=True), {})
+
+        pg2 = PosixGroup(LDAP_CONN, pg.dn)
+        self.assertEqual(sorted(pg2.members), [1, 2])
+        del pg2.members
+        pg2.save()
+        pg.update()
+        self.assertEqual(pg.members, [])
+
+    def test_save_multivalued_diff(self):
+        """Test saving only added and removed values of multi valued field
+        """
+        pg = PosixGroup(LDAP_CONN, 'cn=testgroup,ou=groups,dc=company,dc=com')
+        pg.members = [7001, 7002, 7003]
+        pg.save()
+
+        pg.add_member(7004)
+        pg.remove_member(7001)
+        self.assertEqual(
+            pg._split_modifications(pg.get_attributes(dirty=True)),
+            ({}, {'memberUid': ['7004']}, {'memberUid': ['7001']})
+        )
+
+        # value added by other client should not be overwritten
+        LDAP_CONN.add_values(pg.dn, 'memberUid', ['7005'])
+        pg.save()
+        pg.update()
+        self.assertEqual(sorted(pg.members), [7002, 7003, 7004, 7005])
+
+        LDAP_CONN.remove_values(pg.dn, 'memberUid', ['7005'])
+        self.assertRaises(exceptions.NoSuchValue, LDAP_CONN.remove_values,
+            pg.dn, 'memberUid', ['7005'])
+        del pg.members
+        pg.save()
+
+    def test_save_multivalued_conflict(self):
+        """Test saving multi valued field changed concurrently by other client
+        """
+        pg = PosixGroup(LDAP_CONN, 'cn=testgroup,ou=groups,dc=company,dc=com')
+        pg.members = [7001, 7002, 7003]
+        pg.save()
+
+        pg.update()
+        self.assertEqual(sorted(pg.members), [7001, 7002, 7003])
+        # other client removes value that we also remove and adds value that
+        # we also add
+        LDAP_CONN.remove_values(pg.dn, 'memberUid', ['7001', '7003'])
+        LDAP_CONN.add_values(pg.dn, 'memberUid', ['7004'])
+        pg.remove_member(7001)
+        pg.add_member(7004)
+        pg.add_member(7005)
+        pg.gid = 7100
+        pg.save()
+        self.assertEqual(sorted(pg.members), [7002, 7004, 7005])
+
+        pg = PosixGroup(LDAP_CONN, pg.dn)
+        self.assertEqual(sorted(pg.members), [7002, 7004, 7005])
+        # unrelated attributes are saved too
+        self.assertEqual(pg.gid, 7100)
+        del pg.members
+        pg.save()
+
+    def test_copy_subtree(self):
+        """Test copying object with all children
+        """
+        basedn = LDAP_CONN.get_basedn()
+        LDAP_CONN.copy(u'ou=rename,%s' % basedn, u'ou=copied,%s' % basedn,
+            recursive=True)
+
+        copied = Unit(LDAP_CONN, u'ou=copied,%s' % basedn)
+        self.assertEqual(copied.name, u'copied')
+        l1_2 = LDAP_CONN.get(Unit, search_filter=eq(Unit.name, 'l1_2'),
+            basedn=copied.dn)
+        self.assertEqual(l1_2.dn, u'ou=l1_2,ou=l1,ou=copied,%s' % basedn)
+        original = LDAP_CONN.search(Unit, basedn=u'ou=rename,%s' % basedn)
+        self.assertEqual(len(LDAP_CONN.search(Unit, basedn=copied.dn)),
+            len(original))
+
+        copied.delete(recursive=True)
+
+    def test_batch(self):
+        """Test pipelined batch operations
+        """
+        basedn = LDAP_CONN.get_basedn()
+        dns = [u'ou=batch%d,%s' % (i, basedn) for i in range(20)]
+
+        batch = LDAP_CONN.batch(window=5)
+        for (i, dn) in enumerate(dns):
+            batch.add(dn, {'objectClass': ['organizationalUnit'],
+                'ou': ['batch%d' % i]})
+        # already exists
+        failed = batch.add(dns[0], {'objectClass': ['organizationalUnit'],
+            'ou': ['batch0']})
+        batch.flush()
+        self.assertEqual(len(batch.operations), 21)
+        self.assertEqual(batch.errors, [failed])
+        self.assertRaises(Exception, batch.check)
+
+        batch = LDAP_CONN.batch()
+        batch.__enter__()
+        for dn in dns:
+            batch.modify(dn, replace={'description': ['batch']})
+        batch.__exit__(None, None, None)
+        self.assertEqual(batch.errors, [])
+        self.assertEqual(LDAP_CONN.get_attr(dns[19], 'description'),
+            ['batch'])
+
+        batch = LDAP_CONN.batch()
+        for dn in dns:
+            batch.delete(dn)
+        missing = batch.delete(dns[0])
+        batch.flush()
+        self.assertTrue(isinstance(missing.error, exceptions.ObjectNotFound))
+        self.assertEqual([op for op in batch.operations if op.ok],
+            batch.operations[:20])
+
+    def test_async_directory(self):
+        """Test asyncio front end
+        """
+        try:
+            from pumpkin.aio import AsyncDirectory, asyncio
+        except ImportError:
+            raise nose.SkipTest("asyncio is not available")
+
+        loop = asyncio.new_event_loop()
+        adir = AsyncDirectory(LDAP_CONN, loop=loop)
+        basedn = LDAP_CONN.get_basedn()
+        try:
+            units = []
+            for i in range(10):
+                unit = Unit(LDAP_CONN)
+                unit.set_parent(basedn)
+                unit.name = u'async%d' % i
+                units.append(unit)
+            loop.run_until_complete(asyncio.gather(
+                *[adir.save(unit) for unit in units]))
+            self.assertFalse(units[0].isnew())
+
+            found = loop.run_until_complete(adir.search(Unit,
+                search_filter=eq(Unit.name, 'async*')))
+            self.assertEqual(sorted([unit.name for unit in found]),
+                sorted([unit.name for unit in units]))
+
+            units[1].description = u'async'
+            loop.run_until_complete(adir.save(units[1]))
+            unit = loop.run_until_complete(adir.get(Unit,
+                search_filter=eq(Unit.name, 'async1')))
+            self.assertEqual(unit.description, u'async')
+
+            self.assertRaises(exceptions.ObjectNotFound,
+                loop.run_until_complete, adir.search(Unit,
+                basedn=u'ou=missing,%s' % basedn))
+
+            loop.run_until_complete(asyncio.gather(
+                *[adir.delete(unit) for unit in units]))
+            self.assertEqual(loop.run_until_complete(adir.get(Unit,
+                search_filter=eq(Unit.name, 'async1'))), None)
+        finally:
+            adir.close()
+            loop.close()
+
+    def test_backoff(self):
+        """Test reconnect backoff delays
+        """
+        for attempt in range(10):
+            delay = retry.backoff(attempt, base=0.5, cap=4)
+            self.assertTrue(0 <= delay <= min(4, 0.5 * 2 ** attempt))
+
+    def test_circuit_breaker(self):
+        """Test circuit breaker states
+        """
+        breaker = retry.CircuitBreaker(threshold=3, reset_timeout=1)
+        for i in range(2):
+            breaker.failure()
+            self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.state, retry.OPEN)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(1)
+        # single probe is allowed
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.state, retry.OPEN)
+
+        time.sleep(1)
+        self.assertTrue(breaker.allow())
+        breaker.success()
+        self.assertEqual(breaker.state, retry.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_reconnect_circuit_open(self):
+        """Test that reconnect fails fast when server is down
+        """
+        res = resource.LDAPResource()
+        res.server = 'ldap://localhost:1'
+        res.basedn = BASEDN
+        res.timeout = 1
+        res.reconnect_attempts = 5
+        res.reconnect_backoff = 0.01
+        res.breaker_threshold = 2
+        conn = Directory()
+        conn._resource = res
+        conn._ldapconn = ldap.initialize(res.server)
+        conn._connected = True
+
+        try:
+            self.assertRaises(exceptions.CircuitOpen, conn.get_attrs,
+                u'ou=missing,%s' % BASEDN, ['ou'])
+            self.assertEqual(retry.get_breaker(res.server).state, retry.OPEN)
+            # open breaker fails without connecting
+            start = time.time()
+            self.assertRaises(exceptions.CircuitOpen, conn.get_attrs,
+                u'ou=missing,%s' % BASEDN, ['ou'])
+            self.assertTrue(time.time() - start < 1)
+        finally:
+            retry.clear()
+
+    def test_reconnect_probe_failure(self):
+        """Test that failed probe of half open breaker opens it again
+        """
+        res = resource.LDAPResource()
+        res.server = 'ldap://localhost:1'
+        res.basedn = BASEDN
+        res.reconnect_attempts = 1
+        res.breaker_threshold = 1
+        res.breaker_timeout = 0
+        conn = Directory()
+        conn._resource = res
+        conn._ldapconn = ldap.initialize(res.server)
+        conn._connected = True
+        def connect():
+            raise exceptions.InvalidAuth('Invalid credentials')
+        conn._connect = connect
+        try:
+            breaker = retry.get_breaker(res.server, threshold=1,
+                reset_timeout=0)
+            breaker.failure()
+            self.assertRaises(exceptions.InvalidAuth, conn.get_attrs,
+                u'ou=missing,%s' % BASEDN, ['ou'])
+            self.assertEqual(breaker.state, retry.OPEN)
+        finally:
+            retry.clear()
+
+    def test_replicas(self):
+        """Test sending reads to replicas with failover
+        """
+        res = resource.LDAPResource()
+        res.server = SERVER
+        res.login = LDAP_RES.login
+        res.password = LDAP_RES.password
+        res.basedn = BASEDN
+        res.timeout = 1
+        res.replicas = ['ldap://localhost:2', 'ldap://127.0.0.1:1389']
+        res.read_strategy = resource.LEAST_OUTSTANDING
+        conn = Directory()
+        conn.connect(res)
+
+        for i in range(3):
+            self.assertTrue(len(conn.search(Unit)) > 0)
+        stats = conn.replica_stats()
+        # failed replica is marked as down
+        self.assertEqual(stats['ldap://localhost:2']['state'], 'open')
+        self.assertEqual(stats['ldap://127.0.0.1:1389']['outstanding'], 0)
+        self.assertTrue(stats['ldap://127.0.0.1:1389']['latency'] > 0)
+        self.assertEqual(conn.get_attr(u'ou=groups,%s' % BASEDN, 'ou'),
+            ['groups'])
+
+        # reads after write are sent to server
+        conn.set_attr(u'ou=groups,%s' % BASEDN, 'description', ['pinned'])
+        self.assertTrue(conn._pinned_until > time.time())
+        self.assertEqual(conn.get_attr(u'ou=groups,%s' % BASEDN,
+            'description'), ['pinned'])
+        conn.set_attr(u'ou=groups,%s' % BASEDN, 'description', None)
+
+        # all replicas are down, provider is used
+        res.replicas = ['ldap://localhost:2']
+        res.read_strategy = resource.ROUND_ROBIN
+        conn.connect(res)
+        self.assertTrue(len(conn.search(Unit)) > 0)
+        conn.disconnect()
+        retry.clear()
+
+    def test_entry_cache(self):
+        """Test entry cache and invalidation on writes
+        """
+        conn = Directory()
+        conn.connect(LDAP_RES)
+        conn.enable_cache(size=100, ttl=60, negative_ttl=60)
+        basedn = LDAP_CONN.get_basedn()
+        try:
+            units = conn.search(Unit)
+            self.assertEqual(conn.cache_stats()['misses'], 1)
+            self.assertEqual(len(conn.search(Unit)), len(units))
+            self.assertEqual(conn.cache_stats()['hits'], 1)
+
+            # change made by other client is not visible
+            unit = units[0]
+            before = conn.get_attr(unit.dn, 'description')
+            LDAP_CONN.set_attr(unit.dn, 'description', ['external'])
+            self.assertEqual(conn.get_attr(unit.dn, 'description'), before)
+
+            # write made with the same directory invalidates cache
+            conn.set_attr(unit.dn, 'description', ['cached'])
+            self.assertEqual(
+                conn.get_attr(unit.dn, 'description'), ['cached'])
+            conn.set_attr(unit.dn, 'description', before)
+
+            # missing objects are cached too
+            dn = u'ou=cached,%s' % basedn
+            self.assertRaises(exceptions.ObjectNotFound, conn.get_attr, dn,
+                'ou')
+            self.assertEqual(conn.get(Unit, search_filter=eq(Unit.name,
+                'cached')), None)
+            LDAP_CONN.add_object(dn, {'objectClass': ['organizationalUnit'],
+                'ou': ['cached']})
+            self.assertRaises(exceptions.ObjectNotFound, conn.get_attr, dn,
+                'ou')
+            self.assertEqual(conn.get(Unit, search_filter=eq(Unit.name,
+                'cached')), None)
+
+            unit = Unit(LDAP_CONN, dn)
+            unit.description = u'before'
+            unit.save()
+            conn.delete(dn)
+            conn.add_object(dn, {'objectClass': ['organizationalUnit'],
+                'ou': ['cached'], 'description': ['after']})
+            self.assertEqual(conn.get(Unit, search_filter=eq(Unit.name,
+                'cached')).description, u'after')
+            conn.delete(dn)
+            self.assertEqual(conn.get(Unit, search_filter=eq(Unit.name,
+                'cached')), None)
+        finally:
+            conn.disable_cache()
+            conn.disconnect()
+
+    def test_sync_replica(self):
+        """Test answering searches from syncrepl replica
+        """
+        conn = Directory()
+        conn.connect(LDAP_RES)
+        replica = conn.enable_sync([Unit], timeout=10)
+        basedn = LDAP_CONN.get_basedn()
+        try:
+            self.assertTrue(replica.ready)
+            units = conn.search(Unit)
+            self.assertEqual(sorted([unit.dn for unit in units]),
+                sorted([unit.dn for unit in LDAP_CONN.search(Unit)]))
+            self.assertEqual(
+                replica.search(Unit, basedn, ldap.SCOPE_SUBTREE,
+                    conn._search_params(Unit, basedn, True, None)[2]) is None,
+                False)
+
+            # models that are not replicated are searched on server
+            self.assertEqual(replica.search(PosixGroup, basedn,
+                ldap.SCOPE_SUBTREE, '(objectClass=posixGroup)'), None)
+            # filters on attributes that are not replicated too
+            self.assertEqual(replica.search(Unit, basedn, ldap.SCOPE_SUBTREE,
+                '(&(objectClass=organizationalUnit)(postalCode=1))'), None)
+
+            unit = Unit(LDAP_CONN)
+            unit.set_parent(basedn)
+            unit.name = u'synced'
+            unit.save()
+            for i in range(50):
+                found = conn.get(Unit, search_filter=eq(Unit.name, 'synced'))
+                if found is not None:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(found.dn, unit.dn)
+            self.assertEqual(conn.search(Unit, basedn=unit.dn,
+                recursive=False, skip_basedn=True), [])
+
+            unit.delete()
+            for i in range(50):
+                found = conn.get(Unit, search_filter=eq(Unit.name, 'synced'))
+                if found is None:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(found, None)
+        finally:
+            conn.disable_sync()
+            conn.disconnect()
+
+    def test_filter_match(self):
+        """Test matching entries against LDAP filters
+        """
+        attrs = {'objectClass': ['top', 'posixGroup'], 'cn': ['Admins'],
+            'gidNumber': ['500'], 'memberUid': ['a*b']}
+        self.assertTrue(match(opand(eq('objectClass', 'posixgroup'),
+            eq('cn', 'admins')), attrs))
+        self.assertTrue(match(startswith('cn', 'Adm'), attrs))
+        self.assertTrue(match(contains('cn', 'MIN'), attrs))
+        self.assertTrue(match('(gidNumber>=100)', attrs))
+        self.assertFalse(match('(gidNumber<=100)', attrs))
+        self.assertTrue(match('(memberUid=a\\2ab)', attrs))
+        # operator characters in assertion value
+        self.assertTrue(match('(cn=adm>=ins)', {'cn': ['Adm>=ins']}))
+        self.assertFalse(match('(cn=adm<=ins)', attrs))
+        self.assertFalse(match(opnot(present('cn')), attrs))
+        self.assertTrue(match(opor(eq('cn', 'x'), present('memberUid')),
+            attrs))
+        self.assertRaises(ValueError, match, '(cn:dn:=Admins)', attrs)
+        self.assertRaises(ValueError, match, '(cn=Admins', attrs)
+
+    def test_memory_directory(self):
+        """Test in memory directory backend
+        """
+        path = os.path.join(os.path.dirname(__file__), 'openldap')
+        store = MemoryStore()
+        store.load_schema(*[os.path.join(path, 'schema', '%s.schema' % name)
+            for name in ['core', 'cosine', 'inetorgperson', 'nis', 'dhcp']])
+        store.load_ldif(os.path.join(path, 'base.ldif'))
+        res = resource.LDAPResource()
+        res.server = 'memory://'
+        res.basedn = BASEDN
+        conn = MemoryDirectory(store)
+        conn.connect(res)
+        basedn = conn.get_basedn()
+
+        self.assertEqual(len(conn.search(PosixGroup)), 3)
+        self.assertEqual(len(conn.search(Unit, recursive=False)), 5)
+        group = conn.get(PosixGroup, search_filter=eq(PosixGroup.gid, 345))
+        self.assertEqual(group.name, 'nazwa')
+        self.assertEqual(group.members, [1002])
+
+        self.assertEqual(len(conn.search(Unit, page_size=2)), 11)
+
+        group.name = u'memory'
+        group.members = [1, 2]
+        group.save()
+        group = conn.get(PosixGroup, search_filter=eq(PosixGroup.name,
+            'memory'))
+        self.assertEqual(group.members, [1, 2])
+        self.assertEqual(group.dn, u'cn=memory,ou=groups,%s' % basedn)
+
+        unit = Unit(conn)
+        unit.name = u'memory'
+        unit.set_parent(basedn)
+        self.assertRaises(exceptions.SchemaViolation,
+            conn.add_object, unit.dn, {'objectClass': ['organizationalUnit'],
+            'ou': ['memory'], 'uid': ['foo']})
+        unit.save()
+        self.assertRaises(exceptions.ObjectNotFound, conn.add_object,
+            u'ou=child,ou=missing,%s' % basedn, {
+            'objectClass': ['organizationalUnit'], 'ou': ['child']})
+        self.assertRaises(ldap.ALREADY_EXISTS, conn.add_object,
+            unit.dn, {'objectClass': ['organizationalUnit'], 'ou': ['memory']})
+
+        conn.copy(u'ou=rename,%s' % basedn, u'ou=copy,%s' % unit.dn,
+            recursive=True)
+        self.assertEqual(len(conn.search(Unit, basedn=unit.dn)), 5)
+        self.assertRaises(exceptions.DeleteOnParent, conn.delete, unit.dn)
+        conn.delete(unit.dn, recursive=True)
+        self.assertEqual(conn.search(Unit, search_filter=eq(Unit.name,
+            'memory')), [])
+        self.assertRaises(exceptions.ObjectNotFound, conn.get_attr,
+            u'ou=l1,ou=copy,%s' % unit.dn, 'ou')
+
+    def test_operation_stats(self):
+        """Test operation counters and observers
+        """
+        conn = Directory()
+        conn.connect(LDAP_RES)
+        try:
+            self.assertEqual(conn.stats()['bind']['count'], 1)
+            conn.reset_stats()
+            self.assertEqual(conn.stats()['bind']['count'], 0)
+
+            ops = []
+            def broken(op):
+                raise Exception('broken observer')
+            conn.add_observer(ops.append)
+            conn.add_observer(broken)
+
+            groups = conn.search(PosixGroup)
+            self.assertEqual(conn.stats()['search']['count'], 1)
+            self.assertEqual(conn.stats()['search']['entries'], len(groups))
+            self.assertTrue(conn.stats()['search']['size'] > 0)
+            self.assertEqual(ops[-1].name, 'search')
+            self.assertEqual(ops[-1].scope, ldap.SCOPE_SUBTREE)
+            self.assertEqual(ops[-1].filter,
+                conn._search_params(PosixGroup, None, True, None)[2])
+
+            conn.get_attr(groups[0].dn, 'cn')
+            self.assertEqual(conn.stats()['get_attrs']['count'], 1)
+            self.assertEqual(ops[-1].dn, groups[0].dn)
+
+            dn = u'ou=stats,%s' % conn.get_basedn()
+            conn.add_object(dn, {'objectClass': ['organizationalUnit'],
+                'ou': ['stats']})
+            conn.set_attr(dn, 'description', ['stats'])
+            self.assertRaises(exceptions.ValueExists, conn.add_values, dn,
+                'description', ['stats'])
+            conn.delete(dn)
+            self.assertEqual([op.name for op in ops[-4:]],
+                ['add', 'modify', 'modify', 'delete'])
+            self.assertEqual(ops[-1].dn, dn)
+            self.assertEqual(conn.stats()['modify']['count'], 2)
+            self.assertEqual(conn.stats()['modify']['errors'], 1)
+            self.assertTrue(isinstance(ops[-2].error, exceptions.ValueExists))
+
+            histogram = conn.stats()['modify']['histogram']
+            self.assertEqual(sum([count for (bound, count) in histogram]), 2)
+            self.assertEqual(histogram[-1][0], None)
+
+            conn.remove_observer(ops.append)
+            count = len(ops)
+            conn.search(PosixGroup)
+            self.assertEqual(len(ops), count)
+        finally:
+            conn.disconnect()
+
+    def test_track_queries(self):
+        """Test query tracking and implicit lazy load budget
+        """
+        conn = Directory()
+        conn.connect(LDAP_RES)
+        try:
+            with conn.track_queries() as tracker:
+                users = conn.search(QA, basedn=u'ou=users,%s' %
+                    conn.get_basedn(), recursive=False)
+                for user in users:
+                    user.string
+            self.assertEqual(tracker.count, len(users) + 1)
+            self.assertEqual(len(tracker.implicit), len(users))
+            self.assertFalse(tracker.queries[0].implicit)
+            query = tracker.implicit[0]
+            self.assertEqual(query.op.name, 'get_attrs')
+            self.assertEqual(query.op.dn, users[0].dn)
+            self.assertEqual(query.op.attrs, ['cn'])
+            self.assertEqual(query.lazy_load, ('QA', 'cn'))
+            self.assertEqual(query.call_site[0], __file__.replace('.pyc',
+                '.py'))
+            self.assertEqual(query.call_site[2], 'test_track_queries')
+            self.assertTrue(query.stack)
+            self.assertEqual(len(tracker.by_call_site()), 2)
+            self.assertTrue('implicit: QA.cn' in tracker.report())
+
+            # operations made after tracking stopped are not recorded
+            users[0].update(force=True)
+            self.assertEqual(tracker.count, len(users) + 1)
+
+            def lazy_loop(budget):
+                with conn.track_queries(strict=True, budget=budget):
+                    for user in conn.search(QA, basedn=u'ou=users,%s' %
+                        conn.get_basedn(), recursive=False):
+                        user.string
+            lazy_loop(len(users))
+            self.assertRaises(exceptions.QueryBudgetExceeded, lazy_loop,
+                len(users) - 1)
+        finally:
+            conn.disconnect()
+
+    def test_slow_log(self):
+        """Test logging slow searches
+        """
+        class Handler(logging.Handler):
+            def __init__(self):
+                logging.Handler.__init__(self)
+                self.messages = []
+            def emit(self, record):
+                self.messages.append(record.getMessage())
+
+        handler = Handler()
+        logger = logging.getLogger('pumpkin.test.slowlog')
+        logger.addHandler(handler)
+        conn = Directory()
+        conn.connect(LDAP_RES)
+        try:
+            conn.enable_slow_log(threshold=0, logger=logger)
+            groups = conn.search(PosixGroup, search_filter=contains(
+                PosixGroup.name, 'nazwa'))
+            self.assertEqual(len(handler.messages), 1)
+            msg = handler.messages[0]
+            self.assertTrue(msg.startswith('Slow search took'))
+            self.assertTrue("scope=sub" in msg)
+            self.assertTrue("base='%s'" % conn.get_basedn() in msg)
+            self.assertTrue("filter='%s'" % conn._search_params(PosixGroup,
+                None, True, contains(PosixGroup.name, 'nazwa'))[2] in msg)
+            self.assertTrue('entries=%d' % len(groups) in msg)
+
+            conn.get_attr(groups[0].dn, 'gidNumber')
+            self.assertEqual(len(handler.messages), 2)
+            self.assertTrue(handler.messages[1].startswith(
+                'Slow get_attrs took'))
+            self.assertTrue("scope=base" in handler.messages[1])
+            self.assertTrue("attrs=['gidNumber']" in handler.messages[1])
+
+            # writes are not logged by default
+            conn.set_attr(groups[0].dn, 'gidNumber', [str(groups[0].gid)])
+            self.assertEqual(len(handler.messages), 2)
+
+            conn.enable_slow_log(threshold=3600, logger=logger)
+            conn.search(PosixGroup)
+            self.assertEqual(len(handler.messages), 2)
+            conn.disable_slow_log()
+            self.assertEqual(conn._stats._observers, [])
+        finally:
+            logger.removeHandler(handler)
+            conn.disconnect()